@@ -0,0 +1,470 @@
+"""
+Benchmarks the storage backends on the write path and the read path.
+
+Every backend records the same generated runs, one metric at a time, the way a training loop does.
+Afterwards every run is read back and aggregated into the count, minimum, maximum and mean of each
+metric, the way the command line and the dashboard do. The results are written as JSON, so they
+can be stored and compared between commits to find regressions.
+
+    python -m benchmarks --runs 10 --runs 100 --metrics 5 --points 1000 --output results.json
+
+The backends are the storage backends registered in observatory.backends, observatory for the default one
+and observatory-<name> for the others, and the plain formats they were compared with:
+text, json, pickle, sqlite and pytables.
+Backends whose packages aren't installed are reported as skipped.
+"""
+import json
+import os
+import pickle
+import platform
+import shutil
+import sqlite3
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import partial
+from itertools import product
+from time import perf_counter, time
+from uuid import uuid4
+
+import click
+import numpy as np
+
+from observatory.__version__ import __version__
+from observatory.backends import DEFAULT_BACKEND, backend_names, create_sink
+from observatory.serving import ServingClient
+
+MODEL = 'benchmark'
+VERSION = 1
+EXPERIMENT = 'default'
+
+# The percentiles of the latency of a single operation that are reported.
+PERCENTILES = (50, 99)
+
+
+class Backend(ABC):
+    """
+    Stores metrics in a single format.
+
+    A backend receives the metrics one by one, as they are recorded during a run,
+    and has to have them on disk before record_metric returns.
+    """
+
+    def __init__(self, directory):
+        """
+        Initializes the backend
+
+        Parameters
+        ----------
+        directory : str
+            The empty directory to store the data in
+        """
+        self.directory = directory
+
+    def start_run(self, run_id):
+        pass
+
+    @abstractmethod
+    def record_metric(self, run_id, name, value, step, timestamp):
+        pass
+
+    def end_run(self, run_id):
+        pass
+
+    @abstractmethod
+    def aggregate(self, run_id):
+        """
+        Reads the metrics of a run and aggregates them
+
+        Parameters
+        ----------
+        run_id : str
+            The run to read
+
+        Returns
+        -------
+        dict
+            The count, minimum, maximum and mean of every metric, by metric name
+        """
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def summarize(names, values):
+        """
+        Aggregates the values of a run by metric name
+        """
+        names = np.asarray(names)
+        values = np.asarray(values, dtype=np.float64)
+        summary = {}
+
+        for name in np.unique(names):
+            selected = values[names == name]
+            summary[str(name)] = {'count': len(selected), 'min': selected.min(),
+                                  'max': selected.max(), 'mean': selected.mean()}
+
+        return summary
+
+
+class TextBackend(Backend):
+    """
+    Appends a line of comma-separated values per metric to a text file per run
+    """
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, run_id + '.txt')
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        with open(self._path(run_id), 'a') as f:
+            f.write(f'{name},{value!r},{step},{timestamp!r}\n')
+
+    def aggregate(self, run_id):
+        names, values = [], []
+
+        with open(self._path(run_id)) as f:
+            for line in f:
+                name, value, _, _ = line.split(',')
+                names.append(name)
+                values.append(float(value))
+
+        return self.summarize(names, values)
+
+
+class JsonBackend(Backend):
+    """
+    Appends a JSON document per metric to a file per run
+    """
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, run_id + '.json')
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        with open(self._path(run_id), 'a') as f:
+            f.write(json.dumps({'name': name, 'value': value, 'step': step, 'timestamp': timestamp}) + '\n')
+
+    def aggregate(self, run_id):
+        with open(self._path(run_id)) as f:
+            metrics = [json.loads(line) for line in f]
+
+        return self.summarize([metric['name'] for metric in metrics], [metric['value'] for metric in metrics])
+
+
+class PickleBackend(Backend):
+    """
+    Appends a pickle per metric to a file per run, the format the Sink used before the metric files
+    """
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, run_id + '.pkl')
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        with open(self._path(run_id), 'ab') as f:
+            pickle.dump([name, value, step, timestamp], f, protocol=-1)
+
+    def aggregate(self, run_id):
+        metrics = []
+
+        with open(self._path(run_id), 'rb') as f:
+            while True:
+                try:
+                    metrics.append(pickle.load(f))
+                except EOFError:
+                    break
+
+        return self.summarize([metric[0] for metric in metrics], [metric[1] for metric in metrics])
+
+
+class SqliteBackend(Backend):
+    """
+    Inserts a row per metric into a single SQLite database, committing every insert
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory)
+
+        self._connection = sqlite3.connect(os.path.join(directory, 'benchmark.sqlite'))
+        self._connection.execute('CREATE TABLE metric (run TEXT, name TEXT, value REAL, step INTEGER, timestamp REAL)')
+        self._connection.execute('CREATE INDEX metric_run ON metric (run)')
+        self._connection.commit()
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        self._connection.execute('INSERT INTO metric VALUES (?, ?, ?, ?, ?)', (run_id, name, value, step, timestamp))
+        self._connection.commit()
+
+    def aggregate(self, run_id):
+        rows = self._connection.execute(
+            'SELECT name, COUNT(*), MIN(value), MAX(value), AVG(value) FROM metric WHERE run = ? GROUP BY name',
+            (run_id,))
+
+        return {name: {'count': count, 'min': minimum, 'max': maximum, 'mean': mean}
+                for name, count, minimum, maximum, mean in rows}
+
+    def close(self):
+        self._connection.close()
+
+
+class PytablesBackend(Backend):
+    """
+    Appends a row per metric to a single HDF5 table, flushing every row
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory)
+
+        import tables
+
+        description = {
+            'run': tables.StringCol(36, pos=0),
+            'name': tables.StringCol(64, pos=1),
+            'value': tables.Float64Col(pos=2),
+            'step': tables.Int64Col(pos=3),
+            'timestamp': tables.Float64Col(pos=4)
+        }
+
+        self._file = tables.open_file(os.path.join(directory, 'benchmark.h5'), mode='w')
+        self._table = self._file.create_table('/', 'metric', description)
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        row = self._table.row
+        row['run'] = run_id
+        row['name'] = name
+        row['value'] = value
+        row['step'] = step
+        row['timestamp'] = timestamp
+        row.append()
+        self._table.flush()
+
+    def aggregate(self, run_id):
+        rows = self._table.read_where('run == selected', condvars={'selected': run_id.encode('utf-8')})
+
+        return self.summarize(rows['name'].astype(str), rows['value'])
+
+    def close(self):
+        self._file.close()
+
+
+class ObservatoryBackend(Backend):
+    """
+    Records metrics through the sink of an observatory backend and reads them through the ServingClient,
+    like the tracking server does
+    """
+
+    def __init__(self, directory, backend=DEFAULT_BACKEND):
+        super().__init__(directory)
+
+        self._sink = create_sink(backend, directory)
+        self._serving = ServingClient(directory)
+
+    def start_run(self, run_id):
+        self._sink.record_session_start(MODEL, VERSION, EXPERIMENT, run_id)
+
+    def record_metric(self, run_id, name, value, step, timestamp):
+        self._sink.record_metric(MODEL, VERSION, EXPERIMENT, run_id, name, value, step, timestamp)
+
+    def end_run(self, run_id):
+        self._sink.record_session_end(MODEL, VERSION, EXPERIMENT, run_id, 'COMPLETED')
+
+    def aggregate(self, run_id):
+        metrics = self._serving.get_summary(run_id[:8])['metrics']
+
+        return {name: {'count': metric['count'], 'min': metric['min'], 'max': metric['max'], 'mean': metric['mean']}
+                for name, metric in metrics.items()}
+
+    def close(self):
+        self._sink.close()
+
+
+# Every registered observatory backend is benchmarked, the default one is simply called observatory.
+BACKENDS = {('observatory' if name == DEFAULT_BACKEND else 'observatory-' + name):
+            partial(ObservatoryBackend, backend=name) for name in backend_names()}
+BACKENDS.update({
+    'text': TextBackend,
+    'json': JsonBackend,
+    'pickle': PickleBackend,
+    'sqlite': SqliteBackend,
+    'pytables': PytablesBackend
+})
+
+
+def latency_statistics(latencies, operations):
+    """
+    Summarizes the latencies of the operations of a path
+
+    Parameters
+    ----------
+    latencies : list
+        The duration of every operation in seconds
+    operations : int
+        The number of metric values handled by the operations
+
+    Returns
+    -------
+    dict
+        The total duration, the throughput in values per second and the latency percentiles in milliseconds
+    """
+    seconds = float(np.sum(latencies))
+    statistics = {
+        'operations': len(latencies),
+        'values': operations,
+        'seconds': seconds,
+        'throughput': operations / seconds if seconds > 0 else None
+    }
+
+    for percentile in PERCENTILES:
+        statistics[f'p{percentile}_ms'] = float(np.percentile(latencies, percentile)) * 1000
+
+    return statistics
+
+
+def disk_usage(directory):
+    """
+    Gets the number of bytes stored in a directory and its subdirectories
+    """
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, _, filenames in os.walk(directory) for filename in filenames)
+
+
+def run_benchmark(backend, directory, runs, metrics, points):
+    """
+    Benchmarks a backend on the write path and the read path
+
+    Parameters
+    ----------
+    backend : str
+        The name of the backend in BACKENDS
+    directory : str
+        The empty directory to store the data in
+    runs : int
+        The number of runs to record
+    metrics : int
+        The number of metrics per run
+    points : int
+        The number of values per metric
+
+    Returns
+    -------
+    dict
+        The statistics of the write path and the read path and the disk footprint in bytes
+    """
+    try:
+        store = BACKENDS[backend](directory)
+    except ImportError as e:
+        return {'backend': backend, 'skipped': str(e)}
+
+    run_ids = [str(uuid4()) for _ in range(runs)]
+    names = [f'metric-{index}' for index in range(metrics)]
+    values = np.random.default_rng(0).random((points, metrics)).tolist()
+    write_latencies = []
+    read_latencies = []
+
+    try:
+        for run_id in run_ids:
+            store.start_run(run_id)
+
+            for step, row in enumerate(values):
+                for name, value in zip(names, row):
+                    started = perf_counter()
+                    store.record_metric(run_id, name, value, step, time())
+                    write_latencies.append(perf_counter() - started)
+
+            store.end_run(run_id)
+
+        for run_id in run_ids:
+            started = perf_counter()
+            summary = store.aggregate(run_id)
+            read_latencies.append(perf_counter() - started)
+
+            if len(summary) != metrics or any(metric['count'] != points for metric in summary.values()):
+                raise AssertionError(f'The {backend} backend did not read back the metrics it wrote.')
+    finally:
+        store.close()
+
+    return {
+        'backend': backend,
+        'write': latency_statistics(write_latencies, runs * metrics * points),
+        'read': latency_statistics(read_latencies, runs * metrics * points),
+        'disk_bytes': disk_usage(directory)
+    }
+
+
+def run_benchmarks(backends, runs, metrics, points, directory=None):
+    """
+    Benchmarks every backend for every combination of run count, metrics per run and points per metric
+
+    Parameters
+    ----------
+    backends : list
+        The names of the backends to benchmark
+    runs : list
+        The numbers of runs to record
+    metrics : list
+        The numbers of metrics per run
+    points : list
+        The numbers of values per metric
+    directory : str, optional
+        The directory to store the data in, by default a temporary directory that is removed afterwards
+
+    Returns
+    -------
+    dict
+        The environment of the benchmark and a result per backend and combination
+    """
+    results = []
+    root = tempfile.mkdtemp(prefix='observatory-benchmark-', dir=directory)
+
+    try:
+        for run_count, metric_count, point_count in product(runs, metrics, points):
+            for backend in backends:
+                backend_directory = os.path.join(root, f'{backend}-{run_count}-{metric_count}-{point_count}')
+                os.makedirs(backend_directory)
+
+                result = run_benchmark(backend, backend_directory, run_count, metric_count, point_count)
+                result.update(runs=run_count, metrics=metric_count, points=point_count)
+                results.append(result)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        'environment': {
+            'observatory': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.now().isoformat()
+        },
+        'results': results
+    }
+
+
+@click.command(help='Benchmarks the storage backends on the write path and the read path')
+@click.option('--backend', 'backends', multiple=True, type=click.Choice(list(BACKENDS)),
+              help='A backend to benchmark, repeat the option for several backends (default: all)')
+@click.option('--runs', multiple=True, type=click.IntRange(1), help='The number of runs, repeat to vary (default: 10)')
+@click.option('--metrics', multiple=True, type=click.IntRange(1),
+              help='The number of metrics per run, repeat to vary (default: 5)')
+@click.option('--points', multiple=True, type=click.IntRange(1),
+              help='The number of values per metric, repeat to vary (default: 100)')
+@click.option('--directory', default=None, type=click.Path(exists=True, file_okay=False),
+              help='The directory to store the benchmark data in, the disk it is on is what gets measured')
+@click.option('--output', default='-', type=click.File('w'), help='The file to write the JSON results to')
+def main(backends, runs, metrics, points, directory, output):
+    results = run_benchmarks(list(backends or BACKENDS), list(runs or (10,)), list(metrics or (5,)),
+                             list(points or (100,)), directory)
+
+    json.dump(results, output, indent=2)
+    output.write('\n')
+
+    for result in results['results']:
+        label = f'{result["backend"]} runs={result["runs"]} metrics={result["metrics"]} points={result["points"]}'
+
+        if 'skipped' in result:
+            click.echo(f'{label}: skipped, {result["skipped"]}', err=True)
+        else:
+            click.echo(f'{label}: write {result["write"]["throughput"]:.0f}/s '
+                       f'p99 {result["write"]["p99_ms"]:.3f}ms, read {result["read"]["throughput"]:.0f}/s '
+                       f'p99 {result["read"]["p99_ms"]:.3f}ms, {result["disk_bytes"]} bytes', err=True)
+
+
+if __name__ == '__main__':
+    main()
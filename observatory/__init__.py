@@ -1,4 +1,4 @@
-from observatory.tracking import start_run
+from observatory.tracking import download_output, start_async_run, start_run
 from observatory.settings import configure
 
 
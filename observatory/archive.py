@@ -6,6 +6,14 @@ import json
 import tempfile
 import tarfile
 import pickle
+from datetime import datetime
+
+from observatory import backends
+from observatory.index import RunIndex
+from observatory.outputstore import OutputStore
+
+# The extensions of the files that hold the sessions of a run, the backends remove the metrics.
+RUN_EXTENSIONS = ('.pkl',)
 
 
 class Archive:
@@ -29,43 +37,117 @@ class Archive:
         # this module depends on the .observatory directory.
         # So we need to make sure it exists.
         home = expanduser("~")
-        if os.path.exists(home + "\\.observatory"):
+        if os.path.exists(path.join(home, ".observatory")):
             # if it exists the path will be set
-            self._path = (home + "\\.observatory\\metrics")
+            self._path = path.join(home, ".observatory", "metrics")
             return self._path
-        elif os.path.exists("\\.observatory"):
-            self._path = ("\\.observatory\\")
+        elif os.path.exists(".observatory"):
+            self._path = path.join(".observatory", "metrics")
             return self._path
         else:
             print("no home directory found")
 
+    @staticmethod
+    def read_records(file_path):
+        """
+        Reads all pickled records from a file
+
+        Arguments:
+            file_path {str} -- The file to read
+
+        Returns:
+            list -- The records in the file, or an empty list when the file doesn't exist
+        """
+        records = []
+        if not os.path.exists(file_path):
+            return records
+        with open(file_path, 'rb') as f:
+            while True:
+                try:
+                    records.append(pickle.load(f))
+                except EOFError:
+                    break
+        return records
+
+    @staticmethod
+    def find_runs(path, run_id=None, model=None, version=None, experiment=None):
+        """
+        Finds runs in the index of the metrics directory
+
+        Only exact matches are returned.
+
+        Arguments:
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            list -- The full run ids and the location of their files, without extension
+        """
+        index = RunIndex(path)
+        return [(full_id, os.path.join(path, file_name))
+                for full_id, file_name in index.find_files(run_id, model, version, experiment)]
+
     @staticmethod
     def get_run(run_id, path):
+        """
+        Gets the recorded data of a run
+
+        The start of the session comes first, followed by the metrics
+        and the end of the session.
+
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            list -- The session start, the [name, value] pairs of the metrics and the session end
+        """
+        records = []
         metrics = []
-        for file in os.listdir(path):
-            if '_' + run_id + '-' in file:
-                with open(path + '\\' + file, 'rb') as f:
-                    while True:
-                        try:
-                            metrics.append(pickle.load(f))
-                        except EOFError:
-                            break
-        return metrics
+        for full_id, base_path in Archive.find_runs(path, run_id=run_id):
+            records.extend(Archive.read_records(base_path + '.pkl'))
+            reader = backends.open_metrics(full_id, base_path, path)
+            if reader is not None:
+                metrics.extend([reader.names[metric_id], float(value)]
+                               for metric_id, _, _, value in reader.select())
+
+        # Older runs have their metrics pickled between the start and the end of the session.
+        if len(records) > 1 and isinstance(records[-1][-1], datetime):
+            return records[:-1] + metrics + records[-1:]
+        return records + metrics
+
+    @staticmethod
+    def open_run(run_id, path):
+        """
+        Opens the recorded data of a run for reading
+
+        The metrics aren't read into memory, they are returned as a reader
+        of the backend that recorded the run, see the backends module.
+
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            tuple -- The pickled session records and a reader with the interface of the MetricFileReader,
+                     the reader is None for runs recorded by older versions.
+        """
+        records = []
+        reader = None
+        for full_id, base_path in Archive.find_runs(path, run_id=run_id):
+            records.extend(Archive.read_records(base_path + '.pkl'))
+            reader = backends.open_metrics(full_id, base_path, path) or reader
+        return records, reader
 
     @staticmethod
     def get_all_models(self, path):
-        models = []
-        for file in os.listdir(path):
-                models.append(file)
-        just_models = self.structure_data(models, 0)
-        return list(set(just_models))
+        return RunIndex(path).models()
 
     @staticmethod
     def get_model(self, model, path):
         """
         Gets the requested model
 
-        Does not have to be perfecht match
+        The model name has to be an exact match
 
         Arguments:
             model {str} -- model name
@@ -74,13 +156,7 @@ class Archive:
         Returns:
             list -- list of all found versions for the input model,
         """
-
-        models = []
-        for file in os.listdir(path):
-            if model + '_' in file:
-                models.append(file)
-        just_models = self.structure_data(models, 1)
-        return list(set(just_models))
+        return RunIndex(path).versions(model)
 
     @staticmethod
     def get_version(self, model, version, path):
@@ -97,13 +173,7 @@ class Archive:
         Returns:
             list -- list of all found experiments
         """
-        versions = []
-        for file in os.listdir(path):
-            if model in file:
-                if '_v' + version + '_' in file:
-                    versions.append(file)
-        just_versions = self.structure_data(versions, 2)
-        return list(set(just_versions))
+        return RunIndex(path).experiments(model, version)
 
     @staticmethod
     def get_experiment(self, model, version, experiment, path):
@@ -118,45 +188,47 @@ class Archive:
         Returns:
             list -- list of all found runs
         """
-        experiments = []
-        for file in os.listdir(path):
-            if model + '_' in file:
-                if '_v' + version + '_' in file:
-                    if '_' + experiment + '_' in file:
-                        experiments.append(file)
-        just_experiments = self.structure_data(experiments, 3)
-        return list(set(just_experiments))
+        return RunIndex(path).runs(model, version, experiment)
+
+    @staticmethod
+    def remove_runs(runs, path):
+        """
+        Removes runs from the metrics directory and the index
+
+        A run is stored in several files, so all of them have to be removed at once.
+
+        Arguments:
+            runs {list} -- The run ids and file locations, as returned by find_runs
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            Boolean -- True when runs were removed, None when nothing was found
+        """
+        for _, base_path in runs:
+            for extension in RUN_EXTENSIONS:
+                if os.path.exists(base_path + extension):
+                    os.remove(base_path + extension)
+        backends.delete_metrics(runs, path)
+        Archive.output_store(path).remove([os.path.basename(base_path) for _, base_path in runs])
+        RunIndex(path).remove([run_id for run_id, _ in runs])
+        if len(runs) > 0:
+            return True
 
     @staticmethod
     def delete_run(self, run_id, path):
-        for file in os.listdir(path):
-            if '_' + run_id + '-' in file:
-                os.remove(path + '\\' + file)
-                return True
+        return Archive.remove_runs(Archive.find_runs(path, run_id=run_id), path)
 
     @staticmethod
     def delete_experiment(model, version, experiment, path):
-        for file in os.listdir(path):
-            if model + '_' in file:
-                if '_v' + version + '_' in file:
-                    if '_' + experiment + '_' in file:
-                        os.remove(path + '\\' + file)
-                        return True
+        return Archive.remove_runs(Archive.find_runs(path, model=model, version=version, experiment=experiment), path)
 
     @staticmethod
     def delete_version(model, version, path):
-        for file in os.listdir(path):
-            if model in file:
-                if '_v' + version + '_' in file:
-                    os.remove(path + '\\' + file)
-                    return True
+        return Archive.remove_runs(Archive.find_runs(path, model=model, version=version), path)
 
     @staticmethod
     def delete_model(model, path):
-        for file in os.listdir(path):
-            if model + '_' in file:
-                os.remove(path + '\\' + file)
-                return True
+        return Archive.remove_runs(Archive.find_runs(path, model=model), path)
 
     @staticmethod
     def get_settings(run_id):
@@ -190,34 +262,47 @@ class Archive:
                 return True
            
     @staticmethod
-    def get_output(run_id):
-        home = expanduser('~')
-        if os.path.exists(home + "\\.observatory"):
-            path = home + "\\.observatory\\outputs\\"
-        else:
-            return
+    def get_output(run_id, path):
+        """
+        Gets the outputs recorded by a run
 
-        output = []
-        for file in os.listdir(path):
-            if '_' + run_id + '-' in file:
-                with open(path + '\\' + file, 'rb') as f:
-                    while True:
-                        try:
-                            output.append(pickle.load(f))
-                        except EOFError:
-                            break
-        return output 
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            dict -- The hash, size and stored location of every output, by file name
+        """
+        store = Archive.output_store(path)
+        outputs = {}
+        for _, base_path in Archive.find_runs(path, run_id=run_id):
+            for filename, output in store.manifest(os.path.basename(base_path)).items():
+                outputs[filename] = dict(output, path=store.object_path(output['hash']))
+        return outputs
 
     @staticmethod
-    def delete_output(run_id):
-        home = expanduser('~')
-        if os.path.exists(home + "\\.observatory"):
-            path = home + "\\.observatory\\outputs\\"
-        else:
-            return False
+    def delete_output(run_id, path):
+        """
+        Deletes the outputs recorded by a run
 
-        for file in os.listdir(path):
-            if '_' + run_id + '-' in file:
-                os.remove(path + file)
-                return True
-        
+        Files that are recorded by other runs as well are kept for those runs.
+
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+            path {str} -- Path to the metrics directory
+
+        Returns:
+            Boolean -- True when outputs were removed
+        """
+        runs = Archive.find_runs(path, run_id=run_id)
+        return Archive.output_store(path).remove([os.path.basename(base_path) for _, base_path in runs])
+
+    @staticmethod
+    def output_store(path):
+        """
+        Opens the output store that belongs to a metrics directory
+
+        Arguments:
+            path {str} -- Path to the metrics directory
+        """
+        return OutputStore(os.path.join(os.path.dirname(os.path.normpath(path)), 'outputs'))
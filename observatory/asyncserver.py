@@ -0,0 +1,489 @@
+"""
+An asyncio implementation of the tracking server.
+
+The application exposes the same routes as observatory.server, so the same clients can talk to it.
+Requests are handled on an event loop, which lets a single process keep thousands of
+connections from concurrently reporting runs open. The sink writes to disk, which blocks,
+so every disk operation is handed to a thread pool and the event loop never waits for the disk.
+
+This module requires aiohttp, which is an optional dependency: pip install observatory[async]
+"""
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiohttp import web
+
+from observatory import settings
+from observatory.backends import create_sink
+from observatory.buffering import MetricBuffer
+from observatory.encoding import (COMPRESSIONS, GZIP, MAX_DECODED_SIZE, PACKED_CONTENT_TYPE, check_run,
+                                  decode_packed)
+from observatory.outputstore import (HASH_CHUNK_SIZE, etag, etag_matches, parse_content_range, parse_range,
+                                      read_file)
+from observatory.serving import ServingClient
+from observatory.spool import IDEMPOTENCY_HEADER, RecentKeys
+
+try:
+    from aiohttp.compression_utils import HAS_ZSTD
+except ImportError:
+    HAS_ZSTD = False
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8
+
+# Streamed metrics are written to disk in batches of this size,
+# or when the oldest unwritten metric is older than the interval in seconds.
+STREAM_BATCH_SIZE = 100
+STREAM_FLUSH_INTERVAL = 1.0
+
+
+def failure(context, status, **fields):
+    return web.json_response(dict({'status': 'failure', 'context': context}, **fields), status=status)
+
+
+def success(status, **fields):
+    return web.json_response(dict({'status': 'success'}, **fields), status=status)
+
+
+def metric_record(metric):
+    """
+    Converts the JSON representation of a metric into a [name, value, step, timestamp] list
+    """
+    return [metric['name'], metric['value'], metric.get('step'), metric.get('timestamp')]
+
+
+class AsyncTrackingServer:
+    """
+    The request handlers of the asyncio tracking server
+
+    Arguments:
+        sink {Sink} -- The sink to record the data with
+        serving {ServingClient} -- The client to read recorded data with
+        threads {int} -- The number of threads that write to disk
+    """
+
+    def __init__(self, sink, serving, threads=DEFAULT_THREADS):
+        self.sink = sink
+        self.serving = serving
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='observatory-disk')
+
+    async def _run(self, function, *args):
+        """
+        Runs a blocking function on the disk threads
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args))
+
+    async def _json(self, request):
+        try:
+            return await request.json()
+        except ValueError:
+            return None
+
+    async def start(self, request):
+        body = await self._json(request) or {}
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), body.get('run'))
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            await self._run(self.sink.record_session_start,
+                            body.get('model'), body.get('version'), body.get('experiment'), body.get('run'))
+        except Exception:
+            return failure('Run was not started', 500)
+        return success(201)
+
+    async def end(self, request):
+        body = await self._json(request) or {}
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), body.get('run'))
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            await self._run(self.sink.record_session_end, body.get('model'), body.get('version'),
+                            body.get('experiment'), body.get('run'), body.get('status'))
+        except Exception:
+            return failure('Run was not Ended', 500)
+        return success(201)
+
+    async def metric(self, request):
+        body = await self._json(request)
+
+        if body is None:
+            return failure('No metric found', 400)
+
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), request.match_info['run'])
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            await self._run(self.sink.record_metric, body.get('model'), body.get('version'), body.get('experiment'),
+                            request.match_info['run'], body.get('name'), body.get('value'),
+                            body.get('step'), body.get('timestamp'))
+        except Exception:
+            return failure('Metric could not be recorded', 500)
+        return success(201)
+
+    async def metric_batch(self, request):
+        if request.content_type == PACKED_CONTENT_TYPE:
+            return await self.metric_packed(request)
+
+        body = await self._json(request)
+
+        if body is None or not isinstance(body.get('metrics'), list):
+            return failure('No list of metrics found', 400)
+
+        runs = {}
+        try:
+            for metric in body['metrics']:
+                key = (metric['model'], metric['version'], metric['experiment'], metric['run'])
+                runs.setdefault(key, []).append(metric_record(metric))
+        except (KeyError, TypeError):
+            return failure('Metrics are incomplete', 400)
+
+        try:
+            for run in runs:
+                check_run(*run)
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            for (model, version, experiment, run), metrics in runs.items():
+                await self._run(self.sink.record_metrics, model, version, experiment, run, metrics)
+        except Exception:
+            return failure('Metrics could not be recorded', 500)
+        return success(201, recorded=len(body['metrics']))
+
+    async def metric_packed(self, request):
+        try:
+            model, version, experiment, run, metrics = decode_packed(await request.read())
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            await self._run(self.sink.record_metrics, model, version, experiment, run, metrics)
+        except Exception:
+            return failure('Metrics could not be recorded', 500)
+        return success(201, recorded=len(metrics))
+
+    async def metric_stream(self, request):
+        model = request.query.get('model')
+        version = request.query.get('version')
+        experiment = request.query.get('experiment')
+        run = request.match_info['run']
+
+        try:
+            check_run(model, version, experiment, run)
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        buffer = MetricBuffer(STREAM_BATCH_SIZE, STREAM_FLUSH_INTERVAL)
+        recorded = 0
+
+        async def flush():
+            nonlocal recorded
+            recorded += len(buffer)
+            await self._run(self.sink.record_metrics, model, version, experiment, run, buffer.drain())
+
+        try:
+            async for line in request.content:
+                if not line.strip():
+                    continue
+
+                if buffer.append(metric_record(json.loads(line))):
+                    await flush()
+
+            await flush()
+        except (ValueError, KeyError, TypeError):
+            # Keep everything that was valid up to the broken line.
+            await flush()
+            return failure('Invalid metric after ' + str(recorded) + ' metrics', 400)
+        except Exception:
+            return failure('Metrics could not be recorded', 500)
+        return success(201, recorded=recorded)
+
+    async def settings(self, request):
+        body = await self._json(request) or {}
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), request.match_info['run'])
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            await self._run(self.sink.record_settings, body.get('model'), body.get('version'),
+                            body.get('experiment'), request.match_info['run'], body.get('settings'))
+        except Exception:
+            return failure('Settings could not be recorded', 500)
+        return success(201)
+
+    async def models(self, request):
+        try:
+            data = await self._run(self.serving.get_model, request.match_info['model'])
+        except Exception:
+            return failure('Could not find model', 500)
+        return success(201, data=data)
+
+    async def versions(self, request):
+        try:
+            data = await self._run(self.serving.get_version, request.query.get('model'), request.match_info['id'])
+        except Exception:
+            return failure('Could not find version', 500)
+        return success(201, data=data)
+
+    async def experiments(self, request):
+        try:
+            data = await self._run(self.serving.get_experiment, request.query.get('model'),
+                                   request.query.get('version'), request.match_info['name'])
+        except Exception:
+            return failure('Could not find experiment', 500)
+        return success(201, data=data)
+
+    async def run(self, request):
+        ranges = {}
+        try:
+            for name, convert in (('start_step', int), ('end_step', int), ('start_time', float), ('end_time', float)):
+                if name in request.query:
+                    ranges[name] = convert(request.query[name])
+
+            data = await self._run(partial(self.serving.get_run, request.match_info['run'], **ranges))
+            for metric in data['metrics'].values():
+                for field in ('values', 'steps', 'timestamps'):
+                    metric[field] = metric[field].tolist()
+        except Exception:
+            return failure('Run was not found', 500)
+        return success(201, data=data)
+
+    async def begin_upload(self, request):
+        body = await self._json(request)
+
+        if body is None or not body.get('filename'):
+            return failure('No file name found', 400)
+
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), request.match_info['run'])
+        except AssertionError as e:
+            return failure(str(e), 400)
+
+        try:
+            upload_id = await self._run(self.sink.begin_output_upload, body.get('model'), body.get('version'),
+                                        body.get('experiment'), request.match_info['run'],
+                                        body['filename'], body.get('size'))
+        except Exception:
+            return failure('Upload could not be started', 500)
+        return success(201, upload=upload_id, offset=0)
+
+    async def upload_offset(self, request):
+        try:
+            offset = await self._run(self.sink.output_upload_offset, request.match_info['upload_id'])
+        except AssertionError:
+            return failure('Upload was not found', 404)
+        return success(200, offset=offset)
+
+    async def upload_chunk(self, request):
+        upload_id = request.match_info['upload_id']
+        offset = parse_content_range(request.headers.get('Content-Range'))
+
+        if offset is None:
+            return failure('No valid Content-Range header found', 400)
+
+        try:
+            current = await self._run(self.sink.output_upload_offset, upload_id)
+        except AssertionError:
+            return failure('Upload was not found', 404)
+
+        if offset != current:
+            return failure('Chunk does not continue the upload', 409, offset=current)
+
+        # The chunk is written piece by piece as it arrives, so it is never held in memory as a whole.
+        try:
+            async for piece in request.content.iter_chunked(HASH_CHUNK_SIZE):
+                offset = await self._run(self.sink.write_output_chunk, upload_id, offset, io.BytesIO(piece))
+        except Exception:
+            return failure('Chunk could not be written', 500,
+                           offset=await self._run(self.sink.output_upload_offset, upload_id))
+        return success(200, offset=offset)
+
+    async def finish_upload(self, request):
+        body = await self._json(request)
+
+        if body is None or not body.get('checksum'):
+            return failure('No checksum found', 400)
+
+        try:
+            digest = await self._run(self.sink.finish_output_upload, request.match_info['upload_id'],
+                                     body['checksum'])
+        except (AssertionError, FileNotFoundError):
+            return failure('Upload was not found', 404)
+        except RuntimeError:
+            return failure('Checksum does not match, the upload was discarded', 422)
+        return success(201, hash=digest)
+
+    async def abort_upload(self, request):
+        try:
+            await self._run(self.sink.abort_output_upload, request.match_info['upload_id'])
+        except AssertionError:
+            return failure('Upload was not found', 404)
+        return success(200)
+
+    async def output(self, request):
+        try:
+            outputs = await self._run(self.serving.get_output, request.match_info['run'])
+        except AssertionError:
+            return failure('Invalid run ID', 400)
+
+        filename = request.query.get('filename')
+        if filename is None and len(outputs) == 1:
+            filename = next(iter(outputs))
+
+        if filename not in outputs:
+            return failure('Output was not found', 404, outputs=sorted(outputs))
+
+        output = outputs[filename]
+        headers = {
+            'ETag': etag(output['hash']),
+            'Accept-Ranges': 'bytes',
+            'Content-Type': 'application/octet-stream'
+        }
+
+        if etag_matches(request.headers.get('If-None-Match'), output['hash']):
+            return web.Response(status=304, headers=headers)
+
+        first, last, status = 0, output['size'] - 1, 200
+        # A range is only sent when the client's copy is still the same file, If-Range uses the strong comparison.
+        if request.headers.get('If-Range', etag(output['hash'])).strip() == etag(output['hash']):
+            try:
+                byte_range = parse_range(request.headers.get('Range'), output['size'])
+            except AssertionError:
+                headers['Content-Range'] = f'bytes */{output["size"]}'
+                return web.Response(status=416, headers=headers)
+
+            if byte_range is not None:
+                first, last = byte_range
+                status = 206
+                headers['Content-Range'] = f'bytes {first}-{last}/{output["size"]}'
+
+        headers['Content-Length'] = str(last - first + 1)
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+
+        chunks = read_file(output['path'], first, last)
+        while True:
+            chunk = await self._run(next, chunks, None)
+            if chunk is None:
+                break
+            await response.write(chunk)
+
+        await response.write_eof()
+        return response
+
+    async def close(self, app):
+        """
+        Writes the summaries of the runs that are still open and stops the disk threads
+        """
+        await self._run(self.sink.close)
+        self._executor.shutdown(wait=True)
+
+
+def deduplicate(recent_keys):
+    """
+    Creates a middleware that records a request only once when a client sends it again with the same
+    deduplication key, as clients that spool requests do when the response of a request got lost
+
+    Arguments:
+        recent_keys {RecentKeys} -- The keys of the requests that were recorded
+
+    Returns:
+        callable -- The middleware
+    """
+    @web.middleware
+    async def middleware(request, handler):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        if key is None:
+            return await handler(request)
+
+        # The key is reserved before the request is handled, so a copy that arrives in the meantime is skipped.
+        if not recent_keys.reserve(key):
+            return success(201, duplicate=True)
+
+        try:
+            response = await handler(request)
+        except BaseException:
+            recent_keys.release(key)
+            raise
+
+        if response.status != 201:
+            recent_keys.release(key)
+
+        return response
+
+    return middleware
+
+
+async def advertise_compressions(request, response):
+    """
+    Lists the content codings the server can decode, clients only compress their requests after seeing them.
+    aiohttp decodes the request bodies itself, zstd only when one of the zstd packages it supports is installed.
+    """
+    response.headers['Accept-Encoding'] = ', '.join(COMPRESSIONS if HAS_ZSTD else (GZIP,))
+
+
+def create_app(sink=None, serving=None, threads=DEFAULT_THREADS):
+    """
+    Creates the asyncio tracking server application
+
+    Keyword Arguments:
+        sink {Sink} -- The sink to record the data with
+                       (default: {a sink of the backend in the settings in the .observatory directory})
+        serving {ServingClient} -- The client to read recorded data with (default: {a new ServingClient})
+        threads {int} -- The number of threads that write to disk (default: {DEFAULT_THREADS})
+
+    Returns:
+        aiohttp.web.Application -- The application, run it with aiohttp.web.run_app
+    """
+    server = AsyncTrackingServer(sink or create_sink(settings.backend), serving or ServingClient(), threads)
+
+    app = web.Application(middlewares=[deduplicate(RecentKeys())], client_max_size=MAX_DECODED_SIZE)
+    app.on_response_prepare.append(advertise_compressions)
+    app.add_routes([
+        web.post('/api/start/', server.start),
+        web.post('/api/end/', server.end),
+        web.post('/api/metrics/', server.metric_batch),
+        web.post('/api/metrics/{run}', server.metric),
+        web.post('/api/metrics/{run}/stream', server.metric_stream),
+        web.post('/api/settings/{run}', server.settings),
+        web.get('/api/models/{model}', server.models),
+        web.get('/api/versions/{id}', server.versions),
+        web.get('/api/experiments/{name}', server.experiments),
+        web.get('/api/run/{run}', server.run),
+        web.get('/api/output/{run}', server.output),
+        web.post('/api/output/{run}/uploads', server.begin_upload),
+        web.get('/api/uploads/{upload_id}', server.upload_offset),
+        web.put('/api/uploads/{upload_id}', server.upload_chunk),
+        web.post('/api/uploads/{upload_id}', server.finish_upload),
+        web.delete('/api/uploads/{upload_id}', server.abort_upload),
+    ])
+    app.on_cleanup.append(server.close)
+
+    return app
+
+
+def run(host=DEFAULT_HOST, port=DEFAULT_PORT, threads=DEFAULT_THREADS):
+    """
+    Runs the asyncio tracking server until it receives SIGINT or SIGTERM
+
+    On shutdown, the server finishes the requests that are being handled
+    and writes the summaries of the runs that are still open.
+
+    Keyword Arguments:
+        host {str} -- The address to listen on (default: {DEFAULT_HOST})
+        port {int} -- The port to listen on (default: {DEFAULT_PORT})
+        threads {int} -- The number of threads that write to disk (default: {DEFAULT_THREADS})
+    """
+    web.run_app(create_app(threads=threads), host=host, port=port)
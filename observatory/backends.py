@@ -0,0 +1,195 @@
+"""
+The registry of storage backends.
+
+A backend has a write half and a read half. The write half is the sink that records runs,
+the read half opens the metrics of a recorded run and deletes them again. The backend that records
+new runs is selected with settings.configure(backend=...). Runs are always read through every backend,
+so runs recorded before switching backends stay readable.
+
+The built-in backends are:
+
+- files: the metric files of the Sink, see the metricfile module
+- sqlite: a single SQLite database for all runs, see the metricdb module
+- pytables: a compressed HDF5 file per run, see the metrictable module. This backend requires PyTables.
+
+Other backends can be added with register_backend, before they are selected in the settings.
+"""
+import os
+from collections import OrderedDict
+
+from observatory.metricdb import MetricDatabaseReader, delete_runs
+from observatory.metricfile import DATA_EXTENSION, NAMES_EXTENSION, SUMMARY_EXTENSION, MetricFileReader
+from observatory.metrictable import TABLE_EXTENSION, TABLE_LOCK_EXTENSION, MetricTableReader
+from observatory.sink import PytablesSink, Sink, SqliteSink
+
+DEFAULT_BACKEND = 'files'
+
+
+class Backend:
+    """
+    A way of storing the metrics of runs, the sink that writes them and the functions that read and delete them
+    """
+
+    def __init__(self, name, sink, open_metrics, delete_metrics):
+        """
+        Initializes the backend
+
+        Parameters
+        ----------
+        name : str
+            The name the backend is selected by
+        sink : type
+            The class of the sink that records runs, it is created with the base path of the data
+        open_metrics : callable
+            The function that opens the metrics of a run for reading. It receives the full run id,
+            the location of the run files without extension and the metrics directory, and returns a reader
+            with the interface of the MetricFileReader, or None when the backend holds no metrics for the run.
+        delete_metrics : callable
+            The function that deletes the metrics of runs. It receives the (run id, location of the run files)
+            pairs of the runs and the metrics directory.
+        """
+        self.name = name
+        self.sink = sink
+        self.open_metrics = open_metrics
+        self.delete_metrics = delete_metrics
+
+
+_backends = OrderedDict()
+
+
+def register_backend(backend):
+    """
+    Adds a backend to the registry, replacing a registered backend with the same name
+
+    Parameters
+    ----------
+    backend : Backend
+        The backend to add
+    """
+    _backends[backend.name] = backend
+
+
+def backend_names():
+    """
+    Gets the names of the registered backends
+
+    Returns
+    -------
+    list
+        The names, in the order the backends were registered
+    """
+    return list(_backends)
+
+
+def get_backend(name):
+    """
+    Gets a registered backend
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend
+
+    Returns
+    -------
+    Backend
+        The backend
+
+    Raises
+    ------
+    AssertionError
+        When there is no backend with the name
+    """
+    if name not in _backends:
+        raise AssertionError(f'Unknown storage backend {name}, choose one of: ' + ', '.join(_backends))
+
+    return _backends[name]
+
+
+def create_sink(name, base_path=None):
+    """
+    Creates the sink of a backend
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend, usually settings.backend
+    base_path : str, optional
+        The directory to store the data in, defaults to the .observatory directory
+        in the home directory of the current user.
+
+    Returns
+    -------
+    Sink
+        The sink
+    """
+    return get_backend(name).sink(base_path)
+
+
+def open_metrics(run_id, base_path, metrics_path):
+    """
+    Opens the metrics of a run for reading, from the first backend that holds them
+
+    Parameters
+    ----------
+    run_id : str
+        The full ID of the run
+    base_path : str
+        The location of the run files, without extension
+    metrics_path : str
+        The metrics directory
+
+    Returns
+    -------
+    object
+        A reader with the interface of the MetricFileReader, or None when no backend holds metrics for the run
+    """
+    for backend in _backends.values():
+        reader = backend.open_metrics(run_id, base_path, metrics_path)
+
+        if reader is not None:
+            return reader
+
+    return None
+
+
+def delete_metrics(runs, metrics_path):
+    """
+    Deletes the metrics of runs from every backend
+
+    Parameters
+    ----------
+    runs : list
+        The run ids and file locations, as returned by Archive.find_runs
+    metrics_path : str
+        The metrics directory
+    """
+    for backend in _backends.values():
+        backend.delete_metrics(runs, metrics_path)
+
+
+def _remove_files(runs, extensions):
+    for _, base_path in runs:
+        for extension in extensions:
+            if os.path.exists(base_path + extension):
+                os.remove(base_path + extension)
+
+
+def _open_metric_file(run_id, base_path, metrics_path):
+    return MetricFileReader(base_path) if os.path.exists(base_path + DATA_EXTENSION) else None
+
+
+def _open_metric_database(run_id, base_path, metrics_path):
+    return MetricDatabaseReader(metrics_path, run_id) if MetricDatabaseReader.exists(metrics_path, run_id) else None
+
+
+def _open_metric_table(run_id, base_path, metrics_path):
+    return MetricTableReader(base_path) if os.path.exists(base_path + TABLE_EXTENSION) else None
+
+
+register_backend(Backend('files', Sink, _open_metric_file,
+                         lambda runs, _: _remove_files(runs, (NAMES_EXTENSION, DATA_EXTENSION, SUMMARY_EXTENSION))))
+register_backend(Backend('sqlite', SqliteSink, _open_metric_database,
+                         lambda runs, metrics_path: delete_runs(metrics_path, [run_id for run_id, _ in runs])))
+register_backend(Backend('pytables', PytablesSink, _open_metric_table,
+                         lambda runs, _: _remove_files(runs, (TABLE_EXTENSION, TABLE_LOCK_EXTENSION))))
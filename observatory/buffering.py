@@ -0,0 +1,373 @@
+import queue
+import threading
+import warnings
+from time import monotonic
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+
+BACKPRESSURE_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+# Marks the end of the queue, the writer thread stops when it receives this.
+_STOP = object()
+
+
+class MetricBuffer:
+    """
+    Collects metrics in memory so they can be written in one batch.
+
+    The buffer reports that it should be flushed when it holds `size` metrics,
+    or when the oldest metric in the buffer is older than `interval` seconds.
+    The buffer doesn't write anything itself, the owner of the buffer drains it
+    and passes the metrics on to the tracking state. There is no timer, the interval
+    is only checked when a metric is added, so metrics wait in the buffer for as long
+    as nothing else is recorded.
+    """
+
+    def __init__(self, size, interval):
+        """
+        Initializes the buffer
+
+        Parameters
+        ----------
+        size : int
+            The number of metrics after which the buffer should be flushed
+        interval : float
+            The number of seconds after which the buffer should be flushed
+        """
+        self.size = size
+        self.interval = interval
+        self._metrics = []
+        self._first_recorded = None
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def append(self, metric):
+        """
+        Adds a metric to the buffer
+
+        Parameters
+        ----------
+        metric : list
+            The metric to add, as a [name, value, step, timestamp] list
+
+        Returns
+        -------
+        bool
+            True when the buffer should be flushed, False otherwise
+        """
+        if not self._metrics:
+            self._first_recorded = monotonic()
+
+        self._metrics.append(metric)
+
+        return self.should_flush()
+
+    def should_flush(self):
+        """
+        Checks whether the size or the time threshold of the buffer was reached
+        """
+        if not self._metrics:
+            return False
+
+        return (len(self._metrics) >= self.size or
+                monotonic() - self._first_recorded >= self.interval)
+
+    def drain(self):
+        """
+        Empties the buffer
+
+        Returns
+        -------
+        list
+            All metrics that were in the buffer, in the order they were recorded
+        """
+        metrics = self._metrics
+        self._metrics = []
+        self._first_recorded = None
+
+        return metrics
+
+
+class BackgroundWriter:
+    """
+    Writes metrics on a separate daemon thread.
+
+    Metrics are put on a bounded queue by the training loop and the writer
+    thread drains the queue in batches. Everything that is in the queue
+    when the writer thread picks it up is written in one batch.
+
+    When the queue is full, the backpressure policy decides what happens:
+
+    - block: the caller waits until there is room in the queue again.
+    - drop-oldest: the oldest metric in the queue is discarded.
+    - drop-newest: the new metric is discarded.
+
+    Dropped metrics are counted and reported with a warning when the writer is closed.
+    When writing a batch fails, the writer warns and keeps going, the first error is raised
+    when the writer is closed.
+    """
+
+    def __init__(self, write, queue_size, backpressure=BLOCK):
+        """
+        Initializes the writer
+
+        Parameters
+        ----------
+        write : callable
+            The function that writes a batch of metrics, it receives a list of metrics
+        queue_size : int
+            The maximum number of metrics waiting to be written
+        backpressure : str, optional
+            The policy to apply when the queue is full (block, drop-oldest or drop-newest)
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise AssertionError('backpressure must be one of: ' + ', '.join(BACKPRESSURE_POLICIES))
+
+        self.backpressure = backpressure
+        self.dropped = 0
+        self.failed = 0
+        self.error = None
+
+        self._write = write
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='observatory-writer', daemon=True)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def start(self):
+        """
+        Starts the writer thread
+        """
+        self._thread.start()
+
+    def put(self, metric):
+        """
+        Queues a metric for writing, applying the backpressure policy when the queue is full
+
+        Parameters
+        ----------
+        metric : list
+            The metric to write
+        """
+        if self.backpressure == BLOCK:
+            self._queue.put(metric)
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(metric)
+                return
+            except queue.Full:
+                if self.backpressure == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+
+            # The writer thread can empty the queue in the meantime, then nothing is dropped.
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def close(self):
+        """
+        Writes the remaining metrics and waits for the writer thread to finish
+
+        Raises
+        ------
+        RuntimeError
+            When the writer failed to write some of the metrics
+        """
+        if not self.running:
+            return
+
+        # The stop marker must always end up in the queue, even with a drop policy.
+        self._queue.put(_STOP)
+        self._thread.join()
+
+        if self.dropped > 0:
+            warnings.warn(f'{self.dropped} metrics were dropped because the write queue was full.',
+                          RuntimeWarning)
+
+        if self.error is not None:
+            raise RuntimeError(f'Failed to write {self.failed} metrics: {self.error}') from self.error
+
+    def _run(self):
+        stopped = False
+
+        while not stopped:
+            batch = []
+            metric = self._queue.get()
+
+            while metric is not _STOP:
+                batch.append(metric)
+
+                try:
+                    metric = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            stopped = metric is _STOP
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # There's no caller to raise the error to on this thread, so the user is told right away
+                    # and the error is raised when the writer is closed.
+                    if self.error is None:
+                        self.error = e
+                        warnings.warn(f'Failed to write {len(batch)} metrics: {e}', RuntimeWarning)
+
+                    self.failed += len(batch)
+
+
+class StreamingWriter:
+    """
+    Feeds metrics to a long-running consumer on a separate daemon thread.
+
+    The consumer is a function that receives an iterator and keeps reading from it
+    until the writer is closed, for example a streaming HTTP request.
+    The iterator yields lists of metrics, everything that was sent since the
+    consumer read the previous list is combined in one list.
+
+    The metrics wait for the consumer on a bounded queue, the caller waits when it is full.
+    When the consumer fails, or stops before the writer is closed, the metrics that it never
+    received are handed to the fallback function when the writer is closed, so they are written
+    another way. The metrics the consumer received before it failed are not sent again.
+    """
+
+    def __init__(self, consume, fallback, queue_size):
+        """
+        Initializes the writer
+
+        Parameters
+        ----------
+        consume : callable
+            The function that consumes the metrics, it receives an iterator of metric lists.
+            The return value of this function is returned by close.
+        fallback : callable
+            The function that writes the metrics the consumer didn't receive, it receives a list of metrics
+        queue_size : int
+            The maximum number of metrics waiting for the consumer
+        """
+        self.result = None
+        self.error = None
+        self.sent = 0
+
+        self._consume = consume
+        self._fallback = fallback
+        self._unsent = []
+        self._unsent_lock = threading.Lock()
+        self._stopped = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='observatory-stream', daemon=True)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def start(self):
+        """
+        Starts the consumer thread
+        """
+        self._thread.start()
+
+    def send(self, metric):
+        """
+        Sends a metric to the consumer, or keeps it for the fallback when the consumer failed
+
+        Parameters
+        ----------
+        metric : object
+            The metric to send
+        """
+        if self.failed:
+            # Metrics that were still queued came first, so they are kept first.
+            self._take_queued()
+            self._unsent.append(metric)
+            return
+
+        self._queue.put(metric)
+
+    def close(self):
+        """
+        Ends the stream and waits for the consumer to finish.
+
+        When the consumer failed, the metrics it didn't receive are handed to the fallback.
+
+        Returns
+        -------
+        object
+            The value returned by the consumer, or None when it failed
+        """
+        if not self.failed:
+            self._queue.put(_STOP)
+
+        self._thread.join()
+
+        if self.failed:
+            # Metrics can still be queued after the consumer emptied the queue when it failed.
+            self._take_queued()
+            metrics, self._unsent = self._unsent, []
+
+            warnings.warn(f'The metric stream failed, {len(metrics)} metrics that were not sent over it ' +
+                          f'are written in batches instead: {self.error}', RuntimeWarning)
+
+            if metrics:
+                self._fallback(metrics)
+
+        return self.result
+
+    def _take_queued(self):
+        with self._unsent_lock:
+            while True:
+                try:
+                    metric = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+
+                if metric is not _STOP:
+                    self._unsent.append(metric)
+
+    def _batches(self):
+        metric = None
+
+        while metric is not _STOP:
+            batch = []
+            metric = self._queue.get()
+
+            while metric is not _STOP:
+                batch.append(metric)
+
+                try:
+                    metric = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self.sent += len(batch)
+                yield batch
+
+        self._stopped = True
+
+    def _run(self):
+        try:
+            self.result = self._consume(self._batches())
+
+            if not self._stopped:
+                raise RuntimeError('The consumer stopped before the stream was closed.')
+        except Exception as e:
+            self.result = None
+            self.error = e
+            # Emptying the queue lets a caller that waits for room in it continue.
+            self._take_queued()
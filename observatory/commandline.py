@@ -1,10 +1,7 @@
-import pdb
-
 import click
-import pandas as pd
+from observatory import settings
+from observatory.backends import DEFAULT_BACKEND, backend_names
 from observatory.serving import ServingClient
-from prettytable import PrettyTable
-from tabulate import tabulate
 
 
 def print_to_console(data, title):
@@ -27,68 +24,53 @@ def print_to_console(data, title):
         print('| ' + str(d))
     print('+' + ('-' * length) + '--+')
 
-def print_runs(params, data, r):
+def print_runs(run, r):
     """
     This method prints data to commandline
     
     Arguments:
-        params {List} -- List of the parameters, ex. starttime, endtime, status
-        data {List} -- List of the metrics
+        run {dict} -- The run as returned by ServingClient.get_summary
         r {str} -- run id
     """
     print('+' + ('-' * 115))
-    print("| Run: " + r + " | StartDate: " + str(params[0][1]) + " | EndDate: " + str(params[0][2]) + " | Status: " + params[0][3])
+    print("| Run: " + r + " | StartDate: " + run['start'] + " | EndDate: " + run['end'] + " | Status: " + run['status'])
     print('+' + ('-' * 115))
-    i = 0
-    for d in data:
-        avg = sum(d)/len(d)
-        print('| Recorded metric : ' + str(params[0][0][i]))
-        print('| Highest value  : ' + str(max(d)))
-        print('| Lowest value    : ' + str(min(d)))
-        print('| Average value    : ' + str(round(avg, 4)))
+    for name, metric in run['metrics'].items():
+        print('| Recorded metric : ' + name)
+        print('| Highest value  : ' + str(metric['max']))
+        print('| Lowest value    : ' + str(metric['min']))
+        print('| Average value    : ' + str(round(metric['mean'], 4)))
         print('+' + ('-' * 40))
-        i += 1
         
 
 def print_comparison(left_run, right_run, r):
     """
     This method prints the compared data to command-line
+    Only the metrics both runs have in common are printed.
     It rounds long numers to 4 digits
     
     Arguments:
-        left_run {List} -- First run to compare
-        right_run {List} -- Second run to compare
-        metrics {List} -- List of metrics both runs have in common
+        left_run {dict} -- First run to compare
+        right_run {dict} -- Second run to compare
         r {List} -- Run id's
     """
 
+    def cell(left, right, width):
+        text = str(round(left, 4)) + ' | ' + str(round(right, 4))
+        return text + (' ' * (width - len(text)))
+
     print('Left is ' + r[0]+ ', Right is ' + r[1])
     print('+' + ('-' * 83) + '+')
     print('| Metric             | Highest            | Mean               | Lowest             |')
     print('+' + ('-' * 83)  + '+')
-    i = 0
-    for d in left_run:
-        try:
-            leftavg = str(round(sum(left_run[0][i])/len(left_run[0][i]), 4))
-            rightavg = str(round(sum(right_run[0][i])/len(right_run[0][i]), 4))
-                  # Metric name
-            print('| ' + left_run[1][0][0][i] + 
-                   # White Space
-                  (' ' * (21 - len(left_run[1][0][0][i]))) +
-                   # Max metric value
-                  str(round(max(left_run[0][i]), 4)) + ' | ' + str(round(max(right_run[0][i]), 4)) + 
-                   # White Space
-                  (' ' * (18 - ((len(str(round(max(left_run[0][i]), 4)))) + (len(str(round(max(right_run[0][i]), 4))))))) +
-                   # Avg metric value
-                  leftavg + ' | ' + rightavg + 
-                   # White Space
-                  (' ' * (18 - ((len(str(leftavg))) + len(str(rightavg))))) +
-                   # Min metric value
-                  str(round(min(left_run[0][i]), 4)) + ' | ' + str(round(min(right_run[0][i]), 4)) +
-                  (' ' * (16 - ((len(str(round(min(left_run[0][i]), 4)))) + len(str(round(min(right_run[0][i]), 4)))))) + '|')
-            i += 1
-        except IndexError:
-            pass
+    for name, left in left_run['metrics'].items():
+        right = right_run['metrics'].get(name)
+        if right is None:
+            continue
+        print('| ' + name + (' ' * (21 - len(name))) +
+              cell(left['max'], right['max'], 21) +
+              cell(left['mean'], right['mean'], 21) +
+              cell(left['min'], right['min'], 19) + '|')
     print('+' + ('-' * 83)  + '+')
 
 def print_deleted_status(status):
@@ -111,8 +93,71 @@ def cli():
 
 
 @cli.command(help='Runs the tracking server')
-def server():
-    import observatory.server
+@click.option('--host', default='127.0.0.1', help='The address to listen on')
+@click.option('--port', default=None, type=int, help='The port to listen on, 5000 or 50051 with --grpc')
+@click.option('--threads', default=8, type=int, help='The number of requests handled at the same time per worker')
+@click.option('--workers', default=1, type=int, help='The number of worker processes')
+@click.option('--debug', is_flag=True, help='Run the development server with the debugger and reloader')
+@click.option('--async', 'use_async', is_flag=True,
+              help='Run the asyncio server, --threads sets the number of threads that write to disk')
+@click.option('--grpc', 'use_grpc', is_flag=True,
+              help='Run the gRPC tracking service, --threads sets the number of runs that stream at the same time')
+@click.option('--backend', default=DEFAULT_BACKEND, type=click.Choice(backend_names()),
+              help='The storage backend to record runs with')
+def server(host, port, threads, workers, debug, use_async, use_grpc, backend):
+    """
+    Runs the tracking server until it is stopped with Ctrl+C or SIGTERM.
+
+    - observatory server --host 0.0.0.0 --port 5000 --workers 4 --threads 8
+        This command serves on all interfaces with 4 worker processes of 8 threads each
+    - observatory server --async
+        This command serves all requests on a single event loop, which requires aiohttp
+    - observatory server --grpc
+        This command serves the gRPC tracking service on port 50051, which requires grpcio
+    - observatory server --backend sqlite
+        This command records the metrics of all runs in a single SQLite database
+    """
+    if use_async and use_grpc:
+        raise click.UsageError('Choose either --async or --grpc.')
+
+    if backend == 'pytables' and workers != 1:
+        raise click.UsageError('The pytables backend writes every run from a single process, leave out --workers.')
+
+    # The servers create their sink from the settings.
+    settings.configure(backend=backend)
+
+    if use_grpc:
+        if workers != 1 or debug:
+            raise click.UsageError('The gRPC tracking service runs in a single process without a debugger, ' +
+                                   'leave out --workers and --debug.')
+
+        try:
+            from observatory.grpcserver import DEFAULT_PORT as GRPC_PORT, run as run_grpc
+        except ImportError:
+            raise click.UsageError('The gRPC tracking service requires grpcio. ' +
+                                   'Install it with: pip install observatory[grpc]')
+
+        run_grpc(host=host, port=port or GRPC_PORT, threads=threads)
+        return
+
+    port = port or 5000
+
+    if use_async:
+        if workers != 1 or debug:
+            raise click.UsageError('The asyncio server runs in a single process without a debugger, ' +
+                                   'leave out --workers and --debug.')
+
+        try:
+            from observatory.asyncserver import run as run_async
+        except ImportError:
+            raise click.UsageError('The asyncio server requires aiohttp. ' +
+                                   'Install it with: pip install observatory[async]')
+
+        run_async(host=host, port=port, threads=threads)
+        return
+
+    from observatory.server import run
+    run(host=host, port=port, threads=threads, workers=workers, debug=debug)
 
 
 @cli.command(help='Gets the data')
@@ -146,7 +191,17 @@ def server():
     default=None,
     help='The output that should be returned  -- [INPUT] = run id'
 )
-def get(m, v, e, r, s, o):
+@click.option(
+    '-d',
+    default=None,
+    help='The directory to save the outputs in, used with -o  -- [INPUT] = directory'
+)
+@click.option(
+    '-f',
+    default=None,
+    help='The single output to save, used with -o and -d  -- [INPUT] = filename'
+)
+def get(m, v, e, r, s, o, d, f):
     """
     For the get module there are five possible valid commands.
 
@@ -167,6 +222,11 @@ def get(m, v, e, r, s, o):
         This command returns the metadata for a specific run.
         It will show the highest found value, the lowest found value
 
+    - observatory get -o [RUN_ID] -d [DIRECTORY]
+        This command saves the outputs of a run in a directory.
+        Add -f [FILENAME] to save a single output.
+        Without -d, it lists the outputs of the run
+
     Any other combination of paramaters is not valid.
     For instance, it is not possible to request a version without specifing a model
      -[INVALID] observatory get -v [VERSION_ID]
@@ -178,10 +238,14 @@ def get(m, v, e, r, s, o):
     # ? there has to be a better way to do this
     # ? the if statement is really ugly
     if(r is not None and m is None and v is None and e is None):
-        run = serving.get_run(r)
-        print_runs(run[1], run[0], r)
+        run = serving.get_summary(r)
+        print_runs(run, r)
         return
     if(o is not None and m is None and v is None and e is None and r is None and s is None):
+        if d is not None:
+            for file_path in serving.download_output(o, d, f):
+                print('Saved ' + file_path)
+            return
         output = serving.get_output(o)
         print(output)
         return
@@ -324,26 +388,11 @@ def compare(r):
     if r is not None and len(r) == 2:
         runs = []
         for x in r:
-            runs.append(serving.get_run(x))
-        metrics = serving.filter_metrics(runs[0][1][0][0], runs[1][1][0][0])
+            runs.append(serving.get_summary(x))
+        metrics = serving.filter_metrics(runs[0]['metrics'], runs[1]['metrics'])
         if len(metrics) == 0:
             print('No common metics found')
             return
-        for i in range(len(runs[0][1][0][0])):
-            try:
-                if runs[0][1][0][0][i] not in metrics:
-                    runs[0][0].pop(i)
-                    runs[0][1][0][0].pop(i)
-            except IndexError:
-                pass
-        for i in range(len(runs[1][1][0][0])):
-            try:
-                if runs[1][1][0][0][i] not in metrics:
-                    runs[1][0].pop(i)
-                    runs[1][1][0][0].pop(i)
-            except IndexError:
-                pass
-        print_comparison(runs[0], runs[1], metrics, r)
+        print_comparison(runs[0], runs[1], r)
     else:
-        print("invalid input")   
-    
+        print("invalid input")
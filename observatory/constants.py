@@ -1 +1,44 @@
+import re
+from functools import lru_cache
+
 LABEL_PATTERN = '(?!-)[a-z0-9-]{,63}(?<!-)$'
+VERSION_PATTERN = '[0-9]+$'
+RUN_ID_PATTERN = '[a-z0-9]{8}$'
+
+# The patterns are compiled once, instead of looking them up in the cache of the re module on every check.
+LABEL_REGEX = re.compile(LABEL_PATTERN)
+VERSION_REGEX = re.compile(VERSION_PATTERN)
+RUN_ID_REGEX = re.compile(RUN_ID_PATTERN)
+
+# The number of validated values to remember. Metric names are checked for every recorded value,
+# so the same few names are validated over and over again during a run.
+VALIDATION_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _matches(regex, value):
+    return value.strip() != '' and regex.match(value) is not None
+
+
+def is_valid_label(label):
+    """
+    Checks whether a label, such as a model, experiment or metric name, is valid.
+
+    A label contains lower-case alpha-numeric characters and dashes, doesn't start or end with a dash
+    and is at most 63 characters long.
+    """
+    return type(label) == str and _matches(LABEL_REGEX, label)
+
+
+def is_valid_version(version):
+    """
+    Checks whether a version, given as text, contains numeric characters only.
+    """
+    return type(version) == str and _matches(VERSION_REGEX, version)
+
+
+def is_valid_run_id(run_id):
+    """
+    Checks whether a short run id consists of 8 lower-case alpha-numeric characters.
+    """
+    return type(run_id) == str and _matches(RUN_ID_REGEX, run_id)
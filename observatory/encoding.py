@@ -0,0 +1,278 @@
+"""
+Compact encodings and compression for the requests sent to the tracking server.
+
+A batch of metrics can be sent in the packed encoding instead of JSON. The packed encoding starts
+with a small JSON header that holds the run and the names of the metrics, followed by one fixed-size
+binary record per metric in the same layout as the records of a metric file. The server reads the
+records with a single NumPy call instead of parsing every metric.
+
+Request bodies can be compressed with gzip, or with zstd when the zstandard package is installed.
+Servers list the codings they can decode in the Accept-Encoding header of their responses,
+clients only compress their requests once the server has told them it can decode them.
+"""
+import io
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from observatory.constants import is_valid_label, is_valid_run_id, is_valid_version
+from observatory.metricfile import NO_STEP, RECORD_DTYPE, unpack_metric
+
+JSON = 'json'
+PACKED = 'packed'
+ENCODINGS = (JSON, PACKED)
+
+JSON_CONTENT_TYPE = 'application/json'
+PACKED_CONTENT_TYPE = 'application/x-observatory-packed'
+
+PACKED_MAGIC = b'OBSPKD01'
+HEADER_SIZE = struct.Struct('<I')
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+COMPRESSIONS = (GZIP, ZSTD)
+
+# Bodies smaller than this are sent as they are, compressing them costs more than it saves.
+COMPRESSION_THRESHOLD = 1024
+
+# The maximum size of a decompressed body, so a small compressed body can't exhaust the memory of the server.
+MAX_DECODED_SIZE = 256 * 1024 * 1024
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression requires zstandard. ' +
+                          'Install it with: pip install observatory[zstd]') from None
+
+    return zstandard
+
+
+def available_compressions():
+    """
+    Gets the compressions this process can encode and decode
+
+    Returns
+    -------
+    list
+        The names of the content codings, gzip is always available
+    """
+    try:
+        _import_zstandard()
+    except ImportError:
+        return [GZIP]
+
+    return [GZIP, ZSTD]
+
+
+def compress(data, coding):
+    """
+    Compresses a request body
+
+    Parameters
+    ----------
+    data : bytes
+        The body to compress
+    coding : str
+        The content coding, gzip or zstd
+
+    Returns
+    -------
+    bytes
+        The compressed body
+    """
+    if coding == GZIP:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    if coding == ZSTD:
+        return _import_zstandard().ZstdCompressor().compress(data)
+
+    raise AssertionError(f'Unsupported content coding: {coding}')
+
+
+def decompress(data, coding, max_size=MAX_DECODED_SIZE):
+    """
+    Decompresses a request body
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed body
+    coding : str
+        The content coding, gzip or zstd
+    max_size : int, optional
+        The maximum size of the decompressed body
+
+    Returns
+    -------
+    bytes
+        The decompressed body
+
+    Raises
+    ------
+    AssertionError
+        When the coding isn't supported, or the body is invalid or too large
+    """
+    if coding == GZIP:
+        try:
+            decoded = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, max_size + 1)
+        except zlib.error as e:
+            raise AssertionError(f'The body is not valid gzip data: {e}') from None
+    elif coding == ZSTD and ZSTD in available_compressions():
+        zstandard = _import_zstandard()
+
+        try:
+            decoded = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise AssertionError(f'The body is not valid zstd data: {e}') from None
+    else:
+        raise AssertionError(f'Unsupported content coding: {coding}')
+
+    if len(decoded) > max_size:
+        raise AssertionError(f'The decompressed body is larger than {max_size} bytes.')
+
+    return decoded
+
+
+def check_run(model, version, experiment, run_id):
+    """
+    Checks the run a request to the tracking server records data for
+
+    The run ends up in file names, so every request that records data is checked before it is written.
+
+    Parameters
+    ----------
+    model : str
+        The name of the model
+    version : int or str
+        The version of the model
+    experiment : str
+        The name of the experiment
+    run_id : str
+        The id of the run
+
+    Raises
+    ------
+    AssertionError
+        When any of the fields is missing or invalid
+    """
+    if not is_valid_label(model) or not is_valid_label(experiment):
+        raise AssertionError('The model and experiment names contain lower-case alpha-numeric characters ' +
+                             'and dashes only.')
+
+    if type(version) not in (int, str) or not is_valid_version(str(version)):
+        raise AssertionError('The version contains numeric characters only.')
+
+    if not is_valid_label(run_id) or not is_valid_run_id(run_id[:8]):
+        raise AssertionError('The run is not a valid run id.')
+
+
+def encode_packed(model, version, experiment, run_id, metrics):
+    """
+    Encodes a batch of metrics of a single run in the packed encoding
+
+    Parameters
+    ----------
+    model : str
+        The name of the model
+    version : int
+        The version of the model
+    experiment : str
+        The name of the experiment
+    run_id : str
+        The identifier for the run
+    metrics : list
+        The metrics to encode, as [name, value, step, timestamp] lists
+
+    Returns
+    -------
+    bytes
+        The encoded batch
+    """
+    metrics = [unpack_metric(metric) for metric in metrics]
+    names = {}
+    ids = [names.setdefault(name, len(names)) for name, _, _, _ in metrics]
+
+    if len(names) > np.iinfo(RECORD_DTYPE['id']).max + 1:
+        raise AssertionError('A packed batch can hold at most 65536 different metric names.')
+
+    records = np.zeros(len(metrics), dtype=RECORD_DTYPE)
+    records['id'] = ids
+    records['value'] = [value for _, value, _, _ in metrics]
+    records['step'] = [NO_STEP if step is None else step for _, _, step, _ in metrics]
+    records['timestamp'] = [np.nan if timestamp is None else timestamp for _, _, _, timestamp in metrics]
+
+    header = json.dumps({
+        'model': model,
+        'version': version,
+        'experiment': experiment,
+        'run': run_id,
+        'names': list(names)
+    }).encode('utf-8')
+
+    return PACKED_MAGIC + HEADER_SIZE.pack(len(header)) + header + records.tobytes()
+
+
+def decode_packed(data):
+    """
+    Decodes a batch of metrics in the packed encoding
+
+    Parameters
+    ----------
+    data : bytes
+        The encoded batch
+
+    Returns
+    -------
+    tuple
+        The model, version, experiment, run and the metrics as [name, value, step, timestamp] lists
+
+    Raises
+    ------
+    AssertionError
+        When the data is not a valid packed batch
+    """
+    start = len(PACKED_MAGIC) + HEADER_SIZE.size
+
+    if len(data) < start or data[:len(PACKED_MAGIC)] != PACKED_MAGIC:
+        raise AssertionError('The body is not a packed batch of metrics.')
+
+    header_size, = HEADER_SIZE.unpack_from(data, len(PACKED_MAGIC))
+
+    if start + header_size > len(data):
+        raise AssertionError('The header of the packed batch is longer than the batch.')
+
+    try:
+        header = json.loads(data[start:start + header_size])
+        names = header['names']
+        run = (header['model'], header['version'], header['experiment'], header['run'])
+    except (ValueError, KeyError, TypeError):
+        raise AssertionError('The header of the packed batch is invalid.') from None
+
+    model, version, experiment, run_id = run
+    check_run(model, version, experiment, run_id)
+
+    if type(names) != list or any(type(name) != str for name in names):
+        raise AssertionError('The metric names of the packed batch must be a list of strings.')
+
+    if (len(data) - start - header_size) % RECORD_DTYPE.itemsize != 0:
+        raise AssertionError('The packed batch ends with an incomplete record.')
+
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, offset=start + header_size)
+
+    if len(records) > 0 and records['id'].max() >= len(names):
+        raise AssertionError('The packed batch refers to an unknown metric name.')
+
+    # The columns are converted in one go, only the optional fields are looked at one by one.
+    steps = records['step'].tolist()
+    timestamps = records['timestamp'].tolist()
+    metrics = [[names[metric_id], value, None if step == NO_STEP else step,
+                None if timestamp != timestamp else timestamp]
+               for metric_id, value, step, timestamp in zip(records['id'].tolist(), records['value'].tolist(),
+                                                            steps, timestamps)]
+
+    return run + (metrics,)
@@ -0,0 +1,175 @@
+"""
+The gRPC tracking service.
+
+Clients stream the metrics of a run over a single HTTP/2 call that stays open for the whole run.
+The metrics are sent as protobuf messages, which are smaller and cheaper to encode than
+the JSON payloads of the tracking server. The service writes everything through the same Sink.
+
+This module requires grpcio, which is an optional dependency: pip install observatory[grpc]
+"""
+import json
+import signal
+from concurrent import futures
+
+import grpc
+
+from observatory import settings
+from observatory.backends import create_sink
+from observatory.encoding import check_run
+from observatory.proto import tracking_pb2, tracking_pb2_grpc
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 50051
+DEFAULT_THREADS = 8
+
+# The number of seconds requests in progress get to finish when the server stops.
+SHUTDOWN_GRACE = 5.0
+
+
+def metric_records(batch):
+    """
+    Converts a MetricBatch message into [name, value, step, timestamp] lists
+
+    Arguments:
+        batch {tracking_pb2.MetricBatch} -- The batch to convert
+
+    Returns:
+        list -- The metrics in the batch
+    """
+    return [[metric.name, metric.value,
+             metric.step if metric.HasField('step') else None,
+             metric.timestamp if metric.HasField('timestamp') else None] for metric in batch.metrics]
+
+
+class TrackingServicer(tracking_pb2_grpc.TrackingServicer):
+    """
+    Records the data sent to the gRPC tracking service in a sink
+
+    Arguments:
+        sink {Sink} -- The sink to record the data with
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def StartRun(self, request, context):
+        try:
+            check_run(request.model, request.version, request.experiment, request.run)
+        except AssertionError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        try:
+            self.sink.record_session_start(request.model, request.version, request.experiment, request.run)
+        except Exception:
+            context.abort(grpc.StatusCode.INTERNAL, 'Run was not started')
+        return tracking_pb2.Reply()
+
+    def EndRun(self, request, context):
+        run = request.run
+        try:
+            check_run(run.model, run.version, run.experiment, run.run)
+        except AssertionError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        try:
+            self.sink.record_session_end(run.model, run.version, run.experiment, run.run, request.status)
+        except Exception:
+            context.abort(grpc.StatusCode.INTERNAL, 'Run was not Ended')
+        return tracking_pb2.Reply()
+
+    def RecordSettings(self, request, context):
+        run = request.run
+        try:
+            check_run(run.model, run.version, run.experiment, run.run)
+        except AssertionError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        try:
+            settings = json.loads(request.settings)
+        except ValueError:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Settings are not a valid JSON object')
+
+        try:
+            self.sink.record_settings(run.model, run.version, run.experiment, run.run, settings)
+        except Exception:
+            context.abort(grpc.StatusCode.INTERNAL, 'Settings could not be recorded')
+        return tracking_pb2.Reply()
+
+    def RecordMetrics(self, request_iterator, context):
+        recorded = 0
+        try:
+            # Every batch is written as soon as it arrives, while the stream is still open.
+            for batch in request_iterator:
+                run = batch.run
+                metrics = metric_records(batch)
+
+                if metrics:
+                    check_run(run.model, run.version, run.experiment, run.run)
+                    self.sink.record_metrics(run.model, run.version, run.experiment, run.run, metrics)
+                    recorded += len(metrics)
+        except grpc.RpcError:
+            # The client went away, everything received so far is kept.
+            raise
+        except AssertionError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except Exception:
+            context.abort(grpc.StatusCode.INTERNAL, 'Metrics could not be recorded after ' +
+                          str(recorded) + ' metrics')
+        return tracking_pb2.RecordMetricsReply(recorded=recorded)
+
+
+def create_server(sink=None, host=DEFAULT_HOST, port=DEFAULT_PORT, threads=DEFAULT_THREADS):
+    """
+    Creates the gRPC tracking server, start it with its start method
+
+    Every open metric stream occupies one thread, so use at least as many threads
+    as runs that report at the same time.
+
+    Keyword Arguments:
+        sink {Sink} -- The sink to record the data with
+                       (default: {a sink of the backend in the settings in the .observatory directory})
+        host {str} -- The address to listen on (default: {DEFAULT_HOST})
+        port {int} -- The port to listen on, 0 picks a free port (default: {DEFAULT_PORT})
+        threads {int} -- The number of requests handled at the same time (default: {DEFAULT_THREADS})
+
+    Returns:
+        tuple -- The server and the port it listens on
+    """
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='observatory-grpc'))
+    tracking_pb2_grpc.add_TrackingServicer_to_server(TrackingServicer(sink or create_sink(settings.backend)), server)
+    port = server.add_insecure_port(f'{host}:{port}')
+
+    return server, port
+
+
+def run(host=DEFAULT_HOST, port=DEFAULT_PORT, threads=DEFAULT_THREADS):
+    """
+    Runs the gRPC tracking server until it receives SIGINT or SIGTERM
+
+    On shutdown, the server gives the requests in progress SHUTDOWN_GRACE seconds to finish
+    and writes the summaries of the runs that are still open.
+
+    Keyword Arguments:
+        host {str} -- The address to listen on (default: {DEFAULT_HOST})
+        port {int} -- The port to listen on (default: {DEFAULT_PORT})
+        threads {int} -- The number of requests handled at the same time (default: {DEFAULT_THREADS})
+    """
+    sink = create_sink(settings.backend)
+    server, _ = create_server(sink, host, port, threads)
+
+    def shutdown(signum, frame):
+        server.stop(SHUTDOWN_GRACE)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    server.start()
+
+    try:
+        server.wait_for_termination()
+    finally:
+        sink.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,226 @@
+import os
+import pickle
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from os import path
+
+INDEX_FILE = 'index.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    short_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    version TEXT NOT NULL,
+    experiment TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    status TEXT,
+    started TEXT,
+    ended TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_short_id ON runs (short_id);
+CREATE INDEX IF NOT EXISTS runs_by_experiment ON runs (model, version, experiment);
+'''
+
+
+def parse_file_name(file_name):
+    """
+    Gets the model, version, experiment and run id from the name of a run file.
+
+    Run files are named <model>_v<version>_<experiment>_<run_id>.<extension>.
+    Model and experiment names can't contain underscores, so the parts are split on those.
+
+    Returns
+    -------
+    tuple
+        The model, version, experiment and run id, or None when the file isn't a run file
+    """
+    parts = path.splitext(file_name)[0].split('_')
+
+    if len(parts) != 4 or not parts[1].startswith('v'):
+        return None
+
+    return parts[0], parts[1][1:], parts[2], parts[3]
+
+
+def read_session(file_path):
+    """
+    Gets the start, status and end of a run from the session records in its .pkl file.
+
+    The first record holds the model, version, experiment, run id and the moment the run started,
+    the last record holds the status and the moment it ended once the run has ended.
+
+    Returns
+    -------
+    tuple
+        The moment the run started, its status and the moment it ended, None for what isn't recorded
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            first = last = pickle.load(f)
+
+            while True:
+                try:
+                    last = pickle.load(f)
+                except EOFError:
+                    break
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None, None, None
+
+    started = first[4] if len(first) == 5 and isinstance(first[4], datetime) else None
+
+    if last is not first and len(last) == 2 and isinstance(last[1], datetime):
+        return started, last[0], last[1]
+
+    return started, 'RUNNING' if started is not None else None, None
+
+
+class RunIndex:
+    """
+    Keeps track of the recorded runs in a SQLite database.
+
+    The index maps model, version, experiment and run to the name of the files
+    holding the run, so lookups don't have to scan the metrics directory.
+    The index lives in the metrics directory. When it doesn't exist yet,
+    it is built from the files that are already in the directory.
+    """
+
+    def __init__(self, metrics_path):
+        """
+        Opens the index of a metrics directory
+
+        Parameters
+        ----------
+        metrics_path : str
+            The directory containing the run files
+        """
+        self._metrics_path = metrics_path
+        self._file = path.join(metrics_path, INDEX_FILE)
+
+        with self._transaction() as connection:
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'runs'").fetchone()
+            connection.executescript(SCHEMA)
+
+        if not exists:
+            self.rebuild()
+
+    def _connect(self):
+        # A connection per operation keeps the index safe to use from several threads and processes.
+        return sqlite3.connect(self._file, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _query(self, sql, parameters=()):
+        connection = self._connect()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def rebuild(self):
+        """
+        Adds all run files in the metrics directory to the index
+
+        The start, status and end of the runs are read from their session records,
+        so rebuilt runs are ordered the same way as the runs that were indexed when they started.
+        """
+        runs = {}
+        for file_name in os.listdir(self._metrics_path):
+            parts = parse_file_name(file_name)
+
+            if parts is not None:
+                model, version, experiment, run_id = parts
+                runs[run_id] = (run_id, run_id[:8], model, version, experiment, path.splitext(file_name)[0])
+
+        rows = []
+        for run in runs.values():
+            started, status, ended = read_session(path.join(self._metrics_path, run[5] + '.pkl'))
+            rows.append(run + (status, None if started is None else str(started),
+                               None if ended is None else str(ended)))
+
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO runs (run_id, short_id, model, version, experiment, file_name, ' +
+                'status, started, ended) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def add_run(self, model, version, experiment, run_id, file_name, started):
+        """
+        Adds a run to the index
+
+        Parameters
+        ----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The ID of the run
+        file_name : str
+            The name of the run files, without extension
+        started : datetime
+            The moment the run started
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO runs (run_id, short_id, model, version, experiment, file_name, status, started) ' +
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, run_id[:8], model, str(version), experiment, file_name, 'RUNNING', str(started)))
+
+    def end_run(self, run_id, status, ended):
+        """
+        Records the status of a finished run in the index
+        """
+        with self._transaction() as connection:
+            connection.execute('UPDATE runs SET status = ?, ended = ? WHERE run_id = ?',
+                               (status, str(ended), run_id))
+
+    def models(self):
+        return [row[0] for row in self._query('SELECT DISTINCT model FROM runs ORDER BY model')]
+
+    def versions(self, model):
+        return [row[0] for row in self._query(
+            'SELECT DISTINCT version FROM runs WHERE model = ? ORDER BY CAST(version AS INTEGER)', (model,))]
+
+    def experiments(self, model, version):
+        return [row[0] for row in self._query(
+            'SELECT DISTINCT experiment FROM runs WHERE model = ? AND version = ? ORDER BY experiment',
+            (model, str(version)))]
+
+    def runs(self, model, version, experiment):
+        return [row[0] for row in self._query(
+            'SELECT short_id FROM runs WHERE model = ? AND version = ? AND experiment = ? ORDER BY started, run_id',
+            (model, str(version), experiment))]
+
+    def find_files(self, short_id=None, model=None, version=None, experiment=None):
+        """
+        Finds the file names of the runs matching the given filters exactly
+
+        Returns
+        -------
+        list
+            The (run_id, file_name) pairs of the matching runs
+        """
+        filters = [('short_id', short_id), ('model', model), ('version', version), ('experiment', experiment)]
+        filters = [(column, str(value)) for column, value in filters if value is not None]
+
+        where = ' AND '.join(column + ' = ?' for column, _ in filters) or '1 = 1'
+
+        return self._query('SELECT run_id, file_name FROM runs WHERE ' + where, [value for _, value in filters])
+
+    def remove(self, run_ids):
+        """
+        Removes runs from the index
+        """
+        with self._transaction() as connection:
+            connection.executemany('DELETE FROM runs WHERE run_id = ?', [(run_id,) for run_id in run_ids])
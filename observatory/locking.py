@@ -0,0 +1,56 @@
+"""
+File locks that keep concurrent writers to the same observatory directory apart.
+
+Several threads of one server, several server processes and local training jobs can all
+write into the same directory. A writer holds an exclusive lock on the file it appends to,
+so records of different writers are never interleaved.
+
+The locks are advisory flock locks. They are released automatically when the file is closed,
+or when the process holding them dies. On platforms without fcntl, such as Windows,
+the lock is a no-op and only one process should write to a directory at a time.
+"""
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def locked(f):
+    """
+    Holds an exclusive lock on an open file
+
+    Locks taken through different open calls exclude each other, even within one process,
+    so every writer has to open the file itself.
+
+    Parameters
+    ----------
+    f : file
+        The open file to lock
+    """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    try:
+        yield f
+    finally:
+        if fcntl is not None:
+            # Buffered data has to reach the file before other writers are let in.
+            f.flush()
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def lock_file(lock_path):
+    """
+    Holds an exclusive lock on a lock file, for operations that replace files instead of appending to them
+
+    Parameters
+    ----------
+    lock_path : str
+        The location of the lock file, it is created when it doesn't exist
+    """
+    with open(lock_path, 'ab') as f, locked(f):
+        yield
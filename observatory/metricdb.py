@@ -0,0 +1,374 @@
+"""
+SQLite storage for the metrics of many runs.
+
+All metrics of a metrics directory are stored in a single database file (metrics.sqlite) next to the run index.
+Like in a metric file, every run maps its metric names to small integer ids in the names table,
+and the metrics table holds one row per value with the metric id, step, timestamp and value.
+
+The database runs in write-ahead logging mode, so readers never block the writer and see every
+committed batch. A writer keeps a single connection open for the lifetime of the process,
+every batch of metrics is inserted in one transaction. Runs are looked up through an index
+on the run, metric and step, so reading a run or a step range doesn't scan the other runs.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from os import path
+from time import time
+
+import numpy as np
+
+from observatory.metricfile import MAX_METRICS, NO_STEP, RECORD_DTYPE, describe, unpack_metric
+
+DATABASE_FILE = 'metrics.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS names (
+    run_id TEXT NOT NULL,
+    metric_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (run_id, metric_id),
+    UNIQUE (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL,
+    metric_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_by_step ON metrics (run_id, metric_id, step);
+'''
+
+# The statements are kept as constants, so the statement cache of the connection
+# prepares each of them only once.
+INSERT_METRIC = 'INSERT INTO metrics (run_id, metric_id, step, timestamp, value) VALUES (?, ?, ?, ?, ?)'
+INSERT_NAME = 'INSERT INTO names (run_id, metric_id, name) VALUES (?, ?, ?)'
+SELECT_NAMES = 'SELECT name FROM names WHERE run_id = ? ORDER BY metric_id'
+
+# The number of runs for which the metric names are kept in memory.
+MAX_CACHED_RUNS = 128
+
+# The number of seconds to wait for another process that is writing to the database.
+BUSY_TIMEOUT = 30
+
+
+def connect(database_file):
+    """
+    Opens a connection to a metrics database in write-ahead logging mode
+
+    Parameters
+    ----------
+    database_file : str
+        The location of the database
+
+    Returns
+    -------
+    sqlite3.Connection
+        The connection, transactions have to be started explicitly
+    """
+    connection = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # In WAL mode, a commit survives a crash of the process without waiting for the disk.
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    return connection
+
+
+class MetricDatabase:
+    """
+    Writes the metrics of runs to the metrics database of a metrics directory.
+
+    The database keeps one connection per process, shared by all threads. When the process forks,
+    the child opens a connection of its own on first use. The metric ids of the most recently used
+    runs are kept in memory, so the names table is only read when a run records a new metric.
+    """
+
+    def __init__(self, metrics_path):
+        """
+        Opens the metrics database of a metrics directory, creating it when it doesn't exist
+
+        Parameters
+        ----------
+        metrics_path : str
+            The directory containing the run files
+        """
+        self.file = path.join(metrics_path, DATABASE_FILE)
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        self._ids = OrderedDict()
+
+        with self._lock:
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            # A connection can't be shared with a forked process, the parent keeps using its own.
+            self._connection = connect(self.file)
+            self._pid = os.getpid()
+            self._ids.clear()
+
+        return self._connection
+
+    def _metric_ids(self, connection, run_id, names):
+        """
+        Gets the ids of metric names of a run, adding the names that are new to the run.
+
+        Has to be called within the transaction that inserts the metrics.
+        """
+        ids = self._ids.pop(run_id, None)
+
+        if ids is None or any(name not in ids for name in names):
+            # Other processes may have added names to the run, those are picked up first.
+            ids = {name: metric_id for metric_id, name in enumerate(row[0] for row in
+                                                                     connection.execute(SELECT_NAMES, (run_id,)))}
+
+            for name in names:
+                if name not in ids:
+                    if len(ids) >= MAX_METRICS:
+                        raise RuntimeError(f'A run can not record more than {MAX_METRICS} different metrics.')
+
+                    connection.execute(INSERT_NAME, (run_id, len(ids), name))
+                    ids[name] = len(ids)
+
+        if len(self._ids) >= MAX_CACHED_RUNS:
+            self._ids.popitem(last=False)
+
+        self._ids[run_id] = ids
+
+        return ids
+
+    def append(self, run_id, metrics):
+        """
+        Appends metrics to a run in a single transaction
+
+        Parameters
+        ----------
+        run_id : str
+            The ID of the run
+        metrics : list
+            The metrics to write, as [name, value, step, timestamp] lists.
+            Metrics without a timestamp get the current time, metrics without a step get NO_STEP.
+        """
+        metrics = [unpack_metric(metric) for metric in metrics]
+        now = time()
+
+        with self._lock:
+            connection = self._connect()
+            # The write lock is taken up front, so two writers can't hand out the same metric id.
+            connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                ids = self._metric_ids(connection, run_id, {name for name, _, _, _ in metrics})
+                connection.executemany(INSERT_METRIC, [
+                    (run_id, ids[name], NO_STEP if step is None else int(step),
+                     now if timestamp is None else float(timestamp), float(value))
+                    for name, value, step, timestamp in metrics])
+            except BaseException:
+                connection.execute('ROLLBACK')
+                # The names added in the transaction are gone, so are their ids.
+                self._ids.pop(run_id, None)
+                raise
+
+            connection.execute('COMMIT')
+
+    def forget(self, run_id):
+        """
+        Drops the metric ids of a run from memory, once the run records no more metrics
+        """
+        with self._lock:
+            self._ids.pop(run_id, None)
+
+    def close(self):
+        """
+        Closes the connection of this process
+        """
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+
+            self._connection = None
+            self._pid = None
+            self._ids.clear()
+
+
+def delete_runs(metrics_path, run_ids):
+    """
+    Removes the metrics of runs from the metrics database of a metrics directory
+
+    Parameters
+    ----------
+    metrics_path : str
+        The directory containing the run files
+    run_ids : list
+        The IDs of the runs to remove
+    """
+    database_file = path.join(metrics_path, DATABASE_FILE)
+
+    if not run_ids or not path.exists(database_file):
+        return
+
+    connection = connect(database_file)
+
+    try:
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany('DELETE FROM metrics WHERE run_id = ?', [(run_id,) for run_id in run_ids])
+            connection.executemany('DELETE FROM names WHERE run_id = ?', [(run_id,) for run_id in run_ids])
+    finally:
+        connection.close()
+
+
+class MetricDatabaseReader:
+    """
+    Reads the metrics of a run from the metrics database.
+
+    The reader has the same interface as the MetricFileReader, so runs are structured the same way
+    regardless of where their metrics are stored. Ranges and statistics are computed by the database,
+    only the selected records are loaded into memory.
+    """
+
+    def __init__(self, metrics_path, run_id):
+        """
+        Opens the metrics of a run
+
+        Parameters
+        ----------
+        metrics_path : str
+            The directory containing the run files
+        run_id : str
+            The full ID of the run
+        """
+        self._file = path.join(metrics_path, DATABASE_FILE)
+        self._run_id = run_id
+        self.names = [row[0] for row in self._query(SELECT_NAMES, (run_id,))]
+
+    @staticmethod
+    def exists(metrics_path, run_id):
+        """
+        Checks whether a run has metrics in the metrics database of a metrics directory
+        """
+        database_file = path.join(metrics_path, DATABASE_FILE)
+
+        if not path.exists(database_file):
+            return False
+
+        connection = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT)
+
+        try:
+            return connection.execute('SELECT 1 FROM names WHERE run_id = ? LIMIT 1', (run_id,)).fetchone() is not None
+        except sqlite3.OperationalError:
+            # The database was created by a writer that hasn't created the tables yet.
+            return False
+        finally:
+            connection.close()
+
+    def _query(self, sql, parameters=()):
+        # A connection per query, like the run index, keeps the reader safe to use from any thread.
+        connection = sqlite3.connect(self._file, timeout=BUSY_TIMEOUT)
+
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM metrics WHERE run_id = ?', (self._run_id,))[0][0]
+
+    def select(self, start_step=None, end_step=None, start_time=None, end_time=None):
+        """
+        Gets the records within a step range and a time range.
+
+        The ranges include the start and exclude the end, leave out a bound to leave the range open.
+        Records without a step are never part of a step range.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in the range, in the order they were recorded
+        """
+        conditions = ['run_id = ?']
+        parameters = [self._run_id]
+
+        if start_step is not None or end_step is not None:
+            conditions.append('step >= ?')
+            parameters.append(0 if start_step is None else max(start_step, 0))
+
+        if end_step is not None:
+            conditions.append('step < ?')
+            parameters.append(end_step)
+
+        if start_time is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(start_time)
+
+        if end_time is not None:
+            conditions.append('timestamp < ?')
+            parameters.append(end_time)
+
+        rows = self._query('SELECT metric_id, step, timestamp, value FROM metrics WHERE ' +
+                           ' AND '.join(conditions) + ' ORDER BY rowid', parameters)
+
+        return np.array(rows, dtype=RECORD_DTYPE)
+
+    def series(self, name):
+        """
+        Gets the values of a single metric
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of the metric in the order they were recorded
+        """
+        try:
+            metric_id = self.names.index(name)
+        except ValueError:
+            return np.empty(0, dtype=RECORD_DTYPE['value'])
+
+        rows = self._query('SELECT value FROM metrics WHERE run_id = ? AND metric_id = ? ORDER BY rowid',
+                           (self._run_id, metric_id))
+
+        return np.array([row[0] for row in rows], dtype=RECORD_DTYPE['value'])
+
+    def metrics(self):
+        """
+        Gets the values of all metrics
+
+        Returns
+        -------
+        OrderedDict
+            The values of every metric, in the order in which the metrics were first recorded
+        """
+        return OrderedDict((name, self.series(name)) for name in self.names)
+
+    def summary(self):
+        """
+        Gets the statistics per metric, computed by the database
+
+        Returns
+        -------
+        OrderedDict
+            The statistics per metric, in the order in which the metrics were first recorded
+        """
+        rows = self._query(
+            'SELECT metric_id, COUNT(*), MIN(value), MAX(value), SUM(value), SUM(value * value), ' +
+            '(SELECT value FROM metrics AS m WHERE m.run_id = metrics.run_id AND m.metric_id = metrics.metric_id ' +
+            'ORDER BY rowid LIMIT 1), ' +
+            '(SELECT value FROM metrics AS m WHERE m.run_id = metrics.run_id AND m.metric_id = metrics.metric_id ' +
+            'ORDER BY rowid DESC LIMIT 1) ' +
+            'FROM metrics WHERE run_id = ? GROUP BY metric_id', (self._run_id,))
+
+        aggregates = {metric_id: {'count': count, 'min': minimum, 'max': maximum, 'sum': total, 'sumsq': sumsq,
+                                  'first': first, 'last': last}
+                      for metric_id, count, minimum, maximum, total, sumsq, first, last in rows}
+
+        return OrderedDict((name, describe(aggregates[metric_id]))
+                           for metric_id, name in enumerate(self.names) if metric_id in aggregates)
@@ -0,0 +1,536 @@
+"""
+Compact binary storage for the metrics of a run.
+
+The metrics of a run are stored in two files next to each other:
+
+- The header file (.names) maps metric names to small integer ids.
+  It contains one metric name per line, the line number is the id of the metric.
+- The data file (.metrics) starts with a fixed magic value, followed by fixed-width
+  packed records holding the metric id, step, timestamp and value.
+
+Because the records have a fixed width, the data file can be read without
+unpickling every record, and a metric name is stored only once per run.
+The MetricFileReader maps the data file into memory and reads it as NumPy arrays.
+
+Next to these, the summary file (.summary) holds running aggregates per metric:
+the count, minimum, maximum, sum, sum of squares, first and last value.
+It is maintained by the writer, so summaries don't require reading all records.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+
+from observatory.locking import locked
+
+NAMES_EXTENSION = '.names'
+DATA_EXTENSION = '.metrics'
+SUMMARY_EXTENSION = '.summary'
+
+MAGIC = b'OBSMTR01'
+
+# metric id (uint16), step (int64), timestamp (float64), value (float64),
+# little-endian and without any padding between the fields.
+RECORD = struct.Struct('<Hqdd')
+
+# The same layout as RECORD, for reading the records as a NumPy structured array.
+RECORD_DTYPE = np.dtype([('id', '<u2'), ('step', '<i8'), ('timestamp', '<f8'), ('value', '<f8')])
+
+# The step stored for metrics that were recorded without a step.
+NO_STEP = -1
+
+MAX_METRICS = 2 ** 16
+
+# The minimum number of seconds between two writes of the summary file.
+SUMMARY_INTERVAL = 1.0
+
+
+def unpack_metric(metric):
+    """
+    Gets the name, value, step and timestamp of a metric.
+
+    Metrics are passed around as [name, value, step, timestamp] lists.
+    The step and timestamp are optional and are None when they are left out.
+
+    Returns
+    -------
+    tuple
+        The name, value, step and timestamp of the metric
+    """
+    if len(metric) == 2:
+        return metric[0], metric[1], None, None
+
+    name, value, step, timestamp = metric
+
+    return name, value, step, timestamp
+
+
+def read_names(base_path):
+    """
+    Reads the metric names from the header file of a run
+
+    Parameters
+    ----------
+    base_path : str
+        The location of the run files, without extension
+
+    Returns
+    -------
+    list
+        The metric names, the position in the list is the id of the metric
+    """
+    try:
+        with open(base_path + NAMES_EXTENSION, 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip() != '']
+    except FileNotFoundError:
+        return []
+
+
+def read_records(base_path):
+    """
+    Reads the packed records from the data file of a run.
+
+    An incomplete record at the end of the file, left behind by an interrupted write,
+    is ignored.
+
+    Parameters
+    ----------
+    base_path : str
+        The location of the run files, without extension
+
+    Returns
+    -------
+    list
+        The records as (metric id, step, timestamp, value) tuples
+    """
+    try:
+        with open(base_path + DATA_EXTENSION, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise RuntimeError(f'{base_path + DATA_EXTENSION} is not a valid metrics file.')
+
+    end = len(data) - (len(data) - len(MAGIC)) % RECORD.size
+
+    return list(RECORD.iter_unpack(data[len(MAGIC):end]))
+
+
+def read_metrics(base_path):
+    """
+    Reads the metrics of a run
+
+    Parameters
+    ----------
+    base_path : str
+        The location of the run files, without extension
+
+    Returns
+    -------
+    list
+        The metrics as [name, value] pairs, in the order they were recorded
+    """
+    names = read_names(base_path)
+
+    return [[names[metric_id], value] for metric_id, _, _, value in read_records(base_path)]
+
+
+def read_summary(base_path):
+    """
+    Reads the running aggregates per metric from the summary file of a run
+
+    Parameters
+    ----------
+    base_path : str
+        The location of the run files, without extension
+
+    Returns
+    -------
+    dict
+        The aggregates per metric name, or None when there is no readable summary file
+    """
+    try:
+        with open(base_path + SUMMARY_EXTENSION, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def describe(aggregate):
+    """
+    Computes the statistics of a metric from its running aggregate
+
+    Parameters
+    ----------
+    aggregate : dict
+        The count, min, max, sum, sum of squares, first and last value of a metric
+
+    Returns
+    -------
+    dict
+        The count, min, max, mean, standard deviation, first and last value of the metric
+    """
+    count = aggregate['count']
+    mean = aggregate['sum'] / count
+
+    return {
+        'count': count,
+        'min': aggregate['min'],
+        'max': aggregate['max'],
+        'mean': mean,
+        'std': math.sqrt(max(aggregate['sumsq'] / count - mean * mean, 0.0)),
+        'first': aggregate['first'],
+        'last': aggregate['last']
+    }
+
+
+class MetricFileReader:
+    """
+    Reads the metrics of a run from a memory-mapped data file.
+
+    The records are exposed as a NumPy structured array on top of the mapped bytes,
+    so opening a run doesn't read the file or create a Python object per record.
+    The columns of the records (id, step, timestamp and value) are views on the mapped file.
+    Selecting the values of a single metric gathers them into a new array in one vectorized step.
+    """
+
+    def __init__(self, base_path):
+        """
+        Opens the metric files of a run
+
+        Parameters
+        ----------
+        base_path : str
+            The location of the run files, without extension
+        """
+        self.names = read_names(base_path)
+        self.records = np.empty(0, dtype=RECORD_DTYPE)
+        self._base_path = base_path
+        self._sorted = {}
+
+        try:
+            with open(base_path + DATA_EXTENSION, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+
+                if size > len(MAGIC):
+                    # The map stays open as long as the records refer to it,
+                    # closing the file doesn't close the map.
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                    if data[:len(MAGIC)] != MAGIC:
+                        raise RuntimeError(f'{base_path + DATA_EXTENSION} is not a valid metrics file.')
+
+                    count = (size - len(MAGIC)) // RECORD_DTYPE.itemsize
+                    self.records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count, offset=len(MAGIC))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self.records)
+
+    def select(self, start_step=None, end_step=None, start_time=None, end_time=None):
+        """
+        Gets the records within a step range and a time range.
+
+        The ranges include the start and exclude the end, leave out a bound to leave the range open.
+        Records without a step are never part of a step range.
+
+        When the timestamps in a metrics file only go up, the time range is found with a binary
+        search and returned as a view on the mapped file without reading the other records.
+        Timestamps passed in by the caller can go back, the records are filtered one by one then.
+        Steps are searched the same way when they only go up as well.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in the range
+        """
+        records = self.records
+
+        if start_time is not None or end_time is not None:
+            timestamps = records['timestamp']
+
+            if self._timestamps_sorted():
+                start = 0 if start_time is None else np.searchsorted(timestamps, start_time, side='left')
+                end = len(records) if end_time is None else np.searchsorted(timestamps, end_time, side='left')
+                records = records[start:end]
+            else:
+                lower = -np.inf if start_time is None else start_time
+                upper = np.inf if end_time is None else end_time
+                records = records[(timestamps >= lower) & (timestamps < upper)]
+
+        if start_step is not None or end_step is not None:
+            steps = records['step']
+            lower = 0 if start_step is None else max(start_step, 0)
+            upper = np.iinfo(np.int64).max if end_step is None else end_step
+
+            if self._steps_sorted():
+                start = np.searchsorted(steps, lower, side='left')
+                end = np.searchsorted(steps, upper, side='left')
+                records = records[start:end]
+            else:
+                records = records[(steps >= lower) & (steps < upper)]
+
+        return records
+
+    def _steps_sorted(self):
+        if self._sorted.get('step') is None:
+            steps = self.records['step']
+            self._sorted['step'] = bool(np.all(steps[1:] >= steps[:-1]))
+
+        return self._sorted['step']
+
+    def _timestamps_sorted(self):
+        if self._sorted.get('timestamp') is None:
+            timestamps = self.records['timestamp']
+            self._sorted['timestamp'] = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+        return self._sorted['timestamp']
+
+    def series(self, name):
+        """
+        Gets the values of a single metric
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of the metric in the order they were recorded
+        """
+        try:
+            metric_id = self.names.index(name)
+        except ValueError:
+            return np.empty(0, dtype=RECORD_DTYPE['value'])
+
+        return self.records['value'][self.records['id'] == metric_id]
+
+    def metrics(self):
+        """
+        Gets the values of all metrics
+
+        Returns
+        -------
+        OrderedDict
+            The values of every metric, in the order in which the metrics were first recorded
+        """
+        return OrderedDict((name, self.series(name)) for name in self.names)
+
+    def summary(self):
+        """
+        Gets the statistics per metric from the summary file of the run.
+
+        The summary file is only used when it covers every record in the data file.
+        When it is missing or behind, for example because the run is still going,
+        None is returned and the caller has to compute the statistics from the records.
+
+        Returns
+        -------
+        OrderedDict
+            The statistics per metric, in the order in which the metrics were first recorded
+        """
+        aggregates = read_summary(self._base_path)
+
+        if aggregates is None or sum(aggregate['count'] for aggregate in aggregates.values()) != len(self.records):
+            return None
+
+        return OrderedDict((name, describe(aggregates[name])) for name in self.names if name in aggregates)
+
+
+class MetricFileWriter:
+    """
+    Appends metrics to the metric files of a single run.
+
+    The writer keeps the name to id mapping of the run in memory,
+    so the header file is only read once and only written for new metrics.
+
+    Several writers can append to the same run, from different threads or processes.
+    Every append holds a lock on the data file. Under the lock, the writer first picks up
+    the names and records appended by other writers since its previous append,
+    so ids are never handed out twice and the summary covers every record.
+    """
+
+    def __init__(self, base_path):
+        """
+        Initializes the writer
+
+        Parameters
+        ----------
+        base_path : str
+            The location of the run files, without extension
+        """
+        self._base_path = base_path
+        self._lock = threading.Lock()
+        self._names = []
+        self._ids = {}
+        self._names_size = 0
+        self._read_names()
+
+        self._aggregates = read_summary(base_path) or {}
+        self._summary_written = time()
+
+        # The position in the data file up to which the aggregates are complete.
+        # Records after this position are aggregated before the next append.
+        self._data_size = len(MAGIC) + RECORD.size * sum(aggregate['count'] for aggregate in self._aggregates.values())
+
+    def _read_names(self):
+        """
+        Reads the names added to the header file since they were last read
+        """
+        try:
+            size = os.path.getsize(self._base_path + NAMES_EXTENSION)
+        except FileNotFoundError:
+            size = 0
+
+        if size != self._names_size:
+            self._names = read_names(self._base_path)
+            self._ids = {name: metric_id for metric_id, name in enumerate(self._names)}
+            self._names_size = size
+
+    def _catch_up(self, data_file):
+        """
+        Aggregates the records appended to the data file by other writers
+        """
+        size = os.fstat(data_file.fileno()).st_size
+
+        if size <= self._data_size:
+            return
+
+        self._read_names()
+
+        with open(self._base_path + DATA_EXTENSION, 'rb') as f:
+            f.seek(self._data_size)
+            data = f.read(size - self._data_size)
+
+        complete = len(data) - len(data) % RECORD.size
+
+        for metric_id, _, _, value in RECORD.iter_unpack(data[:complete]):
+            self._add_value(self._names[metric_id], value)
+
+        self._data_size = size
+
+    def _metric_id(self, name, new_names):
+        metric_id = self._ids.get(name)
+
+        if metric_id is None:
+            metric_id = len(self._ids)
+
+            if metric_id >= MAX_METRICS:
+                raise RuntimeError(f'A run can not record more than {MAX_METRICS} different metrics.')
+
+            self._ids[name] = metric_id
+            new_names.append(name)
+
+        return metric_id
+
+    def append(self, metrics):
+        """
+        Appends metrics to the run files.
+
+        All records are packed in memory first and appended to the data file with a single write.
+
+        Parameters
+        ----------
+        metrics : list
+            The metrics to write, as [name, value, step, timestamp] lists.
+            Metrics without a timestamp get the current time, metrics without a step get NO_STEP.
+        """
+        with self._lock, open(self._base_path + DATA_EXTENSION, 'ab') as data_file, locked(data_file):
+            self._catch_up(data_file)
+            self._read_names()
+
+            new_names = []
+            now = time()
+
+            try:
+                data = b''.join(self._pack(unpack_metric(metric), now, new_names) for metric in metrics)
+            except Exception:
+                # Nothing is written, so the new names shouldn't keep their ids either.
+                for name in new_names:
+                    del self._ids[name]
+                raise
+
+            # The names are written before the records, so a reader never finds a record
+            # that refers to a metric name it doesn't know about.
+            if new_names:
+                with open(self._base_path + NAMES_EXTENSION, 'a', encoding='utf-8') as f:
+                    f.write(''.join(name + '\n' for name in new_names))
+
+                self._names.extend(new_names)
+                self._names_size = os.path.getsize(self._base_path + NAMES_EXTENSION)
+
+            if os.fstat(data_file.fileno()).st_size == 0:
+                data = MAGIC + data
+
+            data_file.write(data)
+            data_file.flush()
+            self._data_size = os.fstat(data_file.fileno()).st_size
+
+            for metric in metrics:
+                name, value, _, _ = unpack_metric(metric)
+                self._add_value(name, float(value))
+
+            if time() - self._summary_written >= SUMMARY_INTERVAL:
+                self.write_summary()
+
+    def _pack(self, metric, now, new_names):
+        name, value, step, timestamp = metric
+
+        return RECORD.pack(self._metric_id(name, new_names),
+                           NO_STEP if step is None else int(step),
+                           now if timestamp is None else float(timestamp),
+                           float(value))
+
+    def _add_value(self, name, value):
+        aggregate = self._aggregates.get(name)
+
+        if aggregate is None:
+            self._aggregates[name] = {
+                'count': 1, 'min': value, 'max': value, 'sum': value,
+                'sumsq': value * value, 'first': value, 'last': value
+            }
+        else:
+            aggregate['count'] += 1
+            aggregate['min'] = min(aggregate['min'], value)
+            aggregate['max'] = max(aggregate['max'], value)
+            aggregate['sum'] += value
+            aggregate['sumsq'] += value * value
+            aggregate['last'] = value
+
+    def write_summary(self):
+        """
+        Writes the running aggregates to the summary file.
+
+        The file is replaced in one step, so readers never see a partially written summary.
+        """
+        temp_path = f'{self._base_path}{SUMMARY_EXTENSION}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._aggregates, f)
+
+        os.replace(temp_path, self._base_path + SUMMARY_EXTENSION)
+        self._summary_written = time()
+
+    def close(self):
+        """
+        Writes the final summary of the run
+        """
+        with self._lock:
+            if not os.path.exists(self._base_path + DATA_EXTENSION):
+                return
+
+            with open(self._base_path + DATA_EXTENSION, 'ab') as data_file, locked(data_file):
+                self._catch_up(data_file)
+
+                if self._aggregates:
+                    self.write_summary()
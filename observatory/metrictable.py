@@ -0,0 +1,350 @@
+"""
+Columnar HDF5 storage for the metrics of a run, on top of PyTables.
+
+The metrics of a run are stored in a single HDF5 file (.h5) next to the other files of the run.
+Every metric has a table of its own, holding the step, timestamp and value of every recorded value.
+The tables are named by metric id, the names of the metrics are stored in the attributes of the file.
+
+The tables are extendable and chunked, and every chunk is compressed with Blosc. A writer keeps
+the file open for as long as the run records metrics. When the run ends, the step and timestamp
+columns are indexed, so step and time ranges of a finished run are looked up without scanning it.
+Statistics are computed chunk by chunk, so a run never has to fit in memory.
+
+HDF5 files can only be opened by one writer at a time. A writer holds a lock on a lock file next to
+the run file from the moment it opens the file until it closes it, so a writer in another process waits
+for it instead of writing into a file with stale metadata. Readers in the process that records a run
+share the file of the writer, readers in other processes can read the run once it has ended.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from time import time
+
+import numpy as np
+
+from observatory.locking import lock_file
+from observatory.metricfile import MAX_METRICS, NO_STEP, RECORD_DTYPE, describe, unpack_metric
+
+TABLE_EXTENSION = '.h5'
+# The lock file writers hold while they have the run file open.
+TABLE_LOCK_EXTENSION = '.h5lock'
+
+# The number of rows every table is tuned for, PyTables picks the chunk size from it.
+EXPECTED_ROWS = 100000
+
+# The number of rows read at a time when computing statistics.
+READ_CHUNK_SIZE = 65536
+
+# The writers in this process by file, readers share their open file.
+_writers = weakref.WeakValueDictionary()
+
+
+def _import_tables():
+    try:
+        import tables
+    except ImportError:
+        raise ImportError('HDF5 storage requires PyTables. ' +
+                          'Install it with: pip install observatory[hdf5]') from None
+
+    return tables
+
+
+def _table_name(metric_id):
+    return f'm{metric_id}'
+
+
+def _names(h5file):
+    return list(getattr(h5file.root._v_attrs, 'names', []))
+
+
+class MetricTableWriter:
+    """
+    Appends metrics to the HDF5 file of a single run.
+
+    The file is opened on the first append and stays open until the writer is closed.
+    Every append is flushed before it returns, so readers in other threads see it right away.
+    """
+
+    def __init__(self, base_path):
+        """
+        Initializes the writer
+
+        Parameters
+        ----------
+        base_path : str
+            The location of the run files, without extension
+        """
+        self._tables = _import_tables()
+        self._base_path = base_path
+        self._path = base_path + TABLE_EXTENSION
+        self._lock = threading.RLock()
+        self._file = None
+        self._closing = None
+        self._names = []
+        self._ids = {}
+
+    def _open(self):
+        if self._file is None:
+            with ExitStack() as stack:
+                stack.enter_context(lock_file(self._base_path + TABLE_LOCK_EXTENSION))
+                self._file = self._tables.open_file(self._path, mode='a')
+                # Closing the writer closes the file first and releases the lock after it.
+                stack.callback(self._file.close)
+                self._closing = stack.pop_all()
+            self._names = _names(self._file)
+            self._ids = {name: metric_id for metric_id, name in enumerate(self._names)}
+
+            _writers[self._path] = self
+
+        return self._file
+
+    def _table(self, name):
+        """
+        Gets the table of a metric, creating it when the metric is new to the run
+        """
+        metric_id = self._ids.get(name)
+
+        if metric_id is not None:
+            return self._file.get_node('/', _table_name(metric_id))
+
+        metric_id = len(self._names)
+
+        if metric_id >= MAX_METRICS:
+            raise RuntimeError(f'A run can not record more than {MAX_METRICS} different metrics.')
+
+        description = {
+            'step': self._tables.Int64Col(pos=0),
+            'timestamp': self._tables.Float64Col(pos=1),
+            'value': self._tables.Float64Col(pos=2)
+        }
+        filters = self._tables.Filters(complevel=5, complib='blosc:lz4', shuffle=True)
+        table = self._file.create_table('/', _table_name(metric_id), description, title=name,
+                                        filters=filters, expectedrows=EXPECTED_ROWS)
+
+        self._names.append(name)
+        self._ids[name] = metric_id
+        self._file.root._v_attrs.names = self._names
+
+        return table
+
+    def append(self, metrics):
+        """
+        Appends metrics to the run file.
+
+        The values of every metric in the batch are appended to its table in one go.
+
+        Parameters
+        ----------
+        metrics : list
+            The metrics to write, as [name, value, step, timestamp] lists.
+            Metrics without a timestamp get the current time, metrics without a step get NO_STEP.
+        """
+        now = time()
+        rows = OrderedDict()
+
+        # The metrics are converted before anything is written, so an invalid metric writes nothing.
+        for metric in metrics:
+            name, value, step, timestamp = unpack_metric(metric)
+            rows.setdefault(name, []).append((NO_STEP if step is None else int(step),
+                                              now if timestamp is None else float(timestamp), float(value)))
+
+        with self._lock:
+            self._open()
+
+            for name, values in rows.items():
+                table = self._table(name)
+                table.append(values)
+                # Only the tables that got values are flushed, flushing the whole file flushes every table.
+                table.flush()
+
+    def close(self):
+        """
+        Indexes the steps and timestamps of the run and closes the file
+        """
+        with self._lock:
+            if self._file is None:
+                return
+
+            try:
+                for table in self._file.root._f_iter_nodes('Table'):
+                    for column in (table.cols.step, table.cols.timestamp):
+                        if column.is_indexed:
+                            column.reindex_dirty()
+                        else:
+                            column.create_index()
+            finally:
+                self._file = None
+                self._closing.close()
+                self._closing = None
+
+            if _writers.get(self._path) is self:
+                del _writers[self._path]
+
+
+class MetricTableReader:
+    """
+    Reads the metrics of a run from its HDF5 file.
+
+    The reader has the same interface as the MetricFileReader, so runs are structured the same way
+    regardless of where their metrics are stored. Only the selected records are loaded into memory.
+    """
+
+    def __init__(self, base_path):
+        """
+        Opens the metrics of a run
+
+        Parameters
+        ----------
+        base_path : str
+            The location of the run files, without extension
+        """
+        self._tables = _import_tables()
+        self._path = base_path + TABLE_EXTENSION
+
+        with self._open() as h5file:
+            self.names = _names(h5file)
+
+    @contextmanager
+    def _open(self):
+        writer = _writers.get(self._path)
+
+        if writer is not None:
+            with writer._lock:
+                if writer._file is not None:
+                    yield writer._file
+                    return
+
+        try:
+            h5file = self._tables.open_file(self._path, mode='r')
+        except self._tables.HDF5ExtError:
+            raise RuntimeError(f'{self._path} is being written by another process, '
+                               'its metrics can be read once the run has ended.') from None
+
+        try:
+            yield h5file
+        finally:
+            h5file.close()
+
+    def _metric_tables(self, h5file):
+        return [(metric_id, h5file.get_node('/', _table_name(metric_id))) for metric_id in range(len(self.names))]
+
+    def __len__(self):
+        with self._open() as h5file:
+            return sum(table.nrows for _, table in self._metric_tables(h5file))
+
+    def select(self, start_step=None, end_step=None, start_time=None, end_time=None):
+        """
+        Gets the records within a step range and a time range.
+
+        The ranges include the start and exclude the end, leave out a bound to leave the range open.
+        Records without a step are never part of a step range. The ranges are looked up through
+        the indexes on the steps and timestamps once the run has ended.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in the range, ordered by timestamp
+        """
+        conditions = []
+        condvars = {}
+
+        if start_step is not None or end_step is not None:
+            conditions.append('(step >= start_step)')
+            condvars['start_step'] = 0 if start_step is None else max(start_step, 0)
+
+        if end_step is not None:
+            conditions.append('(step < end_step)')
+            condvars['end_step'] = end_step
+
+        if start_time is not None:
+            conditions.append('(timestamp >= start_time)')
+            condvars['start_time'] = start_time
+
+        if end_time is not None:
+            conditions.append('(timestamp < end_time)')
+            condvars['end_time'] = end_time
+
+        parts = []
+
+        with self._open() as h5file:
+            for metric_id, table in self._metric_tables(h5file):
+                rows = table.read_where(' & '.join(conditions), condvars) if conditions else table.read()
+
+                part = np.empty(len(rows), dtype=RECORD_DTYPE)
+                part['id'] = metric_id
+                part['step'] = rows['step']
+                part['timestamp'] = rows['timestamp']
+                part['value'] = rows['value']
+                parts.append(part)
+
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+
+        records = np.concatenate(parts)
+
+        return records[np.argsort(records['timestamp'], kind='stable')]
+
+    def series(self, name):
+        """
+        Gets the values of a single metric
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of the metric in the order they were recorded
+        """
+        try:
+            metric_id = self.names.index(name)
+        except ValueError:
+            return np.empty(0, dtype=RECORD_DTYPE['value'])
+
+        with self._open() as h5file:
+            return h5file.get_node('/', _table_name(metric_id)).col('value')
+
+    def metrics(self):
+        """
+        Gets the values of all metrics
+
+        Returns
+        -------
+        OrderedDict
+            The values of every metric, in the order in which the metrics were first recorded
+        """
+        return OrderedDict((name, self.series(name)) for name in self.names)
+
+    def summary(self):
+        """
+        Gets the statistics per metric, reading the values one chunk at a time
+
+        Returns
+        -------
+        OrderedDict
+            The statistics per metric, in the order in which the metrics were first recorded
+        """
+        summary = OrderedDict()
+
+        with self._open() as h5file:
+            for metric_id, table in self._metric_tables(h5file):
+                if table.nrows == 0:
+                    continue
+
+                aggregate = {'count': table.nrows, 'min': np.inf, 'max': -np.inf, 'sum': 0.0, 'sumsq': 0.0}
+
+                for start in range(0, table.nrows, READ_CHUNK_SIZE):
+                    values = table.read(start, start + READ_CHUNK_SIZE, field='value')
+                    aggregate['min'] = min(aggregate['min'], float(values.min()))
+                    aggregate['max'] = max(aggregate['max'], float(values.max()))
+                    aggregate['sum'] += float(values.sum())
+                    aggregate['sumsq'] += float(np.dot(values, values))
+
+                aggregate['first'] = float(table.read(0, 1, field='value')[0])
+                aggregate['last'] = float(table.read(table.nrows - 1, table.nrows, field='value')[0])
+                summary[self.names[metric_id]] = describe(aggregate)
+
+        return summary
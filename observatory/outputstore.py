@@ -0,0 +1,621 @@
+"""
+Content-addressed storage for the outputs of runs.
+
+Output files are stored by the SHA-256 hash of their contents in the objects folder,
+so an artifact that is recorded by several runs is stored only once:
+
+    outputs/objects/<first two characters of the hash>/<hash>
+
+Every run has a manifest in the manifests folder, a JSON file that maps the file names
+given by the user to the hash and size of the stored file. Manifests are named like
+the other run files: <model>_v<version>_<experiment>_<run_id>.json
+
+Files are copied in kernel space where the platform supports it, first as a reflink
+(the copy shares its blocks with the original on file systems like btrfs and XFS),
+then with copy_file_range or sendfile, so the contents never pass through Python.
+
+Files uploaded to the server arrive in chunks. An upload is written to a part file
+in the uploads folder, next to a JSON file describing the upload. Chunks are appended
+to the part file as they arrive, so an interrupted upload continues where it stopped.
+When the upload is finished and its checksum matches, the part file is moved into
+the objects folder.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from os import path
+from uuid import uuid4
+
+from observatory.locking import locked, lock_file
+
+OBJECTS_FOLDER = 'objects'
+MANIFESTS_FOLDER = 'manifests'
+UPLOADS_FOLDER = 'uploads'
+MANIFEST_EXTENSION = '.json'
+PART_EXTENSION = '.part'
+LOCK_FILE = '.lock'
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# The ioctl request that clones a file on Linux, from linux/fs.h.
+FICLONE = 0x40049409
+
+
+def hash_file(file_path):
+    """
+    Computes the SHA-256 hash of a file, without reading the whole file into memory
+
+    Parameters
+    ----------
+    file_path : str
+        The file to hash
+
+    Returns
+    -------
+    str
+        The hexadecimal hash of the contents of the file
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    with open(file_path, 'rb') as f:
+        while True:
+            size = f.readinto(buffer)
+
+            if not size:
+                break
+
+            digest.update(view[:size])
+
+    return digest.hexdigest()
+
+
+def _reflink(source, destination):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    try:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _copy_in_kernel(copy, source, destination, size):
+    """
+    Copies a file with copy_file_range or sendfile, which move at most `count` bytes per call
+    """
+    offset = 0
+
+    while offset < size:
+        copied = copy(source.fileno(), destination.fileno(), offset, size - offset)
+
+        if copied == 0:
+            break
+
+        offset += copied
+
+    return offset == size
+
+
+def copy_file(source_path, destination_path):
+    """
+    Copies a file using the fastest method the platform supports.
+
+    The methods are tried in order: a reflink, copy_file_range, sendfile and
+    finally a regular buffered copy.
+
+    Parameters
+    ----------
+    source_path : str
+        The file to copy
+    destination_path : str
+        The location of the copy, an existing file is overwritten
+    """
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        size = os.fstat(source.fileno()).st_size
+
+        if size == 0 or _reflink(source, destination):
+            return
+
+        kernel_copies = []
+
+        if hasattr(os, 'copy_file_range'):
+            kernel_copies.append(lambda src, dst, offset, count: os.copy_file_range(
+                src, dst, count, offset_src=offset, offset_dst=offset))
+
+        if hasattr(os, 'sendfile'):
+            kernel_copies.append(lambda src, dst, offset, count: os.sendfile(dst, src, offset, count))
+
+        for copy in kernel_copies:
+            try:
+                if _copy_in_kernel(copy, source, destination, size):
+                    return
+            except OSError:
+                # Not every file system supports every method, for example copying between devices.
+                pass
+
+            destination.seek(0)
+            destination.truncate()
+
+        source.seek(0)
+        shutil.copyfileobj(source, destination, HASH_CHUNK_SIZE)
+
+
+class OutputStore:
+    """
+    Stores the outputs of runs by the hash of their contents.
+    """
+
+    def __init__(self, outputs_path):
+        """
+        Opens the output store
+
+        Parameters
+        ----------
+        outputs_path : str
+            The outputs directory of the observatory
+        """
+        self._path = outputs_path
+
+        for folder in (OBJECTS_FOLDER, MANIFESTS_FOLDER, UPLOADS_FOLDER):
+            os.makedirs(path.join(outputs_path, folder), exist_ok=True)
+
+    def object_path(self, digest):
+        """
+        Gets the location of a stored file by its hash
+        """
+        return path.join(self._path, OBJECTS_FOLDER, digest[:2], digest)
+
+    def manifest_path(self, run_file):
+        """
+        Gets the location of the manifest of a run
+
+        Parameters
+        ----------
+        run_file : str
+            The name of the run files, without extension
+        """
+        return path.join(self._path, MANIFESTS_FOLDER, run_file + MANIFEST_EXTENSION)
+
+    def put(self, file_path):
+        """
+        Stores a file, unless a file with the same contents is stored already
+
+        Parameters
+        ----------
+        file_path : str
+            The file to store
+
+        Returns
+        -------
+        str
+            The hash of the stored file
+        """
+        digest = hash_file(file_path)
+        object_path = self.object_path(digest)
+
+        if not path.exists(object_path):
+            os.makedirs(path.dirname(object_path), exist_ok=True)
+
+            # The copy is moved into place in one step, so a partial copy is never mistaken for the file.
+            # Every writer copies to a file of its own, threads of a process may store the same file at once.
+            temp_path = f'{object_path}.{uuid4().hex}.tmp'
+            try:
+                copy_file(file_path, temp_path)
+                try:
+                    os.replace(temp_path, object_path)
+                except OSError:
+                    # Another writer moved the same contents into place first, which is just as good.
+                    if not path.exists(object_path):
+                        raise
+            finally:
+                if path.exists(temp_path):
+                    os.remove(temp_path)
+
+        return digest
+
+    def _lock(self):
+        # Manifests are replaced rather than appended to, so they are guarded by a lock file of the store.
+        return lock_file(path.join(self._path, LOCK_FILE))
+
+    def _add_manifest_entry(self, run_file, filename, digest):
+        with self._lock():
+            # The file may have been collected as garbage by another writer since it was stored.
+            if not path.exists(self.object_path(digest)):
+                return False
+
+            manifest = self.manifest(run_file)
+            manifest[filename] = {'hash': digest, 'size': os.path.getsize(self.object_path(digest))}
+            self._write_manifest(run_file, manifest)
+
+        return True
+
+    def record(self, run_file, filename, file_path):
+        """
+        Stores a file as an output of a run
+
+        Parameters
+        ----------
+        run_file : str
+            The name of the run files, without extension
+        filename : str
+            The name of the output as given by the user
+        file_path : str
+            The file to store
+
+        Returns
+        -------
+        str
+            The hash of the stored file
+        """
+        digest = self.put(file_path)
+
+        while not self._add_manifest_entry(run_file, filename, digest):
+            digest = self.put(file_path)
+
+        return digest
+
+    def manifest(self, run_file):
+        """
+        Reads the manifest of a run
+
+        Returns
+        -------
+        dict
+            The hash and size of every output of the run, by file name
+        """
+        try:
+            with open(self.manifest_path(run_file), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_manifest(self, run_file, manifest):
+        manifest_path = self.manifest_path(run_file)
+        temp_path = manifest_path + '.tmp'
+
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        os.replace(temp_path, manifest_path)
+
+    def remove(self, run_files):
+        """
+        Removes the outputs of runs.
+
+        The manifests of the runs are removed, along with every stored file
+        that isn't referenced by the manifest of another run.
+
+        Parameters
+        ----------
+        run_files : list
+            The names of the run files, without extension
+
+        Returns
+        -------
+        bool
+            True when any outputs were removed
+        """
+        removed = False
+        with self._lock():
+            for run_file in run_files:
+                if path.exists(self.manifest_path(run_file)):
+                    os.remove(self.manifest_path(run_file))
+                    removed = True
+
+            if removed:
+                self._collect_garbage()
+
+        return removed
+
+    def collect_garbage(self):
+        """
+        Removes the stored files that aren't referenced by any manifest
+        """
+        with self._lock():
+            self._collect_garbage()
+
+    def _collect_garbage(self):
+        referenced = set()
+        manifests_path = path.join(self._path, MANIFESTS_FOLDER)
+
+        for file_name in os.listdir(manifests_path):
+            if file_name.endswith(MANIFEST_EXTENSION):
+                manifest = self.manifest(file_name[:-len(MANIFEST_EXTENSION)])
+                referenced.update(output['hash'] for output in manifest.values())
+
+        objects_path = path.join(self._path, OBJECTS_FOLDER)
+
+        for prefix in os.listdir(objects_path):
+            for digest in os.listdir(path.join(objects_path, prefix)):
+                # Temporary files of copies in progress are left alone.
+                if digest not in referenced and not digest.endswith('.tmp'):
+                    os.remove(path.join(objects_path, prefix, digest))
+
+    def _upload_path(self, upload_id, extension):
+        # Upload ids come from clients, so they are checked before they end up in a path.
+        if not upload_id or not all(character in '0123456789abcdef' for character in upload_id):
+            raise AssertionError(f'{upload_id} is not a valid upload id.')
+
+        return path.join(self._path, UPLOADS_FOLDER, upload_id + extension)
+
+    def begin_upload(self, run_file, filename, size=None):
+        """
+        Starts a chunked upload of an output of a run
+
+        Parameters
+        ----------
+        run_file : str
+            The name of the run files, without extension
+        filename : str
+            The name of the output as given by the user
+        size : int, optional
+            The total size of the file in bytes, when it is known up front
+
+        Returns
+        -------
+        str
+            The id of the upload, used to send the chunks and to finish the upload
+        """
+        upload_id = uuid4().hex
+
+        with open(self._upload_path(upload_id, MANIFEST_EXTENSION), 'w', encoding='utf-8') as f:
+            json.dump({'run_file': run_file, 'filename': filename, 'size': size}, f)
+
+        open(self._upload_path(upload_id, PART_EXTENSION), 'wb').close()
+
+        return upload_id
+
+    def upload_offset(self, upload_id):
+        """
+        Gets the number of bytes received so far, which is where the next chunk has to start
+
+        Raises
+        ------
+        AssertionError
+            When the upload doesn't exist
+        """
+        try:
+            return os.path.getsize(self._upload_path(upload_id, PART_EXTENSION))
+        except FileNotFoundError:
+            raise AssertionError(f'Upload {upload_id} was not found.')
+
+    def write_chunk(self, upload_id, offset, stream, chunk_size=HASH_CHUNK_SIZE):
+        """
+        Appends a chunk to an upload.
+
+        The chunk is read from the stream in small pieces and written straight to disk,
+        so the chunk is never held in memory as a whole.
+
+        Parameters
+        ----------
+        upload_id : str
+            The id of the upload
+        offset : int
+            The position of the chunk in the file, this has to be the current offset of the upload
+        stream : object
+            A file-like object to read the chunk from
+
+        Returns
+        -------
+        int
+            The offset of the upload after writing the chunk
+
+        Raises
+        ------
+        AssertionError
+            When the chunk doesn't start at the current offset of the upload
+        """
+        self.upload_offset(upload_id)
+
+        # The offset is checked under the lock, so two requests can't both append the same chunk.
+        with open(self._upload_path(upload_id, PART_EXTENSION), 'ab') as f, locked(f):
+            current = os.fstat(f.fileno()).st_size
+
+            if offset != current:
+                raise AssertionError(f'The chunk starts at {offset}, but the upload continues at {current}.')
+
+            shutil.copyfileobj(stream, f, chunk_size)
+
+        return self.upload_offset(upload_id)
+
+    def finish_upload(self, upload_id, checksum):
+        """
+        Completes an upload and records the uploaded file as an output of its run
+
+        Parameters
+        ----------
+        upload_id : str
+            The id of the upload
+        checksum : str
+            The SHA-256 hash of the complete file, as computed by the client
+
+        Returns
+        -------
+        str
+            The hash of the stored file
+
+        Raises
+        ------
+        RuntimeError
+            When the received file doesn't match the checksum. The upload is discarded.
+        """
+        part_path = self._upload_path(upload_id, PART_EXTENSION)
+        info_path = self._upload_path(upload_id, MANIFEST_EXTENSION)
+
+        with open(info_path, 'r', encoding='utf-8') as f:
+            upload = json.load(f)
+
+        digest = hash_file(part_path)
+
+        if digest != checksum or (upload['size'] is not None and os.path.getsize(part_path) != upload['size']):
+            self.abort_upload(upload_id)
+            raise RuntimeError(f'Upload {upload_id} was discarded, the received file does not match the checksum.')
+
+        object_path = self.object_path(digest)
+        os.makedirs(path.dirname(object_path), exist_ok=True)
+
+        # The part file is on the same file system as the objects, so it is moved instead of copied.
+        os.replace(part_path, object_path)
+        os.remove(info_path)
+
+        if not self._add_manifest_entry(upload['run_file'], upload['filename'], digest):
+            raise RuntimeError(f'Upload {upload_id} was removed while it was being recorded.')
+
+        return digest
+
+    def abort_upload(self, upload_id):
+        """
+        Discards an upload and everything received for it
+        """
+        for extension in (PART_EXTENSION, MANIFEST_EXTENSION):
+            if path.exists(self._upload_path(upload_id, extension)):
+                os.remove(self._upload_path(upload_id, extension))
+
+
+def etag(digest):
+    """
+    Gets the HTTP entity tag of a stored file.
+
+    Files are stored by the hash of their contents, so the hash is a strong entity tag.
+    """
+    return f'"{digest}"'
+
+
+def etag_matches(header, digest):
+    """
+    Checks whether an If-None-Match header refers to a stored file
+
+    Parameters
+    ----------
+    header : str
+        The value of the header, a comma separated list of entity tags or *
+    digest : str
+        The hash of the stored file
+
+    Returns
+    -------
+    bool
+        True when the header contains the entity tag of the file
+    """
+    if not header:
+        return False
+
+    tags = [tag.strip() for tag in header.split(',')]
+
+    # If-None-Match uses the weak comparison, so a weak tag of the same contents matches as well.
+    tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+    return '*' in tags or etag(digest) in tags
+
+
+def parse_range(header, size):
+    """
+    Gets the byte range requested by a Range header.
+
+    Only single ranges are supported, a request for several ranges is answered
+    with the whole file, which HTTP allows.
+
+    Parameters
+    ----------
+    header : str
+        The value of the header, for example "bytes=0-499", "bytes=500-" or "bytes=-500"
+    size : int
+        The size of the file in bytes
+
+    Returns
+    -------
+    tuple
+        The first and last byte of the range, or None when the whole file should be sent, which
+        is also the case for an invalid range such as "bytes=500-100"
+
+    Raises
+    ------
+    AssertionError
+        When the range lies outside the file
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+
+    first, _, last = header[len('bytes='):].strip().partition('-')
+
+    if not (first.isdigit() or first == '') or not (last.isdigit() or last == '') or first == last == '':
+        return None
+
+    if first == '':
+        # A suffix range, the last bytes of the file.
+        if int(last) == 0:
+            raise AssertionError(f'The range {header} is not satisfiable.')
+
+        return max(size - int(last), 0), size - 1
+
+    if last != '' and int(last) < int(first):
+        # A range that ends before it starts is invalid and the header is ignored.
+        return None
+
+    if int(first) >= size:
+        raise AssertionError(f'The range {header} is not satisfiable.')
+
+    return int(first), size - 1 if last == '' else min(int(last), size - 1)
+
+
+def parse_content_range(header):
+    """
+    Gets the first byte of an uploaded chunk from a Content-Range header
+
+    Parameters
+    ----------
+    header : str
+        The value of the header, formatted as "bytes <first>-<last>/<total>"
+
+    Returns
+    -------
+    int
+        The position of the first byte, or None when the header is invalid
+    """
+    match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)$', header or '')
+
+    if match is None:
+        return None
+
+    return int(match.group(1))
+
+
+def read_file(file_path, first=0, last=None, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Reads a range of a file in chunks, so the file is never held in memory as a whole
+
+    Parameters
+    ----------
+    file_path : str
+        The file to read
+    first : int, optional
+        The first byte to read
+    last : int, optional
+        The last byte to read, by default the file is read until the end
+
+    Returns
+    -------
+    generator
+        The contents of the range, in chunks of at most chunk_size bytes
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(first)
+        remaining = None if last is None else last - first + 1
+
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+
+            if not chunk:
+                break
+
+            if remaining is not None:
+                remaining -= len(chunk)
+
+            yield chunk
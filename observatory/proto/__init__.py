@@ -0,0 +1,17 @@
+"""
+The modules generated from tracking.proto for the gRPC tracking service.
+
+The generated modules check the version of the protobuf runtime when they're imported.
+An older protobuf is reported as an ImportError here, like a missing grpcio,
+so the gRPC service stays optional: pip install observatory[grpc]
+"""
+import re
+
+from google.protobuf import __version__ as _protobuf_version
+
+# The version of protobuf the modules were generated with, see tracking_pb2.py.
+GENERATED_VERSION = (7, 35, 1)
+
+if tuple(int(part) for part in re.findall(r'\d+', _protobuf_version)[:3]) < GENERATED_VERSION:
+    raise ImportError(f'The gRPC modules require protobuf 7.35.1 or newer, found {_protobuf_version}. ' +
+                      'Install it with: pip install observatory[grpc]')
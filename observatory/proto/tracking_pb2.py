@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: observatory/proto/tracking.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'observatory/proto/tracking.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n observatory/proto/tracking.proto\x12\x0bobservatory\"F\n\x03Run\x12\r\n\x05model\x18\x01 \x01(\t\x12\x0f\n\x07version\x18\x02 \x01(\x05\x12\x12\n\nexperiment\x18\x03 \x01(\t\x12\x0b\n\x03run\x18\x04 \x01(\t\"g\n\x06Metric\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01\x12\x11\n\x04step\x18\x03 \x01(\x03H\x00\x88\x01\x01\x12\x16\n\ttimestamp\x18\x04 \x01(\x01H\x01\x88\x01\x01\x42\x07\n\x05_stepB\x0c\n\n_timestamp\"R\n\x0bMetricBatch\x12\x1d\n\x03run\x18\x01 \x01(\x0b\x32\x10.observatory.Run\x12$\n\x07metrics\x18\x02 \x03(\x0b\x32\x13.observatory.Metric\"&\n\x12RecordMetricsReply\x12\x10\n\x08recorded\x18\x01 \x01(\x03\">\n\rEndRunRequest\x12\x1d\n\x03run\x18\x01 \x01(\x0b\x32\x10.observatory.Run\x12\x0e\n\x06status\x18\x02 \x01(\t\"B\n\x0fSettingsRequest\x12\x1d\n\x03run\x18\x01 \x01(\x0b\x32\x10.observatory.Run\x12\x10\n\x08settings\x18\x02 \x01(\t\"\x07\n\x05Reply2\x88\x02\n\x08Tracking\x12\x30\n\x08StartRun\x12\x10.observatory.Run\x1a\x12.observatory.Reply\x12\x38\n\x06\x45ndRun\x12\x1a.observatory.EndRunRequest\x1a\x12.observatory.Reply\x12\x42\n\x0eRecordSettings\x12\x1c.observatory.SettingsRequest\x1a\x12.observatory.Reply\x12L\n\rRecordMetrics\x12\x18.observatory.MetricBatch\x1a\x1f.observatory.RecordMetricsReply(\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'observatory.proto.tracking_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_RUN']._serialized_start=49
+  _globals['_RUN']._serialized_end=119
+  _globals['_METRIC']._serialized_start=121
+  _globals['_METRIC']._serialized_end=224
+  _globals['_METRICBATCH']._serialized_start=226
+  _globals['_METRICBATCH']._serialized_end=308
+  _globals['_RECORDMETRICSREPLY']._serialized_start=310
+  _globals['_RECORDMETRICSREPLY']._serialized_end=348
+  _globals['_ENDRUNREQUEST']._serialized_start=350
+  _globals['_ENDRUNREQUEST']._serialized_end=412
+  _globals['_SETTINGSREQUEST']._serialized_start=414
+  _globals['_SETTINGSREQUEST']._serialized_end=480
+  _globals['_REPLY']._serialized_start=482
+  _globals['_REPLY']._serialized_end=489
+  _globals['_TRACKING']._serialized_start=492
+  _globals['_TRACKING']._serialized_end=756
+# @@protoc_insertion_point(module_scope)
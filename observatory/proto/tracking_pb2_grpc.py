@@ -0,0 +1,227 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from observatory.proto import tracking_pb2 as observatory_dot_proto_dot_tracking__pb2
+
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in observatory/proto/tracking_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class TrackingStub:
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.StartRun = channel.unary_unary(
+                '/observatory.Tracking/StartRun',
+                request_serializer=observatory_dot_proto_dot_tracking__pb2.Run.SerializeToString,
+                response_deserializer=observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+                _registered_method=True)
+        self.EndRun = channel.unary_unary(
+                '/observatory.Tracking/EndRun',
+                request_serializer=observatory_dot_proto_dot_tracking__pb2.EndRunRequest.SerializeToString,
+                response_deserializer=observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+                _registered_method=True)
+        self.RecordSettings = channel.unary_unary(
+                '/observatory.Tracking/RecordSettings',
+                request_serializer=observatory_dot_proto_dot_tracking__pb2.SettingsRequest.SerializeToString,
+                response_deserializer=observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+                _registered_method=True)
+        self.RecordMetrics = channel.stream_unary(
+                '/observatory.Tracking/RecordMetrics',
+                request_serializer=observatory_dot_proto_dot_tracking__pb2.MetricBatch.SerializeToString,
+                response_deserializer=observatory_dot_proto_dot_tracking__pb2.RecordMetricsReply.FromString,
+                _registered_method=True)
+
+
+class TrackingServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def StartRun(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def EndRun(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RecordSettings(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RecordMetrics(self, request_iterator, context):
+        """The client streams the metrics of a run from the start until the end of the run.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_TrackingServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'StartRun': grpc.unary_unary_rpc_method_handler(
+                    servicer.StartRun,
+                    request_deserializer=observatory_dot_proto_dot_tracking__pb2.Run.FromString,
+                    response_serializer=observatory_dot_proto_dot_tracking__pb2.Reply.SerializeToString,
+            ),
+            'EndRun': grpc.unary_unary_rpc_method_handler(
+                    servicer.EndRun,
+                    request_deserializer=observatory_dot_proto_dot_tracking__pb2.EndRunRequest.FromString,
+                    response_serializer=observatory_dot_proto_dot_tracking__pb2.Reply.SerializeToString,
+            ),
+            'RecordSettings': grpc.unary_unary_rpc_method_handler(
+                    servicer.RecordSettings,
+                    request_deserializer=observatory_dot_proto_dot_tracking__pb2.SettingsRequest.FromString,
+                    response_serializer=observatory_dot_proto_dot_tracking__pb2.Reply.SerializeToString,
+            ),
+            'RecordMetrics': grpc.stream_unary_rpc_method_handler(
+                    servicer.RecordMetrics,
+                    request_deserializer=observatory_dot_proto_dot_tracking__pb2.MetricBatch.FromString,
+                    response_serializer=observatory_dot_proto_dot_tracking__pb2.RecordMetricsReply.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'observatory.Tracking', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('observatory.Tracking', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class Tracking:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def StartRun(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/observatory.Tracking/StartRun',
+            observatory_dot_proto_dot_tracking__pb2.Run.SerializeToString,
+            observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def EndRun(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/observatory.Tracking/EndRun',
+            observatory_dot_proto_dot_tracking__pb2.EndRunRequest.SerializeToString,
+            observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RecordSettings(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/observatory.Tracking/RecordSettings',
+            observatory_dot_proto_dot_tracking__pb2.SettingsRequest.SerializeToString,
+            observatory_dot_proto_dot_tracking__pb2.Reply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RecordMetrics(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/observatory.Tracking/RecordMetrics',
+            observatory_dot_proto_dot_tracking__pb2.MetricBatch.SerializeToString,
+            observatory_dot_proto_dot_tracking__pb2.RecordMetricsReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,19 +1,44 @@
 # Temporary name
-from flask import Flask, flash, request, redirect, url_for
+from flask import Flask, Response, flash, request, redirect, url_for
 import werkzeug
 from flask_restful import Api, Resource, reqparse, request
 from flask_jsonpify import jsonify
 from werkzeug import datastructures, secure_filename
-from observatory.sink import Sink
+from werkzeug.serving import BaseWSGIServer
+from observatory import settings
+from observatory.backends import create_sink
+from observatory.buffering import MetricBuffer
+from observatory.encoding import PACKED_CONTENT_TYPE, available_compressions, check_run, decode_packed, decompress
+from observatory.outputstore import etag, etag_matches, parse_content_range, parse_range, read_file
+from observatory.spool import IDEMPOTENCY_HEADER, RecentKeys, SharedRecentKeys
 from observatory.serving import ServingClient
+import functools
+import io
+import json
 import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from os.path import expanduser
 
-UPLOAD_FOLDER = expanduser('~') + '\\.observatory\\outputs'
+UPLOAD_FOLDER = os.path.join(expanduser('~'), '.observatory', 'outputs')
+# The worker processes of the server share the deduplication keys of the requests in this file.
+KEYS_FILE = os.path.join(expanduser('~'), '.observatory', 'recent-keys.sqlite')
 ALLOWED_EXTENSIONS = set(['txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'pkl'])
 
-sink = Sink()
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8
+
+# Streamed metrics are written to disk in batches of this size,
+# or when the oldest unwritten metric is older than the interval in seconds.
+STREAM_BATCH_SIZE = 100
+STREAM_FLUSH_INTERVAL = 1.0
+
+sink = create_sink(settings.backend)
 serving = ServingClient()
+recent_keys = RecentKeys()
 app = Flask(__name__)
 app.secret_key = '?secret?'  # this has to change, and be secret
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -35,6 +60,105 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+class DecompressingMiddleware:
+    """
+    Decompresses request bodies sent with a Content-Encoding, so the resources read them as if they were sent as is
+
+    Arguments:
+        app {callable} -- The WSGI application to pass the requests on to
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        coding = environ.get('HTTP_CONTENT_ENCODING', 'identity').strip().lower()
+
+        if coding == 'identity':
+            return self.app(environ, start_response)
+
+        if coding not in available_compressions():
+            return self.failure(environ, start_response, 415, 'Unsupported content coding: ' + coding)
+
+        length = environ.get('CONTENT_LENGTH')
+        data = environ['wsgi.input'].read(int(length)) if length else environ['wsgi.input'].read()
+
+        try:
+            body = decompress(data, coding)
+        except AssertionError as e:
+            return self.failure(environ, start_response, 400, str(e))
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def failure(environ, start_response, status, context):
+        response = Response(json.dumps({'status': 'failure', 'context': context}), status=status,
+                            mimetype='application/json',
+                            headers={'Accept-Encoding': ', '.join(available_compressions())})
+        return response(environ, start_response)
+
+
+app.wsgi_app = DecompressingMiddleware(app.wsgi_app)
+
+
+@app.after_request
+def advertise_compressions(response):
+    """
+    Lists the content codings the server can decode, clients only compress their requests after seeing them
+
+    Arguments:
+        response {flask.Response} -- The response to a request
+
+    Returns:
+        flask.Response -- The response with an Accept-Encoding header
+    """
+    response.headers['Accept-Encoding'] = ', '.join(available_compressions())
+    return response
+
+
+def deduplicated(post):
+    """
+    Records a request only once when a client sends it again with the same deduplication key.
+
+    Clients that spool requests send a key with every request, when the response of a request
+    got lost, the client sends it again and the repeated request is answered without recording it.
+    With several worker processes, the keys are shared through a database next to the metrics.
+
+    Arguments:
+        post {callable} -- The post method of a resource
+
+    Returns:
+        callable -- The post method that skips repeated requests
+    """
+    @functools.wraps(post)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        if key is None:
+            return post(*args, **kwargs)
+
+        # The key is reserved before the request is handled, so a copy that arrives in the meantime is skipped.
+        if not recent_keys.reserve(key):
+            return {'status': 'success', 'duplicate': True}, 201
+
+        try:
+            result = post(*args, **kwargs)
+        except BaseException:
+            recent_keys.release(key)
+            raise
+
+        if result[1] != 201:
+            recent_keys.release(key)
+
+        return result
+
+    return wrapper
+
+
 class Start(Resource):
     """
     This class is used to group all logic related to the start of a Run
@@ -47,6 +171,7 @@ class Start(Resource):
         Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
     """
 
+    @deduplicated
     def post(self):
         """
         This method handles the Post method
@@ -65,6 +190,10 @@ class Start(Resource):
         parser.add_argument("experiment")
         parser.add_argument("run")
         args = parser.parse_args()
+        try:
+            check_run(args["model"], args["version"], args["experiment"], args["run"])
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
         try:
             sink.record_session_start(args["model"], args["version"], args["experiment"], args["run"])
         except Exception:
@@ -83,6 +212,7 @@ class End(Resource):
         Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
 
     """
+    @deduplicated
     def post(self):
         """
         This method handles the Post method.
@@ -101,6 +231,10 @@ class End(Resource):
         parser.add_argument("run")
         parser.add_argument("status")
         args = parser.parse_args()
+        try:
+            check_run(args["model"], args["version"], args["experiment"], args["run"])
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
         try:
             sink.record_session_end(args["model"], args["version"], args["experiment"], args["run"], args["status"])
         except Exception as e:
@@ -257,6 +391,9 @@ class Run(Resource):
         """
         This method handles the Get method
 
+        The metrics can be limited to a range of steps or timestamps with the
+        start_step, end_step, start_time and end_time query parameters.
+
         Arguments:
             ID {str} -- The run ID
 
@@ -264,9 +401,17 @@ class Run(Resource):
             HTTP request -- When the function finishes it wil return a http status.
         """
         try:
-            data = serving.get_run(run)
+            data = serving.get_run(run,
+                                   start_step=request.args.get('start_step', type=int),
+                                   end_step=request.args.get('end_step', type=int),
+                                   start_time=request.args.get('start_time', type=float),
+                                   end_time=request.args.get('end_time', type=float))
+            for metric in data['metrics'].values():
+                metric['values'] = metric['values'].tolist()
+                metric['steps'] = metric['steps'].tolist()
+                metric['timestamps'] = metric['timestamps'].tolist()
         except Exception:
-            {'status': 'failure', 'context': 'Run was not found'}, 500
+            return {'status': 'failure', 'context': 'Run was not found'}, 500
         return {'status': 'succes', 'data': data}, 201
 
     def delete(self, run):
@@ -294,6 +439,7 @@ class Metric(Resource):
 
     """
 
+    @deduplicated
     def post(self, run):
         """
         This method handles the Post method
@@ -310,15 +456,154 @@ class Metric(Resource):
         parser.add_argument("experiment")
         parser.add_argument("name")
         parser.add_argument("value")
+        parser.add_argument("step", type=int)
+        parser.add_argument("timestamp", type=float)
         args = parser.parse_args()
 
         try:
-            sink.record_metric(args["model"], args["version"], args["experiment"], run, args["name"], args["value"])
+            check_run(args["model"], args["version"], args["experiment"], run)
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
+        try:
+            sink.record_metric(args["model"], args["version"], args["experiment"], run, args["name"], args["value"],
+                               args["step"], args["timestamp"])
         except Exception as e:
             return {'status': 'failure', 'context': 'Session could not be started'}, 500
         return {'status': 'success'}, 201
 
 
+class MetricBatch(Resource):
+    """
+    This class is used to record metrics in bulk
+
+    The metrics in a batch can belong to several runs. All metrics of one run
+    are written to disk with a single append to the file of that run.
+
+    Arguments:
+        Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
+
+    """
+
+    @deduplicated
+    def post(self):
+        """
+        This method handles the Post method
+        The body contains a list of metrics under the key metrics, every metric has
+        a model, version, experiment, run, name and value.
+        A batch of a single run can also be sent in the packed encoding.
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        if request.mimetype == PACKED_CONTENT_TYPE:
+            return self.post_packed()
+
+        body = request.get_json(silent=True)
+
+        if body is None or not isinstance(body.get('metrics'), list):
+            return {'status': 'failure', 'context': 'No list of metrics found'}, 400
+
+        runs = {}
+        try:
+            for metric in body['metrics']:
+                key = (metric['model'], metric['version'], metric['experiment'], metric['run'])
+                runs.setdefault(key, []).append(
+                    [metric['name'], metric['value'], metric.get('step'), metric.get('timestamp')])
+        except (KeyError, TypeError):
+            return {'status': 'failure', 'context': 'Metrics are incomplete'}, 400
+
+        try:
+            for run in runs:
+                check_run(*run)
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
+        try:
+            for (model, version, experiment, run), metrics in runs.items():
+                sink.record_metrics(model, version, experiment, run, metrics)
+        except Exception:
+            return {'status': 'failure', 'context': 'Metrics could not be recorded'}, 500
+        return {'status': 'success', 'recorded': len(body['metrics'])}, 201
+
+    def post_packed(self):
+        """
+        Records a batch of metrics of a single run in the packed encoding
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        try:
+            model, version, experiment, run, metrics = decode_packed(request.get_data())
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
+        try:
+            sink.record_metrics(model, version, experiment, run, metrics)
+        except Exception:
+            return {'status': 'failure', 'context': 'Metrics could not be recorded'}, 500
+        return {'status': 'success', 'recorded': len(metrics)}, 201
+
+
+class MetricStream(Resource):
+    """
+    This class is used to record a stream of metrics for a single run
+
+    The client keeps the request open for the duration of the run and sends
+    the metrics as newline-delimited JSON, every line holds a name and a value.
+    The metrics are written to disk while the request is still coming in.
+
+    Arguments:
+        Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
+
+    """
+
+    def post(self, run):
+        """
+        This method handles the Post method
+        The model, version and experiment of the run are passed in the query string.
+
+        Arguments:
+            run {str} -- The run ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        model = request.args.get('model')
+        version = request.args.get('version')
+        experiment = request.args.get('experiment')
+
+        try:
+            check_run(model, version, experiment, run)
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
+        buffer = MetricBuffer(STREAM_BATCH_SIZE, STREAM_FLUSH_INTERVAL)
+        recorded = 0
+
+        try:
+            for line in request.stream:
+                if not line.strip():
+                    continue
+
+                metric = json.loads(line)
+
+                if buffer.append([metric['name'], metric['value'], metric.get('step'), metric.get('timestamp')]):
+                    recorded += len(buffer)
+                    sink.record_metrics(model, version, experiment, run, buffer.drain())
+
+            recorded += len(buffer)
+            sink.record_metrics(model, version, experiment, run, buffer.drain())
+        except (ValueError, KeyError, TypeError):
+            # Keep everything that was valid up to the broken line.
+            recorded += len(buffer)
+            sink.record_metrics(model, version, experiment, run, buffer.drain())
+            return {'status': 'failure', 'context': 'Invalid metric after ' + str(recorded) + ' metrics'}, 400
+        except Exception:
+            return {'status': 'failure', 'context': 'Metrics could not be recorded'}, 500
+        return {'status': 'success', 'recorded': recorded}, 201
+
+
 class Setting(Resource):
     """
     This class is used to group all logic related to the Settings of a Run
@@ -343,6 +628,7 @@ class Setting(Resource):
         
         return 500
 
+    @deduplicated
     def post(self, run):
         """
         This method handles the Post method
@@ -360,6 +646,11 @@ class Setting(Resource):
         parser.add_argument("settings")
         args = parser.parse_args()
 
+        try:
+            check_run(args["model"], args["version"], args["experiment"], run)
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
         try:
             sink.record_settings(args["model"], args["version"], args["experiment"], run, args["settings"])
         except Exception:
@@ -392,7 +683,11 @@ class Output(Resource):
 
     def get(self, run):
         """
-        This method handles the Get method
+        This method handles the Get method, it downloads an output of the run
+
+        The file is streamed from disk in chunks. The ETag of the file is the hash of its contents,
+        so a client that already has the file gets a 304 when it sends the ETag in If-None-Match.
+        A part of the file can be requested with a Range header, to continue an interrupted download.
 
         Arguments:
             run {str} -- The run ID
@@ -400,7 +695,47 @@ class Output(Resource):
         Returns:
             HTTP request -- When the function finishes it wil return a http status.
         """
-        return 500
+        try:
+            outputs = serving.get_output(run)
+        except AssertionError:
+            return {'status': 'failure', 'context': 'Invalid run ID'}, 400
+
+        filename = request.args.get('filename')
+        if filename is None and len(outputs) == 1:
+            filename = next(iter(outputs))
+
+        if filename not in outputs:
+            return {'status': 'failure', 'context': 'Output was not found', 'outputs': sorted(outputs)}, 404
+
+        output = outputs[filename]
+        headers = {
+            'ETag': etag(output['hash']),
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': f'attachment; filename="{secure_filename(filename)}"'
+        }
+
+        if etag_matches(request.headers.get('If-None-Match'), output['hash']):
+            return Response(status=304, headers=headers)
+
+        byte_range = None
+        # A range is only sent when the client's copy is still the same file, If-Range uses the strong comparison.
+        if request.headers.get('If-Range', etag(output['hash'])).strip() == etag(output['hash']):
+            try:
+                byte_range = parse_range(request.headers.get('Range'), output['size'])
+            except AssertionError:
+                headers['Content-Range'] = f'bytes */{output["size"]}'
+                return Response(status=416, headers=headers)
+
+        if byte_range is None:
+            headers['Content-Length'] = str(output['size'])
+            return Response(read_file(output['path']), status=200, headers=headers,
+                            mimetype='application/octet-stream', direct_passthrough=True)
+
+        first, last = byte_range
+        headers['Content-Range'] = f'bytes {first}-{last}/{output["size"]}'
+        headers['Content-Length'] = str(last - first + 1)
+        return Response(read_file(output['path'], first, last), status=206, headers=headers,
+                        mimetype='application/octet-stream', direct_passthrough=True)
 
     def post(self, run):
         """
@@ -423,7 +758,24 @@ class Output(Resource):
             return {'status': 'failure', 'context': 'No valid file name'}, 500
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+            try:
+                check_run(request.form.get('model'), request.form.get('version'), request.form.get('experiment'), run)
+            except AssertionError as e:
+                return {'status': 'failure', 'context': str(e)}, 400
+
+            # The upload is stored in a temporary file first,
+            # the sink moves it into the content-addressed output store.
+            handle, temp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'])
+            try:
+                with os.fdopen(handle, 'wb') as f:
+                    file.save(f)
+                sink.record_output(request.form.get('model'), request.form.get('version'),
+                                   request.form.get('experiment'), run, filename, temp_path)
+            except Exception:
+                return {'status': 'failure', 'context': 'Output could not be recorded'}, 500
+            finally:
+                os.remove(temp_path)
             return {'status': 'succes'}, 201
         else:
             return {'status': 'failure', 'context': 'File type not allowed'}, 500
@@ -438,15 +790,265 @@ class Output(Resource):
         Returns:
             HTTP request -- When the function finishes it wil return a http status.
         """
-        return 500
+        return serving.delete_output(run)
+
+class OutputUpload(Resource):
+    """
+    This class is used to start chunked uploads of the Outputs of a Run
+
+    Large outputs are uploaded in three steps: the upload is started here,
+    the chunks are sent to the Upload resource and the upload is finished
+    with the checksum of the complete file.
+
+    Arguments:
+        Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
+
+    """
+
+    def post(self, run):
+        """
+        This method handles the Post method
+
+        Arguments:
+            run {str} -- The run ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        body = request.get_json(silent=True)
+
+        if body is None or not body.get('filename'):
+            return {'status': 'failure', 'context': 'No file name found'}, 400
+
+        try:
+            check_run(body.get('model'), body.get('version'), body.get('experiment'), run)
+        except AssertionError as e:
+            return {'status': 'failure', 'context': str(e)}, 400
+
+        try:
+            upload_id = sink.begin_output_upload(body.get('model'), body.get('version'), body.get('experiment'),
+                                                 run, secure_filename(body['filename']), body.get('size'))
+        except Exception:
+            return {'status': 'failure', 'context': 'Upload could not be started'}, 500
+        return {'status': 'success', 'upload': upload_id, 'offset': 0}, 201
+
+
+class Upload(Resource):
+    """
+    This class is used to receive the chunks of an Output upload
+
+    Chunks are streamed from the request straight to disk, so the server never keeps
+    a chunk in memory. When an upload is interrupted, the client asks how much was
+    received with a GET and continues from there.
+
+    Arguments:
+        Resource {flask_restful.Resource} -- Represents an abstract RESTful resource
+
+    """
+
+    def get(self, upload_id):
+        """
+        This method handles the Get method, it returns the number of bytes received so far
+
+        Arguments:
+            upload_id {str} -- The upload ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        try:
+            return {'status': 'success', 'offset': sink.output_upload_offset(upload_id)}, 200
+        except AssertionError:
+            return {'status': 'failure', 'context': 'Upload was not found'}, 404
+
+    def put(self, upload_id):
+        """
+        This method handles the Put method, it appends a chunk to the upload
+
+        The position of the chunk is given in the Content-Range header.
+
+        Arguments:
+            upload_id {str} -- The upload ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        offset = parse_content_range(request.headers.get('Content-Range'))
+
+        if offset is None:
+            return {'status': 'failure', 'context': 'No valid Content-Range header found'}, 400
+
+        try:
+            current = sink.output_upload_offset(upload_id)
+        except AssertionError:
+            return {'status': 'failure', 'context': 'Upload was not found'}, 404
+
+        if offset != current:
+            return {'status': 'failure', 'context': 'Chunk does not continue the upload', 'offset': current}, 409
+
+        try:
+            return {'status': 'success', 'offset': sink.write_output_chunk(upload_id, offset, request.stream)}, 200
+        except Exception:
+            return {'status': 'failure', 'context': 'Chunk could not be written',
+                    'offset': sink.output_upload_offset(upload_id)}, 500
+
+    def post(self, upload_id):
+        """
+        This method handles the Post method, it finishes the upload
+
+        Arguments:
+            upload_id {str} -- The upload ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        body = request.get_json(silent=True)
+
+        if body is None or not body.get('checksum'):
+            return {'status': 'failure', 'context': 'No checksum found'}, 400
+
+        try:
+            digest = sink.finish_output_upload(upload_id, body['checksum'])
+        except (AssertionError, FileNotFoundError):
+            return {'status': 'failure', 'context': 'Upload was not found'}, 404
+        except RuntimeError:
+            return {'status': 'failure', 'context': 'Checksum does not match, the upload was discarded'}, 422
+        return {'status': 'success', 'hash': digest}, 201
+
+    def delete(self, upload_id):
+        """
+        This method handles the Delete method, it discards the upload
+
+        Arguments:
+            upload_id {str} -- The upload ID
+
+        Returns:
+            HTTP request -- When the function finishes it wil return a http status.
+        """
+        try:
+            sink.abort_output_upload(upload_id)
+        except AssertionError:
+            return {'status': 'failure', 'context': 'Upload was not found'}, 404
+        return {'status': 'success'}, 200
+
 
 api.add_resource(Model, "/api/models/<string:model>")
 api.add_resource(Version, "/api/versions/<string:id>")
 api.add_resource(Experiment, "/api/experiments/<string:name>")
 api.add_resource(Run, "/api/run/<string:run>")
 api.add_resource(Metric, "/api/metrics/<string:run>")
+api.add_resource(MetricBatch, "/api/metrics/")
+api.add_resource(MetricStream, "/api/metrics/<string:run>/stream")
 api.add_resource(Setting, "/api/settings/<string:run>")
 api.add_resource(Output, "/api/output/<string:run>")
+api.add_resource(OutputUpload, "/api/output/<string:run>/uploads")
+api.add_resource(Upload, "/api/uploads/<string:upload_id>")
 api.add_resource(Start, "/api/start/")
 api.add_resource(End, "/api/end/")
-app.run(debug=True)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    A WSGI server that handles requests on a fixed pool of threads
+
+    Unlike the threaded development server, which starts a thread for every request,
+    the number of requests handled at the same time is bounded by the size of the pool.
+    Closing the server waits for the requests that are being handled.
+
+    Arguments:
+        BaseWSGIServer {werkzeug.serving.BaseWSGIServer} -- The single-threaded werkzeug server
+    """
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='observatory-server')
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        self._pool.shutdown(wait=True)
+        super().server_close()
+
+
+def run(host=DEFAULT_HOST, port=DEFAULT_PORT, threads=DEFAULT_THREADS, workers=1, debug=False):
+    """
+    Runs the tracking server until it receives SIGINT or SIGTERM
+
+    The server listens with a pool of threads in every worker process. The worker processes
+    share the listening socket, the operating system hands each connection to one of them.
+    On shutdown, the server stops accepting connections, finishes the requests that are being
+    handled and writes the summaries of the runs that are still open.
+
+    Keyword Arguments:
+        host {str} -- The address to listen on (default: {DEFAULT_HOST})
+        port {int} -- The port to listen on (default: {DEFAULT_PORT})
+        threads {int} -- The number of requests handled at the same time per worker (default: {DEFAULT_THREADS})
+        workers {int} -- The number of worker processes, more than one requires fork (default: {1})
+        debug {bool} -- Run the flask development server with the debugger and reloader instead (default: {False})
+    """
+    if debug:
+        app.run(host=host, port=port, debug=True)
+        return
+
+    if threads < 1 or workers < 1:
+        raise AssertionError('threads and workers must be greater than zero')
+
+    if workers > 1 and not hasattr(os, 'fork'):
+        raise AssertionError('Multiple workers are not supported on this platform, use threads instead')
+
+    if workers > 1:
+        # A repeated request can reach another worker than the first one.
+        globals()['recent_keys'] = SharedRecentKeys(KEYS_FILE)
+
+    server = PooledWSGIServer(host, port, app, threads)
+    children = []
+    forked = False
+
+    # The socket is bound before forking, so all workers accept connections on it.
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = []
+            forked = True
+            break
+        children.append(pid)
+
+    def stop(signum, frame):
+        # shutdown waits for serve_forever to return, so it can't run on the thread that serves.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f' * Observatory server worker {os.getpid()} listening on http://{host}:{port}')
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        sink.close()
+
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        # A forked worker must not return into the code that started the server.
+        if forked:
+            os._exit(0)
+
+
+if __name__ == '__main__':
+    run()
@@ -1,12 +1,16 @@
-import re
+import os
 import tempfile
 from abc import ABC, abstractmethod
 import numpy as np
+from collections import OrderedDict
+from datetime import datetime
 
 import requests
 from observatory import settings
 from observatory.archive import Archive
-from observatory.constants import LABEL_PATTERN
+from observatory.constants import is_valid_label, is_valid_run_id, is_valid_version
+from observatory.metricfile import NO_STEP, RECORD_DTYPE
+from observatory.outputstore import copy_file
 
 
 class ServingClient:
@@ -23,53 +27,133 @@ class ServingClient:
     """
 
 
-    def __init__(self):
-        self._path = Archive.check_for_home_directory(self)
+    def __init__(self, base_path=None):
+        """
+        Keyword Arguments:
+            base_path {str} -- The directory the data is stored in, like the base path of the Sink
+                               (default: {the .observatory directory in the home directory})
+        """
+        if base_path is None:
+            self._path = Archive.check_for_home_directory(self)
+        else:
+            self._path = os.path.join(base_path, 'metrics')
 
-    def check_for_metrics(self, data):
-        x = []
-        for d in data:
-            x.append(d[0])
-        metrics = list(set(x))
+    def group_metrics(self, names, ids, values, steps=None, timestamps=None):
+        """
+        Groups the values of a run by metric in a single pass
+
+        The records are sorted by metric id once, after which the count, minimum,
+        maximum, mean and last value of every metric are computed in vectorized form.
+
+        Arguments:
+            names {list} -- The metric names, the position in the list is the id of the metric
+            ids {numpy.ndarray} -- The metric id of every record
+            values {numpy.ndarray} -- The value of every record
+            steps {numpy.ndarray} -- The step of every record, grouped along with the values when given
+            timestamps {numpy.ndarray} -- The timestamp of every record, grouped along with the values when given
+
+        Returns:
+            OrderedDict -- The values and statistics per metric name,
+                           in the order in which the metrics were first recorded
+        """
+        metrics = OrderedDict()
+        if len(ids) == 0:
+            return metrics
+
+        # A stable sort keeps the values of each metric in the order they were recorded.
+        order = np.argsort(ids, kind='stable')
+        grouped = values[order]
+        group_ids, starts, counts = np.unique(ids[order], return_index=True, return_counts=True)
+        ends = starts + counts
+
+        minimum = np.minimum.reduceat(grouped, starts)
+        maximum = np.maximum.reduceat(grouped, starts)
+        mean = np.add.reduceat(grouped, starts) / counts
+        last = grouped[ends - 1]
+
+        grouped_steps = None if steps is None else steps[order]
+        grouped_timestamps = None if timestamps is None else timestamps[order]
+
+        for group in np.argsort(order[starts], kind='stable'):
+            metric = {
+                'values': grouped[starts[group]:ends[group]],
+                'count': int(counts[group]),
+                'min': float(minimum[group]),
+                'max': float(maximum[group]),
+                'mean': float(mean[group]),
+                'last': float(last[group])
+            }
+            if grouped_steps is not None:
+                metric['steps'] = grouped_steps[starts[group]:ends[group]]
+            if grouped_timestamps is not None:
+                metric['timestamps'] = grouped_timestamps[starts[group]:ends[group]]
+            metrics[names[group_ids[group]]] = metric
         return metrics
 
-    def separate_data(self, data, metrics):
-        collection = []
-        for m in metrics:
-            mlist = []
-            for d in data:
-                if d[0] == m:
-                    mlist.append(d[1])
-            collection.append(mlist)
-        return collection
-        
-    def structure_metrics(self, input):
-        params = []
-        startTime = str(input[0][4])
-        input.pop(0)
-        endTime = str(input[-1][1])
-        status = input[-1][0]
-        del input[-1]
-        metrics = self.check_for_metrics(input)
-        data = self.separate_data(input, metrics)
-        params.append([metrics, startTime, endTime, status])
-        return [data, params]
+    def structure_run(self, records, reader=None, summary=None, **ranges):
+        """
+        Structures the recorded data of a run
+
+        Arguments:
+            records {list} -- The pickled session records of the run
+            reader {MetricFileReader} -- The reader for the metrics of the run, if any
+            summary {OrderedDict} -- Precomputed statistics per metric, used instead of the reader
+
+        Keyword Arguments:
+            start_step, end_step, start_time, end_time -- Only structure the metrics within these ranges,
+                                                          see MetricFileReader.select
+
+        Returns:
+            dict -- The start time, end time and status of the run,
+                    and the values and statistics per metric
+        """
+        run = {'start': str(records[0][4]), 'end': '', 'status': 'RUNNING'}
+        pickled = records[1:]
+
+        if len(records) > 1 and isinstance(records[-1][-1], datetime):
+            run['end'] = str(records[-1][1])
+            run['status'] = records[-1][0]
+            pickled = records[1:-1]
+
+        if summary is not None:
+            run['metrics'] = summary
+        elif reader is not None:
+            selected = reader.select(**ranges)
+            run['metrics'] = self.group_metrics(reader.names, selected['id'], selected['value'],
+                                                selected['step'], selected['timestamp'])
+        else:
+            # Runs recorded by older versions have their metrics pickled in the session records,
+            # without a step or timestamp.
+            metric_ids = {}
+            selected = np.empty(len(pickled), dtype=RECORD_DTYPE)
+            selected['id'] = np.fromiter((metric_ids.setdefault(name, len(metric_ids)) for name, _ in pickled),
+                                         dtype=np.int64, count=len(pickled))
+            selected['value'] = [value for _, value in pickled]
+            selected['step'] = NO_STEP
+            selected['timestamp'] = np.nan
+
+            if any(bound is not None for bound in ranges.values()):
+                selected = selected[:0]
+
+            run['metrics'] = self.group_metrics(list(metric_ids), selected['id'], selected['value'],
+                                                selected['step'], selected['timestamp'])
+
+        return run
 
     def validate_model(self, model):
-        print(model)
-        if model is model.strip() == '' or not re.match('^[a-z0-9-]*$', model):
+        if not is_valid_label(model):
             raise AssertionError('The model name contains lower-case alpha-numeric characters and dashes only')
 
         return True
 
     def validate_version(self, version):
-        if version is version.strip() == '' or not re.match('^[0-9]*$', version):
+        if not is_valid_version(version):
             raise AssertionError('Version van containt numeric characters only')
         
         return True
 
     def validate_experiment(self, experiment):
-        if experiment is experiment.strip() == '' or not re.match('^[a-z0-9-]*$', experiment):
+        if not is_valid_label(experiment):
             raise AssertionError('The experiment name contains lower-case alpha-numeric characters and dashes only')
 
         return True
@@ -77,16 +161,46 @@ class ServingClient:
     def validate_run(self, run):
         if len(run) != 8:
             raise AssertionError("Run_id to long or to short, it should be 8 charslong")
-        if run is run.strip() == ''  or not re.match('^[a-z0-9]*$', run):
+        if not is_valid_run_id(run):
             raise AssertionError('Run_id cannot contain uppercase letters/dashes/underscores')
 
         return True
 
 
-    def get_run(self, run_id):
+    def get_run(self, run_id, start_step=None, end_step=None, start_time=None, end_time=None):
+        """
+        Gets the recorded data of a run
+
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+
+        Keyword Arguments:
+            start_step {int} -- The first step to include (default: {None})
+            end_step {int} -- The step to stop at, this step is not included (default: {None})
+            start_time {float} -- The earliest timestamp to include (default: {None})
+            end_time {float} -- The timestamp to stop at, this timestamp is not included (default: {None})
+
+        Returns:
+            dict -- The start time, end time and status of the run,
+                    and the values, steps, timestamps and statistics per metric
+        """
+        if self.validate_run(run_id):
+            records, reader = Archive.open_run(run_id, self._path)
+            return self.structure_run(records, reader, start_step=start_step, end_step=end_step,
+                                      start_time=start_time, end_time=end_time)
+
+    def get_summary(self, run_id):
+        """
+        Gets the statistics of every metric of a run, without the values.
+
+        The statistics come from the summary that is maintained while the metrics
+        are recorded, so this doesn't read the records of the run.
+        When there is no up-to-date summary, they are computed from the records.
+        """
         if self.validate_run(run_id):
-            run = Archive.get_run(run_id, self._path)
-            return self.structure_metrics(run)
+            records, reader = Archive.open_run(run_id, self._path)
+            summary = reader.summary() if reader is not None else None
+            return self.structure_run(records, reader, summary)
 
     def get_all_models(self):
         models = Archive.get_all_models(Archive, self._path)
@@ -129,7 +243,36 @@ class ServingClient:
 
     def get_output(self, run_id):
         if self.validate_run(run_id):
-            return Archive.get_output(run_id)
+            return Archive.get_output(run_id, self._path)
+
+    def download_output(self, run_id, destination, filename=None):
+        """
+        Copies the outputs of a run to a directory
+
+        Arguments:
+            run_id {str} -- The first 8 characters of the run id
+            destination {str} -- The directory to copy the outputs to
+
+        Keyword Arguments:
+            filename {str} -- Only copy the output with this filename (default: {None})
+
+        Returns:
+            list -- The locations of the copied files
+        """
+        outputs = self.get_output(run_id)
+
+        if filename is not None:
+            if filename not in outputs:
+                raise AssertionError(f'Run {run_id} has no output named {filename}')
+            outputs = {filename: outputs[filename]}
+
+        os.makedirs(destination, exist_ok=True)
+        copied = []
+        for name, output in outputs.items():
+            target = os.path.join(destination, os.path.basename(name))
+            copy_file(output['path'], target)
+            copied.append(target)
+        return copied
 
     def delete_settings(self, run_id):
         if self.validate_run(run_id):
@@ -137,7 +280,7 @@ class ServingClient:
 
     def delete_output(self, run_id):
         if self.validate_run(run_id):
-            return Archive.delete_output(run_id)
+            return Archive.delete_output(run_id, self._path)
 
     def filter_metrics(self, left, right):
         metric_matches = set(left) & set(right)
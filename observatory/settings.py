@@ -1,20 +1,214 @@
+from observatory.backends import DEFAULT_BACKEND, backend_names
+from observatory.buffering import BACKPRESSURE_POLICIES
+from observatory.encoding import COMPRESSIONS, ENCODINGS
+
 server_url = "http://127.0.0.1:5000/api"
 state = "local"
 
+# The number of metrics collected in memory before they are written in one go.
+# A buffer size of 1 disables buffering, every metric is written immediately.
+buffer_size = 1
+
+# The number of seconds after which the buffer is written, checked whenever a metric is recorded.
+# A buffer isn't written on a timer, call flush on the session to write it during a long pause.
+flush_interval = 5.0
+
+# When enabled, metrics are written on a background thread instead of the training loop.
+async_writes = False
+
+# The maximum number of metrics waiting for the background thread, or for the metric stream of a remote run.
+queue_size = 10000
+
+# What to do when the queue of the background thread is full: block, drop-oldest or drop-newest.
+backpressure = 'block'
+
+# The number of connections kept alive to the tracking server.
+pool_size = 10
+
+# The number of seconds to wait for a connection to and a response from the tracking server.
+connect_timeout = 5.0
+read_timeout = 30.0
+
+# When enabled, remote runs stream their metrics to the server over a single long-lived request.
+streaming = False
+
+# The number of bytes sent per request when uploading an output to the tracking server.
+upload_chunk_size = 8 * 1024 * 1024
+
+# The address of the gRPC tracking service, used when the state is 'grpc'.
+grpc_target = '127.0.0.1:50051'
+
+# When enabled, requests that can't be delivered to the tracking server are spooled to disk and retried later.
+spooling = False
+
+# The directory to spool requests in, by default the spool folder in the .observatory directory.
+spool_path = None
+
+# The maximum number of bytes a process spools, requests are dropped when the spool is full.
+spool_size = 64 * 1024 * 1024
 
-def configure(change_state):
+# The number of seconds to wait before replaying the spool again, this doubles after every failed attempt.
+retry_interval = 1.0
+max_retry_interval = 60.0
+
+# The content coding to compress requests with, gzip or zstd, once the server reports it can decode it.
+compression = None
+
+# The encoding of batches of metrics sent to the tracking server, json or packed.
+encoding = 'json'
+
+# The storage backend that records local runs and the runs sent to a tracking server, see observatory.backends.
+backend = DEFAULT_BACKEND
+
+
+def configure(change_state=None, buffer_size=None, flush_interval=None,
+              async_writes=None, queue_size=None, backpressure=None,
+              pool_size=None, connect_timeout=None, read_timeout=None, streaming=None,
+              upload_chunk_size=None, grpc_target=None, spooling=None, spool_path=None, spool_size=None,
+              retry_interval=None, max_retry_interval=None, compression=None, encoding=None, backend=None):
     """
     Configures the observatory environment.
     The following settings can be configured:
 
     Parameters
     ----------
-    url : string
-        The URL to connect to for tracking session information
-    models_path : string
-        The path where models should be stored
+    change_state : string, optional
+        The state to track runs in, either 'local', 'remote' or 'grpc'
+    buffer_size : int, optional
+        The number of metrics to collect before writing them in one batch
+    flush_interval : float, optional
+        The number of seconds after which the metric buffer is written by the next recorded metric
+    async_writes : bool, optional
+        Write metrics on a background thread instead of the training loop
+    queue_size : int, optional
+        The maximum number of metrics waiting to be written by the background thread or the metric stream
+    backpressure : string, optional
+        What to do when the queue is full: 'block', 'drop-oldest' or 'drop-newest'
+    pool_size : int, optional
+        The number of connections kept alive to the tracking server
+    connect_timeout : float, optional
+        The number of seconds to wait for a connection to the tracking server
+    read_timeout : float, optional
+        The number of seconds to wait for a response from the tracking server
+    streaming : bool, optional
+        Stream the metrics of remote runs over a single long-lived request
+    upload_chunk_size : int, optional
+        The number of bytes sent per request when uploading an output
+    grpc_target : string, optional
+        The address of the gRPC tracking service, as host:port
+    spooling : bool, optional
+        Spool requests to disk when the tracking server can't be reached and replay them later
+    spool_path : string, optional
+        The directory to spool requests in
+    spool_size : int, optional
+        The maximum number of bytes a process spools
+    retry_interval : float, optional
+        The number of seconds to wait before the first replay of the spool
+    max_retry_interval : float, optional
+        The maximum number of seconds between two replays of the spool
+    compression : string, optional
+        Compress requests to the tracking server with 'gzip' or 'zstd', 'none' turns compression off
+    encoding : string, optional
+        Send batches of metrics as 'json' or in the compact 'packed' encoding
+    backend : string, optional
+        The storage backend to record runs with: 'files', 'sqlite', 'pytables' or a registered backend
     """
     global state
 
-    if change_state == 'local' or 'remote':
+    # The names of the arguments shadow the module level settings,
+    # so these settings are assigned through the module globals.
+    if change_state in ('local', 'remote', 'grpc'):
         state = change_state
+
+    if buffer_size is not None:
+        if buffer_size < 1:
+            raise AssertionError('buffer_size must be greater than zero')
+
+        globals()['buffer_size'] = buffer_size
+
+    if flush_interval is not None:
+        if flush_interval < 0:
+            raise AssertionError('flush_interval can not be negative')
+
+        globals()['flush_interval'] = flush_interval
+
+    if async_writes is not None:
+        globals()['async_writes'] = bool(async_writes)
+
+    if queue_size is not None:
+        if queue_size < 1:
+            raise AssertionError('queue_size must be greater than zero')
+
+        globals()['queue_size'] = queue_size
+
+    if backpressure is not None:
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise AssertionError('backpressure must be one of: ' + ', '.join(BACKPRESSURE_POLICIES))
+
+        globals()['backpressure'] = backpressure
+
+    if pool_size is not None:
+        if pool_size < 1:
+            raise AssertionError('pool_size must be greater than zero')
+
+        globals()['pool_size'] = pool_size
+
+    if connect_timeout is not None:
+        globals()['connect_timeout'] = connect_timeout
+
+    if read_timeout is not None:
+        globals()['read_timeout'] = read_timeout
+
+    if streaming is not None:
+        globals()['streaming'] = bool(streaming)
+
+    if upload_chunk_size is not None:
+        if upload_chunk_size < 1:
+            raise AssertionError('upload_chunk_size must be greater than zero')
+
+        globals()['upload_chunk_size'] = upload_chunk_size
+
+    if grpc_target is not None:
+        globals()['grpc_target'] = grpc_target
+
+    if spooling is not None:
+        globals()['spooling'] = bool(spooling)
+
+    if spool_path is not None:
+        globals()['spool_path'] = spool_path
+
+    if spool_size is not None:
+        if spool_size < 1:
+            raise AssertionError('spool_size must be greater than zero')
+
+        globals()['spool_size'] = spool_size
+
+    if retry_interval is not None:
+        if retry_interval <= 0:
+            raise AssertionError('retry_interval must be greater than zero')
+
+        globals()['retry_interval'] = retry_interval
+
+    if max_retry_interval is not None:
+        if max_retry_interval <= 0:
+            raise AssertionError('max_retry_interval must be greater than zero')
+
+        globals()['max_retry_interval'] = max_retry_interval
+
+    if compression is not None:
+        if compression not in ('none',) + COMPRESSIONS:
+            raise AssertionError('compression must be one of: none, ' + ', '.join(COMPRESSIONS))
+
+        globals()['compression'] = None if compression == 'none' else compression
+
+    if encoding is not None:
+        if encoding not in ENCODINGS:
+            raise AssertionError('encoding must be one of: ' + ', '.join(ENCODINGS))
+
+        globals()['encoding'] = encoding
+
+    if backend is not None:
+        if backend not in backend_names():
+            raise AssertionError('backend must be one of: ' + ', '.join(backend_names()))
+
+        globals()['backend'] = backend
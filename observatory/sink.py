@@ -3,38 +3,77 @@ from os import path, makedirs
 import os
 from os.path import expanduser
 import pickle
+import threading
 from datetime import datetime
 from pathlib import Path
+from collections import OrderedDict
+
+from observatory.index import RunIndex
+from observatory.locking import locked
+from observatory.metricdb import MetricDatabase
+from observatory.metricfile import MetricFileWriter
+from observatory.metrictable import MetricTableWriter, _import_tables
+from observatory.outputstore import OutputStore
+
+# The number of runs for which the sink keeps the metric names in memory.
+MAX_OPEN_RUNS = 128
 
 
 class Sink():
     """
-    This class handles all the saving of the data using Pickle.
-    The Pickle protocol being used is the highest possible protocol (-1)
+    This class handles all the saving of the data of runs.
+
+    The metrics of a run are appended to binary metric files in the metrics directory, see the metricfile module.
+    Runs are listed in a SQLite index next to them, so models, versions and experiments are found
+    without scanning the directory, see the index module. Outputs go into a content-addressed store
+    in the outputs directory, see the outputstore module.
+    The start and end of a session and the settings of a run are pickled with the highest protocol (-1).
     """
 
-    def __init__(self):
+    # The class that writes the metrics of a run, see the metricfile module.
+    metric_writer = MetricFileWriter
+
+    def __init__(self, base_path=None):
+        """
+        Initializes the sink
+
+        Parameters
+        ----------
+        base_path : str, optional
+            The directory to store the data in, defaults to the .observatory directory
+            in the home directory of the current user.
+        """
         # this module depends on the .observatory directory.
         # So we need to make sure it exists.
-        home = expanduser("~")
-        if os.path.exists(home + "\\.observatory"):
-            # if it exists the path will be set
-            self._path = (home + "\\.observatory\\")
-        else:
-            try:
-                # if it doesn't exist, then it will be created,
-                # along with subfolders for metrics, outputs and settings.
-                os.makedirs(home + "\\.observatory")
-                os.makedirs(home + "\\.observatory\\metrics")
-                os.makedirs(home + "\\.observatory\\outputs")
-                os.makedirs(home + "\\.observatory\\settings")
-                self._path = (home + "\\.observatory\\")
-            except PermissionError as e:
-                # if the acces to the home directory is denied,
-                # a folder in the current repo will be made and used.
-                os.makedirs("\\.observatory")
-                self._path = ("\\.observatory\\")
-                pass
+        if base_path is None:
+            base_path = path.join(expanduser("~"), ".observatory")
+
+        try:
+            # the directory is created if it doesn't exist,
+            # along with subfolders for metrics, outputs and settings.
+            for folder in ('metrics', 'outputs', 'settings'):
+                os.makedirs(path.join(base_path, folder), exist_ok=True)
+        except PermissionError as e:
+            # if the acces to the home directory is denied,
+            # a folder in the current repo will be made and used.
+            base_path = ".observatory"
+
+            for folder in ('metrics', 'outputs', 'settings'):
+                os.makedirs(path.join(base_path, folder), exist_ok=True)
+
+        self._path = base_path
+        self._metric_writers = OrderedDict()
+        self._writers_lock = threading.Lock()
+        self._index = RunIndex(path.join(base_path, 'metrics'))
+        self._outputs = OutputStore(path.join(base_path, 'outputs'))
+
+    def _run_file(self, folder, model, version, experiment, run_id, extension='.pkl'):
+        """
+        Gets the location of the file holding the data for a run
+        """
+        file_name = model + '_v' + str(version) + '_' + experiment + '_' + run_id + extension
+
+        return path.join(self._path, folder, file_name)
 
     def write_data_to_filestream(self, file_stream, data):
         """
@@ -44,7 +83,32 @@ class Sink():
         """
         pickle.dump(data, file_stream, -1)
 
-    def record_metric(self, model, version, experiment, run_id, metric_name, metric_value):
+    def _metric_writer(self, model, version, experiment, run_id):
+        """
+        Gets the writer for the metric files of a run.
+
+        Writers are kept for the most recently used runs, so the metric names
+        of a run don't have to be read from disk for every write.
+        """
+        base_path = self._run_file('metrics', model, version, experiment, run_id, extension='')
+
+        # The server records metrics from several threads, they share the writers of the sink.
+        with self._writers_lock:
+            writer = self._metric_writers.pop(base_path, None)
+
+            if writer is None:
+                writer = self.metric_writer(base_path)
+
+                if len(self._metric_writers) >= MAX_OPEN_RUNS:
+                    _, evicted = self._metric_writers.popitem(last=False)
+                    evicted.close()
+
+            self._metric_writers[base_path] = writer
+
+        return writer
+
+    def record_metric(self, model, version, experiment, run_id, metric_name, metric_value,
+                      step=None, timestamp=None):
         """
         Records a metric value.
 
@@ -66,12 +130,39 @@ class Sink():
             The name of the metric
         metric_value : float
             The value of the metric
+        step : int, optional
+            The step the value belongs to
+        timestamp : float, optional
+            The moment the value was recorded, as a unix timestamp. Defaults to the current time.
+        """
+        self.record_metrics(model, version, experiment, run_id, [[metric_name, metric_value, step, timestamp]])
+
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metric values.
+
+        The metrics are stored in the compact binary format of the metricfile module.
+        All metrics in the batch are packed in memory first and appended to the
+        metrics file of the run with a single write.
+
+        Parameters
+        ----------
+        model : string
+            The name of the model
+        version : int
+            The version number of the model
+        experiment : string
+            The name of the experiment
+        run_id : string
+            The ID of the run
+        metrics : list
+            The metrics to record, as [metric_name, metric_value, step, timestamp] lists.
+            The step and timestamp can be left out.
         """
-        metric = [metric_name, metric_value]
+        if not metrics:
+            return
 
-        file_name = self._path + "metrics\\" + model + '_v' + str(version) + '_' + experiment + '_' + run_id + '.pkl'
-        with open(file_name, 'ab') as fileObject:
-            self.write_data_to_filestream(fileObject, metric)
+        self._metric_writer(model, version, experiment, run_id).append(metrics)
 
     def record_session_start(self, model, version, experiment, run_id):
         """
@@ -95,9 +186,13 @@ class Sink():
         """
         data = [model, version, experiment, run_id, datetime.now()]
 
-        file_name = self._path + "metrics\\" + model + '_v' + str(version) + '_' + experiment + '_' + run_id + '.pkl'
-        with open(file_name, 'ab') as fileObject:
-                self.write_data_to_filestream(fileObject, data)
+        file_name = self._run_file('metrics', model, version, experiment, run_id)
+        with open(file_name, 'ab') as fileObject, locked(fileObject):
+            self.write_data_to_filestream(fileObject, data)
+
+        self._index.add_run(model, version, experiment, run_id,
+                            path.basename(self._run_file('metrics', model, version, experiment, run_id, extension='')),
+                            data[4])
 
     def record_session_end(self, model, version, experiment, run_id, status):
         """
@@ -128,10 +223,19 @@ class Sink():
         """
         data = [status, datetime.now()]
 
-        file_name = self._path + "metrics\\" + model + '_v' + str(version) + '_' + experiment + '_' + run_id + '.pkl'
-        with open(file_name, 'ab') as fileObject:
+        file_name = self._run_file('metrics', model, version, experiment, run_id)
+        with open(file_name, 'ab') as fileObject, locked(fileObject):
             self.write_data_to_filestream(fileObject, data)
 
+        self._index.end_run(run_id, status, data[1])
+
+        # No more metrics are recorded for the run after this, so its writer can go.
+        with self._writers_lock:
+            writer = self._metric_writers.pop(
+                self._run_file('metrics', model, version, experiment, run_id, extension=''), None)
+        if writer is not None:
+            writer.close()
+
     def record_settings(self, model, version, experiment, run_id, settings):
         """
         Records the settings used for a particular experiment run.
@@ -154,11 +258,11 @@ class Sink():
         """
         data = [model, version, experiment, run_id, settings]
 
-        filename = self._path + "settings\\" + model + '_v' + str(version) + '_' + experiment + '_' + run_id + '.pkl'
-        with open(filename, 'ab') as f:
+        filename = self._run_file('settings', model, version, experiment, run_id)
+        with open(filename, 'ab') as f, locked(f):
             self.write_data_to_filestream(f, data)
 
-    def record_output(self, model, filename, filepath):
+    def record_output(self, model, version, experiment, run_id, filename, filepath):
         """
         Records the output for an experiment
 
@@ -166,6 +270,10 @@ class Sink():
         It is stored as-is without any checks on the extension
         or file contents.
 
+        Outputs are stored by the hash of their contents, so a file recorded
+        by several runs is stored only once. The manifest of the run maps the
+        filename to the stored file.
+
         Parameters:
         -----------
         model : str
@@ -180,14 +288,188 @@ class Sink():
             The filename of the file
         filepath : object
             The file location
+
+        Returns:
+        --------
+        str
+            The hash of the stored file
+        """
+        run_file = path.basename(self._run_file('outputs', model, version, experiment, run_id, extension=''))
+
+        return self._outputs.record(run_file, filename, filepath)
+
+    def begin_output_upload(self, model, version, experiment, run_id, filename, size=None):
+        """
+        Starts a chunked upload of an output
+
+        Large outputs are sent to the server in chunks. The chunks are written to disk as they
+        arrive and the output is recorded once all chunks are received, see finish_output_upload.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The model version
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        filename : str
+            The filename of the output
+        size : int, optional
+            The size of the output in bytes
+
+        Returns:
+        --------
+        str
+            The id of the upload
+        """
+        run_file = path.basename(self._run_file('outputs', model, version, experiment, run_id, extension=''))
+
+        return self._outputs.begin_upload(run_file, filename, size)
+
+    def output_upload_offset(self, upload_id):
+        """
+        Gets the number of bytes received for an upload, the next chunk has to start there
         """
-        # ? why do we record output, when its just coppying the ouput file
-        # ? to the Observatory directory
-        # ? wouldn't is be better to just save the file path
-        # ? in the record_session_start() method
-        output_dir = path.join(self._path + 'outputs\\')
-        file_path = path.join(output_dir + model)
-        with open(filepath, 'r') as fr:
-            outStr = fr.readlines()
-            with open(file_path, 'w') as fw:
-                fw.writelines(outStr)
+        return self._outputs.upload_offset(upload_id)
+
+    def write_output_chunk(self, upload_id, offset, stream):
+        """
+        Writes a chunk of an upload to disk, reading it from a file-like stream
+
+        Returns:
+        --------
+        int
+            The number of bytes received for the upload after writing the chunk
+        """
+        return self._outputs.write_chunk(upload_id, offset, stream)
+
+    def finish_output_upload(self, upload_id, checksum):
+        """
+        Records an uploaded output once all chunks are received
+
+        Parameters:
+        -----------
+        upload_id : str
+            The id of the upload
+        checksum : str
+            The SHA-256 hash of the output, the upload is discarded when it doesn't match
+
+        Returns:
+        --------
+        str
+            The hash of the stored file
+        """
+        return self._outputs.finish_upload(upload_id, checksum)
+
+    def abort_output_upload(self, upload_id):
+        """
+        Discards an upload that won't be finished
+        """
+        self._outputs.abort_upload(upload_id)
+
+    def close(self):
+        """
+        Writes the final summaries of all runs that still have an open writer.
+
+        Call this before the process stops, for example when the server shuts down.
+        """
+        with self._writers_lock:
+            writers = list(self._metric_writers.values())
+            self._metric_writers.clear()
+
+        for writer in writers:
+            writer.close()
+
+
+class SqliteSink(Sink):
+    """
+    A sink that stores the metrics of all runs in a single SQLite database.
+
+    The sessions, settings and outputs are stored the same way as by the Sink,
+    only the metrics go to the metrics database in the metrics directory, see the metricdb module.
+    The archive and the serving client read runs from either store.
+    """
+
+    def __init__(self, base_path=None):
+        """
+        Initializes the sink
+
+        Parameters
+        ----------
+        base_path : str, optional
+            The directory to store the data in, defaults to the .observatory directory
+            in the home directory of the current user.
+        """
+        super().__init__(base_path)
+
+        self._database = MetricDatabase(path.join(self._path, 'metrics'))
+
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metric values.
+
+        All metrics in the batch are inserted into the metrics database in a single transaction.
+
+        Parameters
+        ----------
+        model : string
+            The name of the model
+        version : int
+            The version number of the model
+        experiment : string
+            The name of the experiment
+        run_id : string
+            The ID of the run
+        metrics : list
+            The metrics to record, as [metric_name, metric_value, step, timestamp] lists.
+            The step and timestamp can be left out.
+        """
+        if not metrics:
+            return
+
+        self._database.append(run_id, metrics)
+
+    def record_session_end(self, model, version, experiment, run_id, status):
+        super().record_session_end(model, version, experiment, run_id, status)
+
+        self._database.forget(run_id)
+
+    def close(self):
+        """
+        Closes the connection to the metrics database.
+
+        Call this before the process stops, for example when the server shuts down.
+        """
+        super().close()
+
+        self._database.close()
+
+
+class PytablesSink(Sink):
+    """
+    A sink that stores the metrics of every run in a compressed, columnar HDF5 file.
+
+    The sessions, settings and outputs are stored the same way as by the Sink,
+    only the metrics go to an HDF5 file per run, see the metrictable module.
+    The file of a run stays open until the run ends. This sink requires PyTables.
+    """
+
+    metric_writer = MetricTableWriter
+
+    def __init__(self, base_path=None):
+        """
+        Initializes the sink
+
+        Parameters
+        ----------
+        base_path : str, optional
+            The directory to store the data in, defaults to the .observatory directory
+            in the home directory of the current user.
+        """
+        # Without PyTables the sink fails right away, instead of on the first metric.
+        _import_tables()
+
+        super().__init__(base_path)
@@ -0,0 +1,408 @@
+"""
+A durable spool for requests that could not be delivered to the tracking server.
+
+When the tracking server can't be reached, the requests of a run are appended to a spool file
+on disk instead of failing the run. A daemon thread replays the spooled requests in order, waiting
+longer after every failed attempt, until the server accepts them again. Once a request has been
+spooled, every request after it is spooled as well, so the server receives them in their original order.
+
+Every spooled request carries a deduplication key. When a request reached the server but the response
+got lost, the replay sends it again with the same key and the server records it only once.
+
+Every process spools to a file of its own in the spool directory. Spool files left behind by processes
+that have exited are picked up and replayed by the next process that spools to the same directory.
+"""
+import json
+import os
+import sqlite3
+import threading
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from os import path
+
+from observatory.locking import lock_file
+
+SPOOL_EXTENSION = '.spool'
+LOCK_FILE = '.lock'
+
+# The header that carries the deduplication key of a request.
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# The number of deduplication keys a server remembers.
+RECENT_KEYS_SIZE = 100000
+
+# The Windows API values used to check whether the process that owns a spool file is still running.
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+ERROR_ACCESS_DENIED = 5
+
+
+class Spool:
+    """
+    Keeps undelivered requests on disk and replays them on a separate daemon thread.
+
+    The spool file never grows beyond max_size bytes. When it is full, new requests are dropped
+    and counted, a warning is shown for the first one. The file is emptied as soon as
+    everything in it has been delivered.
+    """
+
+    def __init__(self, directory, send, max_size, retry_interval, max_retry_interval):
+        """
+        Initializes the spool and starts replaying the requests that are already in it
+
+        Parameters
+        ----------
+        directory : str
+            The directory to store the spool files in
+        send : callable
+            The function that delivers a request, it receives the request and returns True when the
+            request was delivered or can never be delivered, and False when it has to be tried again.
+            A request for which it raises an error is skipped.
+        max_size : int
+            The maximum size of the spool file in bytes
+        retry_interval : float
+            The number of seconds to wait after the first failed attempt, it doubles after every failed attempt
+        max_retry_interval : float
+            The maximum number of seconds to wait between two attempts
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.dropped = 0
+
+        self._send = send
+        self._max_size = max_size
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._path = path.join(directory, f'{os.getpid()}{SPOOL_EXTENSION}')
+
+        self._adopt()
+
+        # The spool file holds the delivered requests before the offset and the undelivered ones after it.
+        self._offset = 0
+        self._size = path.getsize(self._path) if path.exists(self._path) else 0
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='observatory-spool', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """
+        Gets whether there are requests in the spool that weren't delivered yet
+        """
+        with self._condition:
+            return self._offset < self._size
+
+    def append(self, request):
+        """
+        Adds a request to the end of the spool
+
+        Parameters
+        ----------
+        request : dict
+            The request to deliver, it must be serializable as JSON
+
+        Returns
+        -------
+        bool
+            True when the request was spooled, False when it was dropped because the spool is full
+        """
+        line = (json.dumps(request) + '\n').encode('utf-8')
+
+        with self._condition:
+            if self._size + len(line) > self._max_size:
+                if self.dropped == 0:
+                    warnings.warn(f'The spool in {self.directory} is full, requests are dropped ' +
+                                  'until the tracking server can be reached again.', RuntimeWarning)
+
+                self.dropped += 1
+                return False
+
+            with open(self._path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                # The request has to survive a crash of the training job, so it is written through to disk.
+                os.fsync(f.fileno())
+
+            self._size += len(line)
+            self._condition.notify()
+
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Waits until every request in the spool has been delivered
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait
+
+        Returns
+        -------
+        bool
+            True when everything was delivered, False when the timeout passed first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._offset >= self._size, timeout)
+
+    def close(self):
+        """
+        Stops replaying, the undelivered requests stay on disk for the next process
+        """
+        self._stopped.set()
+
+        with self._condition:
+            self._condition.notify_all()
+
+        self._thread.join()
+
+    def _adopt(self):
+        """
+        Moves the requests in spool files of processes that have exited into the spool file of this process
+        """
+        with lock_file(path.join(self.directory, LOCK_FILE)):
+            for filename in sorted(os.listdir(self.directory)):
+                name, extension = path.splitext(filename)
+
+                if extension != SPOOL_EXTENSION or not name.isdigit() or _is_running(int(name)):
+                    continue
+
+                orphan_path = path.join(self.directory, filename)
+
+                with open(orphan_path, 'rb') as orphan, open(self._path, 'ab') as f:
+                    f.write(orphan.read())
+
+                os.remove(orphan_path)
+
+    def _next(self):
+        """
+        Waits for an undelivered request and reads it, returns None when the spool is closed
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._stopped.is_set() or self._offset < self._size)
+
+            if self._stopped.is_set():
+                return None
+
+            with open(self._path, 'rb') as f:
+                f.seek(self._offset)
+                line = f.readline()
+
+        return line
+
+    def _advance(self, length):
+        """
+        Marks the request at the offset as delivered, the file is emptied when everything was delivered
+        """
+        with self._condition:
+            self._offset += length
+
+            if self._offset >= self._size:
+                open(self._path, 'wb').close()
+
+                self._offset = 0
+                self._size = 0
+                self.dropped = 0
+
+                self._condition.notify_all()
+
+    def _run(self):
+        delay = self._retry_interval
+
+        while True:
+            line = self._next()
+
+            if line is None:
+                return
+
+            try:
+                request = json.loads(line)
+            except ValueError:
+                # Only the last request can be incomplete, when the process crashed while writing it.
+                warnings.warn('Skipped an incomplete request in the spool.', RuntimeWarning)
+                self._advance(len(line))
+                continue
+
+            try:
+                delivered = self._send(request)
+            except Exception as e:
+                # Only failures the send function reports are retried. A request it can't handle
+                # would fail the same way every time and hold up everything spooled after it.
+                warnings.warn(f'Skipped a spooled request that can not be replayed: {e!r}', RuntimeWarning)
+                delivered = True
+
+            if delivered:
+                delay = self._retry_interval
+                self._advance(len(line))
+            elif self._stopped.wait(delay):
+                return
+            else:
+                delay = min(delay * 2, self._max_retry_interval)
+
+
+class RecentKeys:
+    """
+    Remembers the deduplication keys of the latest requests a server recorded.
+
+    A key is reserved before its request is handled, so a repeated request that arrives while the
+    first one is still being handled is not recorded twice. The key is released again when the
+    request fails, so the client can retry it.
+
+    Only the latest `size` keys are kept, the oldest key is forgotten when a new one is reserved.
+    The keys are kept in memory and are only shared by the threads of a single process.
+    """
+
+    def __init__(self, size=RECENT_KEYS_SIZE):
+        """
+        Initializes the keys
+
+        Parameters
+        ----------
+        size : int, optional
+            The number of keys to remember
+        """
+        self._size = size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._keys
+
+    def reserve(self, key):
+        """
+        Remembers a key, unless it was reserved before
+
+        Parameters
+        ----------
+        key : str
+            The deduplication key of a request
+
+        Returns
+        -------
+        bool
+            True when the key is new and the request has to be handled
+        """
+        with self._lock:
+            if key in self._keys:
+                return False
+
+            self._keys[key] = True
+
+            if len(self._keys) > self._size:
+                self._keys.popitem(last=False)
+
+            return True
+
+    def release(self, key):
+        """
+        Forgets a key of a request that could not be recorded
+
+        Parameters
+        ----------
+        key : str
+            The deduplication key of the request
+        """
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+class SharedRecentKeys(RecentKeys):
+    """
+    Remembers the deduplication keys of the latest requests in a SQLite database,
+    so they are shared by all worker processes of a server.
+    """
+
+    def __init__(self, keys_file, size=RECENT_KEYS_SIZE):
+        """
+        Initializes the keys
+
+        Parameters
+        ----------
+        keys_file : str
+            The database file to keep the keys in, it is created when it doesn't exist
+        size : int, optional
+            The number of keys to remember
+        """
+        self._size = size
+        self._file = keys_file
+
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS recent_keys (key TEXT PRIMARY KEY)')
+
+    @contextmanager
+    def _transaction(self):
+        # A connection per operation, like the run index, so the keys can be used after forking.
+        connection = sqlite3.connect(self._file, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def __contains__(self, key):
+        with self._transaction() as connection:
+            return connection.execute('SELECT 1 FROM recent_keys WHERE key = ?', (key,)).fetchone() is not None
+
+    def reserve(self, key):
+        with self._transaction() as connection:
+            cursor = connection.execute('INSERT OR IGNORE INTO recent_keys (key) VALUES (?)', (key,))
+
+            if cursor.rowcount == 0:
+                return False
+
+            # Row ids increase with every insert, so the oldest keys have the lowest ones.
+            connection.execute('DELETE FROM recent_keys WHERE rowid <= ?', (cursor.lastrowid - self._size,))
+            return True
+
+    def release(self, key):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM recent_keys WHERE key = ?', (key,))
+
+
+def _is_running(pid):
+    """
+    Checks whether a process is still running
+    """
+    if pid == os.getpid():
+        return True
+
+    if os.name == 'nt':
+        return _is_running_on_windows(pid)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user.
+        return True
+
+    return True
+
+
+def _is_running_on_windows(pid):
+    """
+    Checks whether a process is still running on Windows, where os.kill(pid, 0) would interrupt it
+    """
+    import ctypes
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+
+    if not handle:
+        # The process exists when it only refuses access.
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+
+    try:
+        exit_code = ctypes.c_ulong()
+
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
@@ -1,18 +1,39 @@
+import asyncio
 import inspect
 import json
-import pdb
-import re
+import os
+import threading
 import warnings
 from abc import ABC, abstractmethod
+from base64 import b64decode, b64encode
 from os import path
+from time import time
 from uuid import uuid4
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from observatory import settings
-from observatory.constants import LABEL_PATTERN
-from observatory.sink import Sink
+from observatory.backends import create_sink
+from observatory.buffering import BackgroundWriter, MetricBuffer, StreamingWriter
+from observatory.constants import is_valid_label
+from observatory.encoding import (COMPRESSION_THRESHOLD, JSON_CONTENT_TYPE, PACKED, PACKED_CONTENT_TYPE, compress,
+                                  encode_packed)
+from observatory.metricfile import unpack_metric
+from observatory.outputstore import HASH_CHUNK_SIZE, etag, hash_file
+from observatory.spool import IDEMPOTENCY_HEADER, Spool
 
-sink = Sink()
+# The sink that records local runs, it is replaced when another backend is selected in the settings.
+sink = create_sink(settings.backend)
+_sink_backend = settings.backend
+_sink_lock = threading.Lock()
+
+# The number of times a chunk of an output upload is retried before the upload fails.
+UPLOAD_RETRIES = 3
+
+# The spool of requests that couldn't be delivered, shared by all remote runs of the process.
+_spool = None
+_spool_lock = threading.Lock()
 
 
 class TrackingSession:
@@ -41,6 +62,14 @@ class TrackingSession:
         self.experiment = experiment
         self.run_id = run_id
         self._state = state
+        self._buffer = None
+        self._writer = None
+        self._last_timestamp = 0.0
+
+        if settings.async_writes:
+            self._writer = BackgroundWriter(self._write_metrics, settings.queue_size, settings.backpressure)
+        elif settings.buffer_size > 1:
+            self._buffer = MetricBuffer(settings.buffer_size, settings.flush_interval)
 
     def change(self, state):
         """
@@ -52,34 +81,202 @@ class TrackingSession:
         """
         self._state.switch(state)
 
-    def record_metric(self, name, value):
+    def record_metric(self, name, value, step=None):
         """
         Records a metric value on the server
 
+        Every value is recorded with a timestamp. The timestamps of a session
+        never go backwards, even when the system clock does.
+
         Parameters
         ----------
         name : string
             The name of the metric to record
         value : float
             The value of the metric to records
+        step : int, optional
+            The training step, epoch or iteration the value belongs to
+        """
+
+        self._validate_name(name)
+        self._validate_value(value)
+        self._validate_step(step)
+
+        timestamp = self._timestamp()
+
+        if self._writer is not None and self._writer.running:
+            self._writer.put([name, value, step, timestamp])
+        elif self._buffer is None:
+            self._state.record_metric(
+                self.name, self.version, self.experiment, self.run_id, name, value, step, timestamp)
+        elif self._buffer.append([name, value, step, timestamp]):
+            self.flush()
+
+    def record_metrics(self, metrics, step=None):
+        """
+        Records several metric values at once
+
+        All names and values are validated before anything is recorded, after which
+        the values are written as a single batch with the same step and timestamp.
+        Use this instead of calling record_metric in a loop when you record many values per step.
+
+        Parameters
+        ----------
+        metrics : dict
+            The values of the metrics to record, by metric name
+        step : int, optional
+            The training step, epoch or iteration the values belong to
+        """
+        self._record_batch(self._metric_names(metrics), list(metrics.values()), step)
+
+    def record_array(self, name, values, step=None, labels=None):
         """
+        Records the values of an array as separate metrics
 
+        Every value is recorded as a metric named after the array and the label of the value,
+        for example the precision per class is recorded as precision-0, precision-1 and so on.
+        The values are written as a single batch with the same step and timestamp.
+
+        Parameters
+        ----------
+        name : string
+            The name of the array
+        values : numpy.ndarray
+            The one-dimensional array of values to record
+        step : int, optional
+            The training step, epoch or iteration the values belong to
+        labels : list, optional
+            The labels of the values, by default the position of the value in the array
+        """
+        values = np.asarray(values)
+
+        self._record_batch(self._array_names(name, values, labels), values, step)
+
+    def _record_batch(self, names, values, step):
+        """
+        Validates the values and the step of a batch and records the batch
+        """
+        values = self._batch_values(values)
+        self._validate_step(step)
+
+        if len(values) == 0:
+            return
+
+        timestamp = self._timestamp()
+        metrics = [[name, value, step, timestamp] for name, value in zip(names, values)]
+
+        if self._writer is not None and self._writer.running:
+            for metric in metrics:
+                self._writer.put(metric)
+        elif self._buffer is None:
+            self._write_metrics(metrics)
+        else:
+            for metric in metrics:
+                self._buffer.append(metric)
+
+            if self._buffer.should_flush():
+                self.flush()
+
+    @staticmethod
+    def _validate_name(name):
         # ! Typechecking in python is a no-go under normal circumstances.
         # ! But here we're using it, because the _state expects a string and float.
-        if name is None or type(name) != str or name.strip() == '':
-            raise AssertionError('Please provide a valid name for the metric.')
-
-        if not re.match(LABEL_PATTERN, name):
+        # Valid names are remembered, so a name recorded every step is only checked once.
+        if not is_valid_label(name):
             raise AssertionError(
-                'Please provide a valid name for the metric.' +
-                'it can contain lower-case alpha-numeric characters and dashes only.')
+                'Please provide a valid name for the metric. ' +
+                'It can contain lower-case alpha-numeric characters and dashes only.')
 
+    @classmethod
+    def _metric_names(cls, metrics):
+        """
+        Validates a dictionary of metrics and gets the names of the metrics
+        """
+        if metrics is None or not hasattr(metrics, 'items'):
+            raise AssertionError('Please provide the metrics as a dictionary of names and values.')
+
+        names = list(metrics.keys())
+
+        for name in names:
+            cls._validate_name(name)
+
+        return names
+
+    @classmethod
+    def _array_names(cls, name, values, labels):
+        """
+        Validates an array of metrics and gets the names of its values
+        """
+        cls._validate_name(name)
+
+        if values.ndim != 1:
+            raise AssertionError('Please provide a one-dimensional array of values.')
+
+        if labels is None:
+            labels = range(len(values))
+        elif len(labels) != len(values):
+            raise AssertionError('Please provide a label for every value in the array.')
+
+        names = [f'{name}-{label}' for label in labels]
+
+        for metric_name in names:
+            cls._validate_name(metric_name)
+
+        return names
+
+    @staticmethod
+    def _validate_value(value):
         if value is None or (type(value) != float and type(value) != int):
             raise AssertionError(
                 'Please provide a valid value for the metric.')
 
-        self._state.record_metric(
-            self.name, self.version, self.experiment, self.run_id, name, value)
+    @staticmethod
+    def _batch_values(values):
+        """
+        Validates the values of a batch and converts them into a list of plain Python numbers
+        """
+        try:
+            values = np.asarray(values)
+        except ValueError:
+            values = np.asarray(values, dtype=object)
+
+        # Booleans and strings are refused, just like record_metric does for single values.
+        if values.dtype.kind not in 'iuf':
+            raise AssertionError('Please provide a valid value for every metric.')
+
+        # A single conversion turns the values into plain Python numbers, which every state can write.
+        return values.tolist()
+
+    @staticmethod
+    def _validate_step(step):
+        if step is not None and (type(step) != int or step < 0):
+            raise AssertionError('Please provide a step that is a positive whole number.')
+
+    def _timestamp(self):
+        """
+        Gets the current time, but never a time before the previous timestamp of the session
+        """
+        self._last_timestamp = max(time(), self._last_timestamp)
+
+        return self._last_timestamp
+
+    def flush(self):
+        """
+        Writes all buffered metrics to the tracking state.
+
+        This happens automatically when the buffer is full, when a metric is recorded
+        after the flush interval has passed and at the end of the session. You only need
+        to call this method when you want the metrics to be written right away,
+        for example before a long pause in which no metrics are recorded.
+        """
+        if self._buffer is None or len(self._buffer) == 0:
+            return
+
+        self._write_metrics(self._buffer.drain())
+
+    def _write_metrics(self, metrics):
+        self._state.record_metrics(
+            self.name, self.version, self.experiment, self.run_id, metrics)
 
     def record_settings(self, **settings):
         """
@@ -114,7 +311,14 @@ class TrackingSession:
         filename : string
             Name of the file as it should be stored on the server
         """
+        self._state.record_output(
+            self.name, self.version, self.experiment, self.run_id, filename, self._output_path(input_file, filename))
 
+    @staticmethod
+    def _output_path(input_file, filename):
+        """
+        Validates an output and gets the absolute location of its file
+        """
         if filename is None or filename.strip() == '':
             raise AssertionError(
                 'Please provide a valid filename to store the output on the server.')
@@ -131,13 +335,15 @@ class TrackingSession:
                 'to upload as output of this run. Please make ' +
                 'sure that the file exists on disk.')
 
-        self._state.record_output(
-            self.name, filename, absolute_file_path)
+        return absolute_file_path
 
     def __enter__(self):
         self._state.record_session_start(
             self.name, self.version, self.experiment, self.run_id)
 
+        if self._writer is not None:
+            self._writer.start()
+
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -146,9 +352,26 @@ class TrackingSession:
         else:
             session_status = 'FAILED'
 
-        self._state.record_session_end(
-            self.name, self.version, self.experiment,
-            self.run_id, session_status)
+        # The session is ended even when the remaining metrics can't be written,
+        # and the error that ended the run is never replaced by an error while ending it.
+        try:
+            try:
+                if self._writer is not None:
+                    self._writer.close()
+
+                self.flush()
+            except Exception:
+                session_status = 'FAILED'
+                raise
+            finally:
+                self._state.record_session_end(
+                    self.name, self.version, self.experiment,
+                    self.run_id, session_status)
+        except Exception as e:
+            if exc_type is None:
+                raise
+
+            warnings.warn(f'Failed to end the failed run: {e}', RuntimeWarning)
 
         return exc_type is None
 
@@ -161,12 +384,21 @@ class ObservatoryState(ABC):
         self.__class__ = state
 
     @abstractmethod
-    def record_metric(self, model, version, experiment, run_id, value):
+    def record_metric(self, model, version, experiment, run_id, name, value, step=None, timestamp=None):
         """
         Override this method in a derived class to record a metric.
         """
         pass
 
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metrics, given as [name, value, step, timestamp] lists.
+        Derived classes can override this method to write the batch in one go,
+        by default the metrics are recorded one by one.
+        """
+        for metric in metrics:
+            self.record_metric(model, version, experiment, run_id, *metric)
+
     @abstractmethod
     def record_settings(self, model, version, experiment, run_id, settings):
         """
@@ -177,7 +409,7 @@ class ObservatoryState(ABC):
         pass
 
     @abstractmethod
-    def record_output(self, model, version, experiment, input_file, filename):
+    def record_output(self, model, version, experiment, run_id, filename, file):
         """
         Override this method in a derived class to record an output for the run.
         The derived class is required to handle the value of the output as an opaque binary blob.
@@ -209,27 +441,240 @@ class LocalState(ObservatoryState):
     So there is a seperate module to handle this.
     """
 
-    def record_metric(self, model, version, experiment, run_id, name, value):
-        sink.record_metric(model, version, experiment, run_id, name, value)
+    def record_metric(self, model, version, experiment, run_id, name, value, step=None, timestamp=None):
+        _get_sink().record_metric(model, version, experiment, run_id, name, value, step, timestamp)
+
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        _get_sink().record_metrics(model, version, experiment, run_id, metrics)
 
     def record_settings(self, model, version, experiment, run_id, settings):
-        sink.record_settings(model, version, experiment, run_id, settings)
+        _get_sink().record_settings(model, version, experiment, run_id, settings)
 
-    def record_output(self, model, filename, file):
-        sink.record_output(model, filename, file)
+    def record_output(self, model, version, experiment, run_id, filename, file):
+        _get_sink().record_output(model, version, experiment, run_id, filename, file)
 
     def record_session_start(self, model, version, experiment, run_id):
-        sink.record_session_start(model, version, experiment, run_id)
+        _get_sink().record_session_start(model, version, experiment, run_id)
 
     def record_session_end(self, model, version, experiment, run_id, status):
-        sink.record_session_end(model, version, experiment, run_id, status)
+        _get_sink().record_session_end(model, version, experiment, run_id, status)
+
+
+def _get_sink():
+    """
+    Gets the sink of the backend selected in the settings, creating it when the backend has changed
+    """
+    global sink, _sink_backend
+
+    with _sink_lock:
+        if _sink_backend != settings.backend:
+            sink.close()
+            sink = create_sink(settings.backend)
+            _sink_backend = settings.backend
+
+        return sink
+
+
+def _is_transient(status_code):
+    """
+    Checks whether a request that failed with a status code can succeed when it is tried again
+
+    An internal server error is not retried, because the same request would fail the same way
+    and hold up everything spooled after it.
+    """
+    return status_code in (408, 429, 502, 503, 504)
+
+
+def _running_stream(state):
+    """
+    Gets the metric stream of a state.
+
+    A stream that failed is closed, which writes the metrics it didn't send in batches,
+    and the state sends its metrics in batches from then on.
+    """
+    stream = getattr(state, '_stream', None)
+
+    if stream is not None and stream.failed:
+        state._stream = None
+        stream.close()
+        return None
+
+    return stream
+
+
+def _get_spool():
+    """
+    Gets the spool of this process, it is created when it is first needed
+    """
+    global _spool
+
+    with _spool_lock:
+        if _spool is None:
+            directory = settings.spool_path or path.join(path.expanduser('~'), '.observatory', 'spool')
+            _spool = Spool(directory, RemoteState()._replay, settings.spool_size,
+                           settings.retry_interval, settings.max_retry_interval)
+
+        return _spool
 
 
 class RemoteState(ObservatoryState):
     """
     Records metric on a remote server that you can run through the command `observatory server`.
+
+    All requests to the server go through one HTTP session, so the connections to the server
+    are kept alive and reused for the whole run instead of opening a new one for every metric.
+
+    When streaming is enabled in the settings, the metrics of a run are sent as newline-delimited
+    JSON over a single chunked request that stays open from the start until the end of the run.
+    When that request fails, the metrics are sent in batches instead.
+
+    When spooling is enabled in the settings, requests that can't be delivered because the server
+    is unreachable or overloaded are spooled to disk and replayed on a background thread,
+    so a transient outage doesn't fail the run. Outputs and streamed metrics are never spooled,
+    metrics that are sent in batches after the stream failed are.
     """
 
+    @property
+    def _session(self):
+        """
+        Gets the HTTP session used to talk to the server.
+
+        The session is created on first use, because states can be switched
+        on the fly without calling __init__.
+        """
+        session = getattr(self, '_http_session', None)
+
+        if session is None:
+            adapter = HTTPAdapter(
+                pool_connections=settings.pool_size, pool_maxsize=settings.pool_size)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            self._http_session = session
+
+        return session
+
+    def _post(self, handler_url, **kwargs):
+        """
+        Sends a POST request to the server over the pooled HTTP session
+        """
+        timeout = (settings.connect_timeout, settings.read_timeout)
+
+        return self._session.post(handler_url, timeout=timeout, **kwargs)
+
+    def _send(self, handler_path, payload, content_type=JSON_CONTENT_TYPE):
+        """
+        Sends a payload to the server and verifies that it was recorded.
+
+        The payload is a dictionary that is sent as JSON, or the bytes of a packed batch of metrics.
+        With spooling enabled, a request that can't be delivered is spooled to disk instead
+        of raising an error, and so is every request after it until the spool is delivered.
+        """
+        body = json.dumps(payload).encode('utf-8') if content_type == JSON_CONTENT_TYPE else payload
+
+        if not settings.spooling:
+            self._verify_response(self._post_body(handler_path, body, content_type), 201)
+            return
+
+        spool = _get_spool()
+        key = uuid4().hex
+
+        if not spool.pending:
+            try:
+                response = self._post_body(handler_path, body, content_type, key)
+
+                if not _is_transient(response.status_code):
+                    self._verify_response(response, 201)
+                    return
+            except requests.RequestException:
+                pass
+
+        # The spool holds text, so binary bodies are stored as base64.
+        spool.append({
+            'key': key,
+            'path': handler_path,
+            'content_type': content_type,
+            'body': body.decode('utf-8') if content_type == JSON_CONTENT_TYPE else b64encode(body).decode('ascii')
+        })
+
+    def _replay(self, request):
+        """
+        Sends a spooled request to the server, returns False when it has to be tried again later
+        """
+        content_type = request['content_type']
+        body = request['body'].encode('utf-8') if content_type == JSON_CONTENT_TYPE else b64decode(request['body'])
+
+        try:
+            response = self._post_body(request['path'], body, content_type, request['key'])
+        except requests.RequestException:
+            return False
+
+        if _is_transient(response.status_code):
+            return False
+
+        if response.status_code != 201:
+            warnings.warn(f'The server refused a spooled request to {request["path"]} ' +
+                          f'with status {response.status_code}, the request is discarded.', RuntimeWarning)
+
+        return True
+
+    def _post_body(self, handler_path, body, content_type, key=None):
+        """
+        Sends a request body to the server.
+
+        The body is compressed with settings.compression once the server has listed
+        that compression in the Accept-Encoding header of an earlier response.
+        """
+        headers = {'content-type': content_type}
+
+        if key is not None:
+            headers[IDEMPOTENCY_HEADER] = key
+
+        if settings.compression in getattr(self, '_accepted_encodings', ()) and len(body) >= COMPRESSION_THRESHOLD:
+            body = compress(body, settings.compression)
+            headers['content-encoding'] = settings.compression
+
+        response = self._post(settings.server_url + handler_path, data=body, headers=headers)
+        accepted = response.headers.get('Accept-Encoding')
+
+        if accepted is not None:
+            self._accepted_encodings = {coding.strip() for coding in accepted.split(',')}
+
+        return response
+
+    def _open_stream(self, model, version, experiment, run_id):
+        """
+        Opens the streaming request for the metrics of a run.
+
+        The request is sent on a separate thread, the body of the request is produced
+        from the metrics sent to the stream until the stream is closed.
+        """
+        handler_url = f'{settings.server_url}/metrics/{run_id}/stream'
+        params = {
+            'model': model,
+            'version': version,
+            'experiment': experiment
+        }
+        headers = {'content-type': 'application/x-ndjson'}
+
+        def encode(batches):
+            for batch in batches:
+                yield ''.join(json.dumps(self._metric_payload(metric)) + '\n'
+                              for metric in batch).encode('utf-8')
+
+        def consume(batches):
+            # The request stays open for the whole run, so there's no read timeout.
+            return self._session.post(handler_url, params=params, data=encode(batches), headers=headers,
+                                      timeout=(settings.connect_timeout, None))
+
+        def fallback(metrics):
+            self._send_batch(model, version, experiment, run_id, metrics)
+
+        self._stream = StreamingWriter(consume, fallback, settings.queue_size)
+        self._stream.start()
+
     def _verify_response(self, response, expected_status,
                          expected_type='application/json'):
         """
@@ -240,7 +685,8 @@ class RemoteState(ObservatoryState):
         are readable as expected.
         """
         actual_status = response.status_code
-        actual_type = response.headers['Content-Type']
+        # Parameters such as the charset don't matter, only the media type is compared.
+        actual_type = response.headers['Content-Type'].split(';')[0].strip()
 
         if response.status_code != expected_status:
             try:
@@ -258,10 +704,19 @@ class RemoteState(ObservatoryState):
         # Sometimes the server does respond, but sends some weird piece of data that we can't parse.
         # This check makes sure that we don't try to ever read it.
         if actual_type != expected_type:
-            raise RuntimeError(f'Failed to execute operation. ' +
-                               'Received invalid response type: {actual_type}')
+            raise RuntimeError('Failed to execute operation. ' +
+                               f'Received invalid response type: {actual_type}')
+
+    @staticmethod
+    def _metric_payload(metric):
+        """
+        Converts a [name, value, step, timestamp] list into the JSON representation of a metric
+        """
+        name, value, step, timestamp = unpack_metric(metric)
 
-    def record_metric(self, model, version, experiment, run_id, name, value):
+        return {'name': name, 'value': value, 'step': step, 'timestamp': timestamp}
+
+    def record_metric(self, model, version, experiment, run_id, name, value, step=None, timestamp=None):
         """
         Records a metric during a run.
 
@@ -283,24 +738,78 @@ class RemoteState(ObservatoryState):
             The name of the metric
         metric_value : str
             The value of the metric
+        step : int, optional
+            The step the value belongs to
+        timestamp : float, optional
+            The moment the value was recorded, as a unix timestamp
 
         Returns:
         --------
         requests.Response
             The response from the server
         """
-        handler_url = f'{settings.server_url}/metrics/{run_id}'
+        stream = _running_stream(self)
+
+        if stream is not None:
+            stream.send([name, value, step, timestamp])
+            return
+
         payload = {
             'model': model,
             'version': version,
             'experiment': experiment,
             'name': name,
-            'value': value
+            'value': value,
+            'step': step,
+            'timestamp': timestamp
         }
-        headers = {'content-type': 'application/json'}
-        self._verify_response(requests.post(handler_url, data=json.dumps(payload), headers=headers), 201)
+        self._send(f'/metrics/{run_id}', payload)
 
-    def record_settings(self, model, version, experiment, run_id, settings):
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metrics during a run.
+
+        This method sends all metrics in a single HTTP request to the bulk endpoint of the server.
+        It is used automatically when metrics are buffered or written on a background thread.
+        With the packed encoding in the settings, the batch is sent in the compact binary encoding.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        metrics : list
+            The metrics to record, as [name, value, step, timestamp] lists
+        """
+        stream = _running_stream(self)
+
+        if stream is not None:
+            for metric in metrics:
+                stream.send(metric)
+            return
+
+        self._send_batch(model, version, experiment, run_id, metrics)
+
+    def _send_batch(self, model, version, experiment, run_id, metrics):
+        """
+        Sends a batch of metrics to the bulk endpoint of the server
+        """
+        if settings.encoding == PACKED:
+            self._send('/metrics/', encode_packed(model, version, experiment, run_id, metrics), PACKED_CONTENT_TYPE)
+            return
+
+        payload = {
+            'metrics': [dict(self._metric_payload(metric), model=model, version=version,
+                             experiment=experiment, run=run_id) for metric in metrics]
+        }
+        self._send('/metrics/', payload)
+
+    def record_settings(self, model, version, experiment, run_id, run_settings):
         """
         Records the settings of an experiment run.
 
@@ -318,7 +827,7 @@ class RemoteState(ObservatoryState):
             The name of the experiment
         run_id : str
             The identifier for the run
-        settings : dict
+        run_settings : dict
             The dictionary with run settings
 
         Returns:
@@ -326,23 +835,22 @@ class RemoteState(ObservatoryState):
         requests.Response
             The response from the server
         """
-        handler_url = f'{settings.server_url}/Settings/{model}'
         payload = {
             'model': model,
             'version': version,
             'experiment': experiment,
-            'settings': settings
+            'settings': run_settings
         }
-        headers = {'content-type': 'application/json'}
-        self._verify_response(requests.post(handler_url, data=json.dumps(payload), headers=headers), 201)
+        self._send(f'/settings/{run_id}', payload)
 
-    def record_output(self, model, filename, file):
+    def record_output(self, model, version, experiment, run_id, filename, file):
         """
         Records an output of an experiment run
 
-        This method sends a HTTP request with the right payload to the observatory tracking endpoint.
-        The result is a 201 when the server succesfully recorded the session completion. Otherwise
-        the server will return a 500 response.
+        The output is uploaded in chunks, so outputs of any size can be sent without
+        reading them into memory. The upload is started, the chunks are sent one by one
+        and the upload is finished with the SHA-256 checksum of the file, which the server
+        verifies before it records the output.
 
         Parameters:
         -----------
@@ -356,22 +864,139 @@ class RemoteState(ObservatoryState):
             The identifier for the run
         filename : str
             The filename of the output
-        file : object
-            The file handle to use for reading the output data
+        file : str
+            The location of the output file
 
         Returns:
         --------
         requests.Response
             The response from the servers
         """
-        handler_url = f'{settings.server_url}/output/{model}'
-        headers = {'content-type': 'multipart/form-dataitem'}
-
-        file_collection = {
-            'file': (filename, file, 'application/octet-stream')
+        handler_url = f'{settings.server_url}/output/{run_id}/uploads'
+        payload = {
+            'model': model,
+            'version': version,
+            'experiment': experiment,
+            'filename': filename,
+            'size': path.getsize(file)
         }
+        headers = {'content-type': 'application/json'}
+        checksum = hash_file(file)
+
+        response = self._post(handler_url, data=json.dumps(payload), headers=headers)
+        self._verify_response(response, 201)
+
+        upload_url = f'{settings.server_url}/uploads/{response.json()["upload"]}'
+        self._upload_chunks(upload_url, file, payload['size'])
+
+        self._verify_response(self._post(upload_url, data=json.dumps({'checksum': checksum}), headers=headers), 201)
+
+    def _upload_chunks(self, upload_url, file, size):
+        """
+        Sends a file to an upload in chunks of settings.upload_chunk_size bytes.
+
+        Only one chunk is in memory at a time. When a chunk fails, the server is asked
+        how much it received and the upload continues from there.
+        """
+        offset = 0
+        failures = 0
+        timeout = (settings.connect_timeout, settings.read_timeout)
+
+        with open(file, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(settings.upload_chunk_size)
+                headers = {
+                    'content-type': 'application/octet-stream',
+                    'content-range': f'bytes {offset}-{offset + len(chunk) - 1}/{size}'
+                }
+
+                try:
+                    response = self._session.put(upload_url, data=chunk, headers=headers, timeout=timeout)
+
+                    if response.status_code == 200:
+                        offset = response.json()['offset']
+                        failures = 0
+                        continue
+
+                    error = f'status {response.status_code}'
+                except requests.RequestException as e:
+                    error = e
+
+                failures += 1
+
+                if failures > UPLOAD_RETRIES:
+                    raise RuntimeError(f'Failed to upload output. The upload stopped at byte {offset}: {error}')
+
+                offset = self._upload_offset(upload_url, offset)
+
+    def _upload_offset(self, upload_url, offset):
+        """
+        Asks the server where an upload continues, keeps the given offset when the server can't tell
+        """
+        try:
+            response = self._session.get(upload_url, timeout=(settings.connect_timeout, settings.read_timeout))
+
+            if response.status_code == 200:
+                return response.json()['offset']
+        except requests.RequestException:
+            pass
+
+        return offset
+
+    def download_output(self, run_id, filename, destination):
+        """
+        Downloads an output of a run to a local file.
+
+        The file is streamed to disk in chunks. When the destination already holds the same file,
+        the server answers with a 304 and nothing is downloaded. An interrupted download leaves
+        a .part file behind, the next download continues where it stopped.
+
+        Parameters:
+        -----------
+        run_id : str
+            The first 8 characters of the run id
+        filename : str
+            The filename of the output
+        destination : str
+            The location to store the output
+
+        Returns:
+        --------
+        str
+            The location of the downloaded file
+        """
+        handler_url = f'{settings.server_url}/output/{run_id}'
+        part_path = destination + '.part'
+        headers = {}
+
+        if path.exists(destination):
+            headers['If-None-Match'] = etag(hash_file(destination))
+        elif path.exists(part_path):
+            headers['Range'] = f'bytes={path.getsize(part_path)}-'
+
+        response = self._session.get(handler_url, params={'filename': filename}, headers=headers, stream=True,
+                                     timeout=(settings.connect_timeout, settings.read_timeout))
+
+        if response.status_code == 304:
+            return destination
+
+        if response.status_code not in (200, 206):
+            raise RuntimeError('Failed to download output. Server returned ' +
+                               f'an error with status: {response.status_code}')
+
+        # The server sends the whole file when the range can't be served, so the part file starts over.
+        with open(part_path, 'ab' if response.status_code == 206 else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=HASH_CHUNK_SIZE):
+                f.write(chunk)
+
+        if etag(hash_file(part_path)) != response.headers.get('ETag'):
+            os.remove(part_path)
+            raise RuntimeError('Failed to download output. The downloaded file does not match the file on the server.')
 
-        self._verify_response(requests.post(handler_url, headers=headers, files=file_collection), 201)
+        os.replace(part_path, destination)
+
+        return destination
 
     def record_session_start(self, model, version, experiment, run_id):
         """
@@ -397,16 +1022,16 @@ class RemoteState(ObservatoryState):
         requests.Response
             The response from the server
         """
-        handler_url = f'{settings.server_url}/start/'
         payload = {
             'model': model,
             'version': version,
             'experiment': experiment,
             'run': run_id
         }
-        pdb.set_trace()
-        headers = {'content-type': 'application/json'}
-        self._verify_response(requests.post(handler_url, data=json.dumps(payload), headers=headers), 201)
+        self._send('/start/', payload)
+
+        if settings.streaming:
+            self._open_stream(model, version, experiment, run_id)
 
     def record_session_end(self, model, version, experiment, run_id, status):
         """
@@ -434,7 +1059,7 @@ class RemoteState(ObservatoryState):
         requests.Response
             The response from the server
         """
-        handler_url = f'{settings.server_url}/end/'
+        stream = getattr(self, '_stream', None)
         payload = {
             'model': model,
             'version': version,
@@ -442,66 +1067,811 @@ class RemoteState(ObservatoryState):
             'run': run_id,
             'status': status
         }
-        headers = {'content-type': 'application/json'}
-        self._verify_response(requests.post(handler_url, data=json.dumps(payload), headers=headers), 201)
 
+        # The run is ended even when the server refused the streamed metrics.
+        try:
+            if stream is not None:
+                self._stream = None
+                response = stream.close()
 
-def start_run(model, version, experiment='default'):
-    """
-    Starts a new run for a specific model version.
+                if not stream.failed:
+                    self._verify_response(response, 201)
+        finally:
+            self._send('/end/', payload)
 
-    You can use this function start start recording data related to a single experiment run.
-    The use of experiments is optional, you can leave this parameter out. See the example below for basic usage.
 
-    >>> with observatory.start_run('my_model', 1, remote, experiment='my_experiment') as run:
-    >>>     # Record metrics, outputs and settings
+def _import_grpc():
+    """
+    Imports grpcio and the generated protobuf modules, which are only needed for the gRPC client
+    """
+    try:
+        import grpc
+        from observatory.proto import tracking_pb2, tracking_pb2_grpc
+    except ImportError:
+        raise ImportError('The gRPC client requires grpcio. ' +
+                          'Install it with: pip install observatory[grpc]') from None
 
-    A new run is created on the server at the start of the scope.
-    It is automatically finalized at the end of the scope.
+    return grpc, tracking_pb2, tracking_pb2_grpc
 
-    Note that when an exception occurs within the scope of a run,
-    the run is automatically marked as failed.
 
-    Each time you invoke `start_run()` a new run is created with a newly generated UUID.
-    This ensures that no runs overlap eachother.
+class GrpcState(ObservatoryState):
+    """
+    Records metrics on the gRPC tracking service that you can run through the command `observatory server --grpc`.
 
-    **Please note** it is not possible to resume a run that you started earlier.
+    The metrics of a run are sent as protobuf messages over a single streaming call, which is opened at
+    the start of the run and closed at the end. All calls share one HTTP/2 connection to settings.grpc_target.
 
-    Parameters
-    ----------
-    model : string
-        The name of the model
-    version : int
-        The version number of the model
-    state : object, optinal
-        The state you're working in
-    experiment : string, optional
-        The experiment you're working on
+    The service doesn't carry outputs, these are uploaded to the tracking server in settings.server_url
+    the same way RemoteState does.
     """
-    if model is None or model.strip() == '' or not re.match(LABEL_PATTERN, model):
-        raise AssertionError('Please provide a valid name for your model.It can contain ' +
-                             'lower-case alpha-numeric characters and dashes only.')
 
-    if not re.match(LABEL_PATTERN, model):
-        raise AssertionError('name is invalid. It can contain ' +
+    @property
+    def _stub(self):
+        """
+        Gets the client of the tracking service.
+
+        The client is created on first use, because states can be switched
+        on the fly without calling __init__.
+        """
+        stub = getattr(self, '_grpc_stub', None)
+
+        if stub is None:
+            grpc, _, tracking_pb2_grpc = _import_grpc()
+
+            self._channel = grpc.insecure_channel(settings.grpc_target)
+            stub = self._grpc_stub = tracking_pb2_grpc.TrackingStub(self._channel)
+
+        return stub
+
+    def _close_channel(self):
+        channel = getattr(self, '_channel', None)
+
+        if channel is not None:
+            self._channel = None
+            self._grpc_stub = None
+            channel.close()
+
+    @staticmethod
+    def _verify_recorded(reply, expected):
+        """
+        Verifies that the tracking service recorded all metrics that were sent to it
+        """
+        if reply.recorded != expected:
+            raise RuntimeError('Failed to execute operation. The tracking service recorded ' +
+                               f'{reply.recorded} of {expected} metrics.')
+
+    def _call(self, method, request):
+        """
+        Calls a method of the tracking service and turns failed calls into a RuntimeError
+        """
+        grpc, _, _ = _import_grpc()
+
+        try:
+            return method(request, timeout=settings.read_timeout)
+        except grpc.RpcError as e:
+            raise RuntimeError('Failed to execute operation. Server returned ' +
+                               f'an error with status {e.code().name}: {e.details()}') from None
+
+    @staticmethod
+    def _run_message(model, version, experiment, run_id):
+        _, tracking_pb2, _ = _import_grpc()
+
+        return tracking_pb2.Run(model=model, version=version, experiment=experiment, run=run_id)
+
+    def _batch_message(self, model, version, experiment, run_id, metrics):
+        """
+        Converts [name, value, step, timestamp] lists into a MetricBatch message
+        """
+        _, tracking_pb2, _ = _import_grpc()
+
+        return tracking_pb2.MetricBatch(
+            run=self._run_message(model, version, experiment, run_id),
+            metrics=[tracking_pb2.Metric(name=name, value=value, step=step, timestamp=timestamp)
+                     for name, value, step, timestamp in map(unpack_metric, metrics)])
+
+    def _open_stream(self, model, version, experiment, run_id):
+        """
+        Opens the streaming call for the metrics of a run, the call is made on a separate thread
+        """
+        def encode(batches):
+            for batch in batches:
+                yield self._batch_message(model, version, experiment, run_id, batch)
+
+        def consume(batches):
+            # The call stays open for the whole run, so there's no timeout.
+            return self._stub.RecordMetrics(encode(batches))
+
+        def fallback(metrics):
+            self._send_batch(model, version, experiment, run_id, metrics)
+
+        self._stream = StreamingWriter(consume, fallback, settings.queue_size)
+        self._stream.start()
+
+    def record_metric(self, model, version, experiment, run_id, name, value, step=None, timestamp=None):
+        self.record_metrics(model, version, experiment, run_id, [[name, value, step, timestamp]])
+
+    def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metrics during a run.
+
+        The metrics are sent over the stream of the run, or in a call of their own
+        when they are recorded outside of a session or the stream failed.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        metrics : list
+            The metrics to record, as [name, value, step, timestamp] lists
+        """
+        stream = _running_stream(self)
+
+        if stream is not None:
+            for metric in metrics:
+                stream.send(metric)
+            return
+
+        self._send_batch(model, version, experiment, run_id, metrics)
+
+    def _send_batch(self, model, version, experiment, run_id, metrics):
+        """
+        Sends a batch of metrics in a call of its own
+        """
+        batch = self._batch_message(model, version, experiment, run_id, metrics)
+        self._verify_recorded(self._call(self._stub.RecordMetrics, iter([batch])), len(metrics))
+
+    def record_settings(self, model, version, experiment, run_id, run_settings):
+        _, tracking_pb2, _ = _import_grpc()
+
+        self._call(self._stub.RecordSettings, tracking_pb2.SettingsRequest(
+            run=self._run_message(model, version, experiment, run_id), settings=json.dumps(run_settings)))
+
+    def record_output(self, model, version, experiment, run_id, filename, file):
+        remote = getattr(self, '_remote', None)
+
+        if remote is None:
+            remote = self._remote = RemoteState()
+
+        remote.record_output(model, version, experiment, run_id, filename, file)
+
+    def record_session_start(self, model, version, experiment, run_id):
+        self._call(self._stub.StartRun, self._run_message(model, version, experiment, run_id))
+        self._open_stream(model, version, experiment, run_id)
+
+    def record_session_end(self, model, version, experiment, run_id, status):
+        _, tracking_pb2, _ = _import_grpc()
+        stream = getattr(self, '_stream', None)
+
+        # The run is ended even when its metrics could not all be recorded, the error is raised after that.
+        try:
+            if stream is not None:
+                self._stream = None
+                reply = stream.close()
+
+                if not stream.failed:
+                    self._verify_recorded(reply, stream.sent)
+        finally:
+            try:
+                self._call(self._stub.EndRun, tracking_pb2.EndRunRequest(
+                    run=self._run_message(model, version, experiment, run_id), status=status))
+            finally:
+                self._close_channel()
+
+
+def _import_aiohttp():
+    """
+    Imports aiohttp, which is only needed for the asyncio client
+    """
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError('The asyncio client requires aiohttp. ' +
+                          'Install it with: pip install observatory[async]') from None
+
+    return aiohttp
+
+
+def _read_chunk(file, offset, size):
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+class AsyncRemoteState:
+    """
+    Records metrics on a remote server without blocking the event loop.
+
+    This is the asyncio counterpart of RemoteState, it talks to the same routes, so it works with
+    both `observatory server` and `observatory server --async`. All requests of a run go through one
+    aiohttp session. Pass a session to share its connections between many runs in the same process.
+
+    Outputs are read and hashed on a thread, so large files don't block the event loop either.
+    """
+
+    def __init__(self, session=None):
+        self._aiohttp = _import_aiohttp()
+        self._http_session = session
+        self._owns_session = session is None
+
+    @property
+    def _session(self):
+        """
+        Gets the HTTP session used to talk to the server, it is created on first use inside the running loop
+        """
+        if self._http_session is None or self._http_session.closed:
+            aiohttp = self._aiohttp
+
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=settings.connect_timeout,
+                                              sock_read=settings.read_timeout))
+            self._owns_session = True
+
+        return self._http_session
+
+    async def _post(self, handler_url, payload, expected_status=201):
+        """
+        Sends a JSON payload to the server and gets the JSON response
+        """
+        async with self._session.post(handler_url, json=payload) as response:
+            return await self._verify_response(response, expected_status)
+
+    @staticmethod
+    async def _verify_response(response, expected_status):
+        """
+        Verifies the status and the content type of a response and reads its contents
+        """
+        if response.status != expected_status:
+            raise RuntimeError('Failed to execute operation. Server returned ' +
+                               f'an error with status: {response.status}')
+
+        if response.content_type != 'application/json':
+            raise RuntimeError('Failed to execute operation. ' +
+                               f'Received invalid response type: {response.content_type}')
+
+        return await response.json()
+
+    async def record_metric(self, model, version, experiment, run_id, name, value, step=None, timestamp=None):
+        """
+        Records a metric during a run.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        name : str
+            The name of the metric
+        value : float
+            The value of the metric
+        step : int, optional
+            The step the value belongs to
+        timestamp : float, optional
+            The moment the value was recorded, as a unix timestamp
+        """
+        payload = dict(RemoteState._metric_payload([name, value, step, timestamp]),
+                       model=model, version=version, experiment=experiment)
+
+        await self._post(f'{settings.server_url}/metrics/{run_id}', payload)
+
+    async def record_metrics(self, model, version, experiment, run_id, metrics):
+        """
+        Records a batch of metrics in a single request to the bulk endpoint of the server.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        metrics : list
+            The metrics to record, as [name, value, step, timestamp] lists
+        """
+        payload = {
+            'metrics': [dict(RemoteState._metric_payload(metric), model=model, version=version,
+                             experiment=experiment, run=run_id) for metric in metrics]
+        }
+
+        await self._post(f'{settings.server_url}/metrics/', payload)
+
+    async def record_settings(self, model, version, experiment, run_id, run_settings):
+        """
+        Records the settings of an experiment run.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        run_settings : dict
+            The dictionary with run settings
+        """
+        payload = {
+            'model': model,
+            'version': version,
+            'experiment': experiment,
+            'settings': run_settings
+        }
+
+        await self._post(f'{settings.server_url}/settings/{run_id}', payload)
+
+    async def record_output(self, model, version, experiment, run_id, filename, file):
+        """
+        Records an output of an experiment run, uploading it in chunks like RemoteState does.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        filename : str
+            The filename of the output
+        file : str
+            The location of the output file
+        """
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(None, path.getsize, file)
+        checksum = await loop.run_in_executor(None, hash_file, file)
+
+        payload = {
+            'model': model,
+            'version': version,
+            'experiment': experiment,
+            'filename': filename,
+            'size': size
+        }
+        response = await self._post(f'{settings.server_url}/output/{run_id}/uploads', payload)
+
+        upload_url = f'{settings.server_url}/uploads/{response["upload"]}'
+        await self._upload_chunks(upload_url, file, size)
+
+        await self._post(upload_url, {'checksum': checksum})
+
+    async def _upload_chunks(self, upload_url, file, size):
+        """
+        Sends a file to an upload in chunks, continuing from the offset of the server when a chunk fails
+        """
+        loop = asyncio.get_running_loop()
+        offset = 0
+        failures = 0
+
+        while offset < size:
+            chunk = await loop.run_in_executor(None, _read_chunk, file, offset, settings.upload_chunk_size)
+            headers = {
+                'content-type': 'application/octet-stream',
+                'content-range': f'bytes {offset}-{offset + len(chunk) - 1}/{size}'
+            }
+
+            try:
+                async with self._session.put(upload_url, data=chunk, headers=headers) as response:
+                    if response.status == 200:
+                        offset = (await response.json())['offset']
+                        failures = 0
+                        continue
+
+                    error = f'status {response.status}'
+            except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            failures += 1
+
+            if failures > UPLOAD_RETRIES:
+                raise RuntimeError(f'Failed to upload output. The upload stopped at byte {offset}: {error}')
+
+            offset = await self._upload_offset(upload_url, offset)
+
+    async def _upload_offset(self, upload_url, offset):
+        """
+        Asks the server where an upload continues, keeps the given offset when the server can't tell
+        """
+        try:
+            async with self._session.get(upload_url) as response:
+                if response.status == 200:
+                    return (await response.json())['offset']
+        except (self._aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+        return offset
+
+    async def record_session_start(self, model, version, experiment, run_id):
+        """
+        Records the start of a session.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        """
+        payload = {
+            'model': model,
+            'version': version,
+            'experiment': experiment,
+            'run': run_id
+        }
+
+        await self._post(f'{settings.server_url}/start/', payload)
+
+    async def record_session_end(self, model, version, experiment, run_id, status):
+        """
+        Records the end of a session.
+
+        Parameters:
+        -----------
+        model : str
+            The name of the model
+        version : int
+            The version of the model
+        experiment : str
+            The name of the experiment
+        run_id : str
+            The identifier for the run
+        status : str
+            The status of the run
+        """
+        payload = {
+            'model': model,
+            'version': version,
+            'experiment': experiment,
+            'run': run_id,
+            'status': status
+        }
+
+        await self._post(f'{settings.server_url}/end/', payload)
+
+    async def close(self):
+        """
+        Closes the HTTP session, unless it was passed in and is shared with other runs
+        """
+        if self._owns_session and self._http_session is not None:
+            await self._http_session.close()
+
+        self._http_session = None
+
+
+class AsyncTrackingSession:
+
+    def __init__(self, name, version, experiment, run_id, state):
+        """
+        Initializes a tracking session that records its data without blocking the event loop.
+
+        The session validates its data the same way TrackingSession does.
+        Metrics are buffered when settings.buffer_size is larger than one,
+        the buffer is sent in a single request when it is full.
+
+        Parameters
+        ----------
+        name : string
+            Name of the model
+        version : int
+            Version number of the model
+        experiment : string
+            Name of the experiment
+        run_id : string
+            ID of the run
+        state : AsyncRemoteState
+            The state that sends the data to the server
+        """
+        self.name = name
+        self.version = version
+        self.experiment = experiment
+        self.run_id = run_id
+        self._state = state
+        self._buffer = None
+        self._last_timestamp = 0.0
+
+        if settings.buffer_size > 1:
+            self._buffer = MetricBuffer(settings.buffer_size, settings.flush_interval)
+
+    async def record_metric(self, name, value, step=None):
+        """
+        Records a metric value on the server
+
+        Parameters
+        ----------
+        name : string
+            The name of the metric to record
+        value : float
+            The value of the metric to records
+        step : int, optional
+            The training step, epoch or iteration the value belongs to
+        """
+        TrackingSession._validate_name(name)
+        TrackingSession._validate_value(value)
+        TrackingSession._validate_step(step)
+
+        timestamp = self._timestamp()
+
+        if self._buffer is None:
+            await self._state.record_metric(
+                self.name, self.version, self.experiment, self.run_id, name, value, step, timestamp)
+        elif self._buffer.append([name, value, step, timestamp]):
+            await self.flush()
+
+    async def record_metrics(self, metrics, step=None):
+        """
+        Records several metric values at once, as a single batch with the same step and timestamp
+
+        Parameters
+        ----------
+        metrics : dict
+            The values of the metrics to record, by metric name
+        step : int, optional
+            The training step, epoch or iteration the values belong to
+        """
+        await self._record_batch(TrackingSession._metric_names(metrics), list(metrics.values()), step)
+
+    async def record_array(self, name, values, step=None, labels=None):
+        """
+        Records the values of an array as separate metrics, named after the array and the label of the value
+
+        Parameters
+        ----------
+        name : string
+            The name of the array
+        values : numpy.ndarray
+            The one-dimensional array of values to record
+        step : int, optional
+            The training step, epoch or iteration the values belong to
+        labels : list, optional
+            The labels of the values, by default the position of the value in the array
+        """
+        values = np.asarray(values)
+
+        await self._record_batch(TrackingSession._array_names(name, values, labels), values, step)
+
+    async def _record_batch(self, names, values, step):
+        values = TrackingSession._batch_values(values)
+        TrackingSession._validate_step(step)
+
+        if len(values) == 0:
+            return
+
+        timestamp = self._timestamp()
+        metrics = [[name, value, step, timestamp] for name, value in zip(names, values)]
+
+        if self._buffer is None:
+            await self._write_metrics(metrics)
+        else:
+            for metric in metrics:
+                self._buffer.append(metric)
+
+            if self._buffer.should_flush():
+                await self.flush()
+
+    def _timestamp(self):
+        """
+        Gets the current time, but never a time before the previous timestamp of the session
+        """
+        self._last_timestamp = max(time(), self._last_timestamp)
+
+        return self._last_timestamp
+
+    async def flush(self):
+        """
+        Sends all buffered metrics to the server, this happens automatically at the end of the session
+        """
+        if self._buffer is None or len(self._buffer) == 0:
+            return
+
+        await self._write_metrics(self._buffer.drain())
+
+    async def _write_metrics(self, metrics):
+        await self._state.record_metrics(
+            self.name, self.version, self.experiment, self.run_id, metrics)
+
+    async def record_settings(self, **settings):
+        """
+        Records settings used for the run
+
+        Parameters
+        ----------
+        settings : object
+            The settings used for the run, passed in as `key=value` pairs.
+        """
+        await self._state.record_settings(
+            self.name, self.version, self.experiment, self.run_id, dict(settings))
+
+    async def record_output(self, input_file, filename):
+        """
+        Records an output for the current run.
+
+        Parameters
+        ----------
+        input_file : object
+            Filename or handle to input file
+        filename : string
+            Name of the file as it should be stored on the server
+        """
+        await self._state.record_output(
+            self.name, self.version, self.experiment, self.run_id, filename,
+            TrackingSession._output_path(input_file, filename))
+
+    async def __aenter__(self):
+        await self._state.record_session_start(
+            self.name, self.version, self.experiment, self.run_id)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            session_status = 'COMPLETED'
+        else:
+            session_status = 'FAILED'
+
+        # Ends the session like TrackingSession does, even when the remaining metrics can't be sent.
+        try:
+            try:
+                await self.flush()
+            except Exception:
+                session_status = 'FAILED'
+                raise
+            finally:
+                await self._state.record_session_end(
+                    self.name, self.version, self.experiment,
+                    self.run_id, session_status)
+        except Exception as e:
+            if exc_type is None:
+                raise
+
+            warnings.warn(f'Failed to end the failed run: {e}', RuntimeWarning)
+        finally:
+            await self._state.close()
+
+        return exc_type is None
+
+
+def start_run(model, version, experiment='default'):
+    """
+    Starts a new run for a specific model version.
+
+    You can use this function start start recording data related to a single experiment run.
+    The use of experiments is optional, you can leave this parameter out. See the example below for basic usage.
+
+    >>> with observatory.start_run('my_model', 1, remote, experiment='my_experiment') as run:
+    >>>     # Record metrics, outputs and settings
+
+    A new run is created on the server at the start of the scope.
+    It is automatically finalized at the end of the scope.
+
+    Note that when an exception occurs within the scope of a run,
+    the run is automatically marked as failed.
+
+    Each time you invoke `start_run()` a new run is created with a newly generated UUID.
+    This ensures that no runs overlap eachother.
+
+    **Please note** it is not possible to resume a run that you started earlier.
+
+    Parameters
+    ----------
+    model : string
+        The name of the model
+    version : int
+        The version number of the model
+    state : object, optinal
+        The state you're working in
+    experiment : string, optional
+        The experiment you're working on
+    """
+    experiment = _validate_run(model, version, experiment)
+    run_id = str(uuid4())
+
+    if settings.state == 'local':
+        tracking_session = TrackingSession(model, version, experiment, run_id, LocalState())
+    elif settings.state == "remote":
+        tracking_session = TrackingSession(model, version, experiment, run_id, RemoteState())
+    elif settings.state == 'grpc':
+        tracking_session = TrackingSession(model, version, experiment, run_id, GrpcState())
+
+    return tracking_session
+
+
+def start_async_run(model, version, experiment='default', session=None):
+    """
+    Starts a new run that records its data on the server without blocking the event loop.
+
+    Use this in async code, for example in async training frameworks or when one process
+    reports many runs at once. The run is always recorded on the server in settings.server_url.
+
+    >>> async with observatory.start_async_run('my_model', 1, experiment='my_experiment') as run:
+    >>>     await run.record_metric('loss', 0.1, step=1)
+
+    The asyncio client requires aiohttp, install it with `pip install observatory[async]`.
+
+    Parameters
+    ----------
+    model : string
+        The name of the model
+    version : int
+        The version number of the model
+    experiment : string, optional
+        The experiment you're working on
+    session : aiohttp.ClientSession, optional
+        A session to share between runs, by default every run opens its own session
+
+    Returns
+    -------
+    AsyncTrackingSession
+        The session to record the data of the run with
+    """
+    experiment = _validate_run(model, version, experiment)
+
+    return AsyncTrackingSession(model, version, experiment, str(uuid4()), AsyncRemoteState(session))
+
+
+def _validate_run(model, version, experiment):
+    """
+    Validates the model, version and experiment of a new run, returns the experiment to record the run in
+    """
+    if not is_valid_label(model):
+        raise AssertionError('Please provide a valid name for your model. It can contain ' +
                              'lower-case alpha-numeric characters and dashes only.')
 
     if experiment is None:
         experiment = 'default'
 
     if experiment != 'default':
-        if experiment.strip() == '' or not re.match(LABEL_PATTERN, experiment):
+        if not is_valid_label(experiment):
             raise AssertionError('experiment is invalid. It can contain ' +
                                  'lower-case alpha-numeric characters and dashes only.')
 
     if version <= 0:
         raise AssertionError('version must be greater than zero')
 
-    run_id = str(uuid4())
+    return experiment
 
-    if settings.state == 'local':
-        tracking_session = TrackingSession(model, version, experiment, run_id, LocalState())
-    elif settings.state == "remote":
-        tracking_session = TrackingSession(model, version, experiment, run_id, RemoteState())
 
-    return tracking_session
+def download_output(run_id, filename, destination=None):
+    """
+    Downloads an output of a run from the server.
+
+    >>> observatory.download_output('1a2b3c4d', 'model.pkl')
+
+    Parameters
+    ----------
+    run_id : string
+        The first 8 characters of the run id
+    filename : string
+        The filename of the output, as given when it was recorded
+    destination : string, optional
+        The location to store the output, defaults to the filename in the current directory
+
+    Returns
+    -------
+    string
+        The location of the downloaded file
+    """
+    if destination is None:
+        destination = filename
+
+    return RemoteState().download_output(run_id, filename, path.abspath(destination))
@@ -27,11 +27,19 @@ REQUIRED = [
     'flask==1.0.2',
     'elasticsearch>=6.0.0,<7.0.0',
     'requests>=2.20.0',
+    'numpy>=1.14.0',
 ]
 
 # What packages are optional?
 EXTRAS = {
-    # 'fancy feature': ['django'],
+    # The asyncio tracking server and client, see observatory.asyncserver and observatory.start_async_run
+    'async': ['aiohttp>=3.5.0'],
+    # The gRPC tracking service and client, see observatory.grpcserver and observatory.proto
+    'grpc': ['grpcio>=1.84.0', 'protobuf>=7.35.1'],
+    # zstd compression of the requests sent to the tracking server, see observatory.encoding
+    'zstd': ['zstandard>=0.10.0'],
+    # Columnar HDF5 storage of the metrics, see observatory.sink.PytablesSink
+    'hdf5': ['tables>=3.4.4'],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -1,10 +1,22 @@
 import os
 import pickle
+import sqlite3
+import threading
 from os.path import expanduser
 
 import pytest
 import requests
 from observatory.archive import Archive
+from observatory.index import INDEX_FILE, RunIndex
+from observatory.metricdb import DATABASE_FILE, MetricDatabaseReader
+from observatory.metrictable import TABLE_EXTENSION, MetricTableReader, MetricTableWriter
+from observatory.metricfile import (DATA_EXTENSION, MAGIC, RECORD, MetricFileReader, MetricFileWriter,
+                                    read_metrics, read_names)
+from observatory.outputstore import OBJECTS_FOLDER, OutputStore, copy_file, hash_file
+from observatory.serving import ServingClient
+from observatory.sink import PytablesSink, Sink, SqliteSink
+
+RUN_ID = '12345678-017f-41ce-b4b7-735bf7123332'
 
 @pytest.fixture(scope="session")
 def test_file():
@@ -66,4 +78,350 @@ def test_get_experiment(test_file):
 def test_get_run(test_file):
     data = Archive.get_run('12345678', test_file[:-53])
 
-    assert data == [[['loss', 255]]]
\ No newline at end of file
+    assert data == [[['loss', 255]]]
+
+@pytest.fixture()
+def recorded_run(tmp_path):
+    """
+    This fixture records a run with the sink in a temporary directory.
+    """
+    sink = Sink(str(tmp_path))
+    sink.record_session_start('test', 1, 'test', RUN_ID)
+    sink.record_metric('test', 1, 'test', RUN_ID, 'loss', 0.5)
+    sink.record_metrics('test', 1, 'test', RUN_ID, [['accuracy', 0.9], ['loss', 0.25]])
+    sink.record_session_end('test', 1, 'test', RUN_ID, 'COMPLETED')
+
+    yield os.path.join(str(tmp_path), 'metrics')
+
+
+def test_get_run_reads_binary_metrics(recorded_run):
+    data = Archive.get_run(RUN_ID[:8], recorded_run)
+
+    assert data[0][:4] == ['test', 1, 'test', RUN_ID]
+    assert data[1:-1] == [['loss', 0.5], ['accuracy', 0.9], ['loss', 0.25]]
+    assert data[-1][0] == 'COMPLETED'
+
+
+def test_metric_file_stores_names_once(recorded_run):
+    base_path = os.path.join(recorded_run, 'test_v1_test_' + RUN_ID)
+
+    assert read_names(base_path) == ['loss', 'accuracy']
+    assert os.path.getsize(base_path + DATA_EXTENSION) == len(MAGIC) + 3 * RECORD.size
+
+
+def test_metric_file_ignores_incomplete_record(recorded_run):
+    base_path = os.path.join(recorded_run, 'test_v1_test_' + RUN_ID)
+
+    with open(base_path + DATA_EXTENSION, 'ab') as f:
+        f.write(b'\x00' * (RECORD.size // 2))
+
+    assert read_metrics(base_path) == [['loss', 0.5], ['accuracy', 0.9], ['loss', 0.25]]
+
+
+def test_delete_run_removes_all_files(recorded_run):
+    assert Archive.delete_run(Archive, RUN_ID[:8], recorded_run)
+    assert os.listdir(recorded_run) == [INDEX_FILE]
+    assert Archive.get_experiment(Archive, 'test', '1', 'test', recorded_run) == []
+
+
+def test_get_model_matches_exactly(recorded_run):
+    sink = Sink(os.path.dirname(recorded_run))
+    sink.record_session_start('test-2', 2, 'test', '87654321-017f-41ce-b4b7-735bf7123332')
+
+    assert Archive.get_all_models(Archive, recorded_run) == ['test', 'test-2']
+    assert Archive.get_model(Archive, 'test', recorded_run) == ['1']
+    assert Archive.get_version(Archive, 'test', '1', recorded_run) == ['test']
+    assert Archive.get_experiment(Archive, 'test', '1', 'test', recorded_run) == [RUN_ID[:8]]
+
+
+def test_index_is_built_from_existing_files(recorded_run):
+    os.remove(os.path.join(recorded_run, INDEX_FILE))
+
+    assert Archive.get_experiment(Archive, 'test', '1', 'test', recorded_run) == [RUN_ID[:8]]
+    assert Archive.get_run(RUN_ID[:8], recorded_run)[-1][0] == 'COMPLETED'
+
+
+def test_index_orders_versions_numerically(tmp_path):
+    sink = Sink(str(tmp_path))
+    for version in (1, 10, 2):
+        sink.record_session_start('test', version, 'test', f'{version:08d}' + RUN_ID[8:])
+
+    assert RunIndex(str(tmp_path / 'metrics')).versions('test') == ['1', '2', '10']
+
+
+def test_index_rebuild_keeps_start_order_of_runs(tmp_path):
+    sink = Sink(str(tmp_path))
+    # The second run started first, the order of the run ids is the other way around.
+    sink.record_session_start('test', 1, 'test', OTHER_RUN_ID)
+    sink.record_session_start('test', 1, 'test', RUN_ID)
+    sink.record_session_end('test', 1, 'test', RUN_ID, 'COMPLETED')
+    metrics_path = str(tmp_path / 'metrics')
+
+    os.remove(os.path.join(metrics_path, INDEX_FILE))
+    index = RunIndex(metrics_path)
+
+    assert index.runs('test', 1, 'test') == [OTHER_RUN_ID[:8], RUN_ID[:8]]
+    assert index._query('SELECT status FROM runs ORDER BY started') == [('RUNNING',), ('COMPLETED',)]
+
+
+OTHER_RUN_ID = '87654321-017f-41ce-b4b7-735bf7123332'
+
+
+def stored_objects(recorded_run):
+    objects_path = os.path.join(os.path.dirname(recorded_run), 'outputs', OBJECTS_FOLDER)
+    return [name for prefix in os.listdir(objects_path) for name in os.listdir(os.path.join(objects_path, prefix))]
+
+
+@pytest.fixture()
+def model_file(tmp_path):
+    """
+    This fixture produces a binary output file, like a pickled model.
+    """
+    file_path = str(tmp_path / 'model.pkl')
+    with open(file_path, 'wb') as f:
+        f.write(bytes(range(256)) * 1024)
+    yield file_path
+
+
+def test_copy_file_keeps_binary_contents(model_file, tmp_path):
+    copy_path = str(tmp_path / 'copy.pkl')
+    copy_file(model_file, copy_path)
+
+    with open(model_file, 'rb') as original, open(copy_path, 'rb') as copy:
+        assert original.read() == copy.read()
+
+
+def test_record_output_stores_identical_files_once(recorded_run, model_file):
+    sink = Sink(os.path.dirname(recorded_run))
+    sink.record_session_start('test', 1, 'test', OTHER_RUN_ID)
+
+    assert sink.record_output('test', 1, 'test', RUN_ID, 'model.pkl', model_file) == hash_file(model_file)
+    sink.record_output('test', 1, 'test', OTHER_RUN_ID, 'final-model.pkl', model_file)
+
+    outputs = Archive.get_output(RUN_ID[:8], recorded_run)
+
+    assert stored_objects(recorded_run) == [hash_file(model_file)]
+    assert list(outputs) == ['model.pkl']
+    assert outputs['model.pkl']['size'] == os.path.getsize(model_file)
+    assert hash_file(outputs['model.pkl']['path']) == hash_file(model_file)
+    assert list(Archive.get_output(OTHER_RUN_ID[:8], recorded_run)) == ['final-model.pkl']
+
+
+def test_output_store_stores_same_file_from_many_threads(tmp_path):
+    file_path = str(tmp_path / 'model.pkl')
+    with open(file_path, 'wb') as f:
+        f.write(os.urandom(1 << 22))
+
+    store = OutputStore(str(tmp_path / 'outputs'))
+    barrier = threading.Barrier(8)
+    digests, errors = [], []
+
+    def put():
+        barrier.wait()
+        try:
+            digests.append(store.put(file_path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    objects_path = os.path.join(str(tmp_path / 'outputs'), OBJECTS_FOLDER, hash_file(file_path)[:2])
+
+    assert errors == []
+    assert digests == [hash_file(file_path)] * 8
+    assert os.listdir(objects_path) == [hash_file(file_path)]
+
+
+def test_delete_output_keeps_files_shared_with_other_runs(recorded_run, model_file):
+    sink = Sink(os.path.dirname(recorded_run))
+    sink.record_session_start('test', 1, 'test', OTHER_RUN_ID)
+    sink.record_output('test', 1, 'test', RUN_ID, 'model.pkl', model_file)
+    sink.record_output('test', 1, 'test', OTHER_RUN_ID, 'model.pkl', model_file)
+
+    assert Archive.delete_output(RUN_ID[:8], recorded_run)
+    assert Archive.get_output(RUN_ID[:8], recorded_run) == {}
+    assert len(stored_objects(recorded_run)) == 1
+
+    assert Archive.delete_run(Archive, OTHER_RUN_ID[:8], recorded_run)
+    assert stored_objects(recorded_run) == []
+
+
+def test_metric_writers_of_one_run_share_names_and_summary(tmp_path):
+    base_path = str(tmp_path / ('test_v1_test_' + RUN_ID))
+    first = MetricFileWriter(base_path)
+    second = MetricFileWriter(base_path)
+
+    first.append([['loss', 1.0]])
+    second.append([['accuracy', 0.5], ['loss', 3.0]])
+    first.append([['accuracy', 0.7]])
+    first.close()
+
+    assert read_names(base_path) == ['loss', 'accuracy']
+    assert read_metrics(base_path) == [['loss', 1.0], ['accuracy', 0.5], ['loss', 3.0], ['accuracy', 0.7]]
+
+    summary = MetricFileReader(base_path).summary()
+    assert (summary['loss']['count'], summary['loss']['max']) == (2, 3.0)
+    assert (summary['accuracy']['first'], summary['accuracy']['last']) == (0.5, 0.7)
+
+
+def test_sink_records_from_many_threads(tmp_path):
+    sink = Sink(str(tmp_path))
+
+    def record(thread):
+        for step in range(50):
+            sink.record_metrics('test', 1, 'test', RUN_ID, [[f'metric-{thread}', float(step), step, None]])
+
+    threads = [threading.Thread(target=record, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.close()
+
+    reader = MetricFileReader(os.path.join(str(tmp_path), 'metrics', 'test_v1_test_' + RUN_ID))
+
+    assert len(reader) == 400
+    assert sorted(reader.names) == sorted(f'metric-{thread}' for thread in range(8))
+    assert all(reader.series(f'metric-{thread}').tolist() == [float(step) for step in range(50)] for thread in range(8))
+    assert reader.summary()['metric-0']['count'] == 50
+
+
+@pytest.fixture()
+def sqlite_run(tmp_path):
+    """
+    This fixture records a run with the SQLite sink in a temporary directory.
+    """
+    sink = SqliteSink(str(tmp_path))
+    sink.record_session_start('test', 1, 'test', RUN_ID)
+    sink.record_metric('test', 1, 'test', RUN_ID, 'loss', 0.5, step=0)
+    sink.record_metrics('test', 1, 'test', RUN_ID, [['accuracy', 0.9, 1, None], ['loss', 0.25, 1, None]])
+    sink.record_session_end('test', 1, 'test', RUN_ID, 'COMPLETED')
+    sink.close()
+
+    yield os.path.join(str(tmp_path), 'metrics')
+
+
+def test_sqlite_sink_stores_metrics_in_database(sqlite_run):
+    base_path = os.path.join(sqlite_run, 'test_v1_test_' + RUN_ID)
+
+    assert not os.path.exists(base_path + DATA_EXTENSION)
+    assert Archive.get_run(RUN_ID[:8], sqlite_run)[1:-1] == [['loss', 0.5], ['accuracy', 0.9], ['loss', 0.25]]
+
+    connection = sqlite3.connect(os.path.join(sqlite_run, DATABASE_FILE))
+    assert connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    connection.close()
+
+
+def test_sqlite_sink_runs_are_served_from_database(sqlite_run):
+    client = ServingClient(os.path.dirname(sqlite_run))
+
+    run = client.get_run(RUN_ID[:8], start_step=1)
+    assert run['status'] == 'COMPLETED'
+    assert {name: metric['values'].tolist() for name, metric in run['metrics'].items()} == \
+        {'accuracy': [0.9], 'loss': [0.25]}
+
+    summary = client.get_summary(RUN_ID[:8])['metrics']
+    assert list(summary) == ['loss', 'accuracy']
+    assert (summary['loss']['count'], summary['loss']['first'], summary['loss']['last']) == (2, 0.5, 0.25)
+
+
+def test_sqlite_sink_records_from_many_threads(tmp_path):
+    sink = SqliteSink(str(tmp_path))
+
+    def record(thread):
+        for step in range(50):
+            sink.record_metrics('test', 1, 'test', RUN_ID, [[f'metric-{thread}', float(step), step, None]])
+
+    threads = [threading.Thread(target=record, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.close()
+
+    reader = MetricDatabaseReader(os.path.join(str(tmp_path), 'metrics'), RUN_ID)
+
+    assert len(reader) == 400
+    assert sorted(reader.names) == sorted(f'metric-{thread}' for thread in range(8))
+    assert all(reader.series(f'metric-{thread}').tolist() == [float(step) for step in range(50)] for thread in range(8))
+
+
+def test_delete_run_removes_metrics_from_database(sqlite_run):
+    assert Archive.delete_run(Archive, RUN_ID[:8], sqlite_run)
+    assert not MetricDatabaseReader.exists(sqlite_run, RUN_ID)
+
+
+@pytest.fixture()
+def pytables_sink(tmp_path):
+    """
+    This fixture starts a run with the PyTables sink in a temporary directory.
+    """
+    pytest.importorskip('tables')
+
+    sink = PytablesSink(str(tmp_path))
+    sink.record_session_start('test', 1, 'test', RUN_ID)
+    sink.record_metric('test', 1, 'test', RUN_ID, 'loss', 0.5, step=0)
+    sink.record_metrics('test', 1, 'test', RUN_ID, [['accuracy', 0.9, 1, None], ['loss', 0.25, 1, None]])
+
+    yield sink
+
+    sink.close()
+
+
+def test_pytables_run_is_readable_while_recording(pytables_sink, tmp_path):
+    client = ServingClient(str(tmp_path))
+
+    run = client.get_run(RUN_ID[:8], start_step=1)
+    assert run['status'] == 'RUNNING'
+    assert {name: metric['values'].tolist() for name, metric in run['metrics'].items()} == \
+        {'accuracy': [0.9], 'loss': [0.25]}
+
+    pytables_sink.record_metric('test', 1, 'test', RUN_ID, 'loss', 0.125, step=2)
+    summary = client.get_summary(RUN_ID[:8])['metrics']
+    assert list(summary) == ['loss', 'accuracy']
+    assert (summary['loss']['count'], summary['loss']['first'], summary['loss']['last']) == (3, 0.5, 0.125)
+
+
+def test_pytables_run_is_compressed_and_indexed_when_it_ends(pytables_sink, tmp_path):
+    import tables
+
+    pytables_sink.record_session_end('test', 1, 'test', RUN_ID, 'COMPLETED')
+    metrics_path = os.path.join(str(tmp_path), 'metrics')
+
+    with tables.open_file(os.path.join(metrics_path, 'test_v1_test_' + RUN_ID + TABLE_EXTENSION)) as h5file:
+        table = h5file.root.m0
+        assert (table.title, table.filters.complib) == ('loss', 'blosc:lz4')
+        assert table.cols.step.is_indexed and table.cols.timestamp.is_indexed
+
+    # The values of a batch share a timestamp, they are read back by metric.
+    assert Archive.get_run(RUN_ID[:8], metrics_path)[1:-1] == [['loss', 0.5], ['loss', 0.25], ['accuracy', 0.9]]
+    assert len(MetricTableReader(os.path.join(metrics_path, 'test_v1_test_' + RUN_ID)).select(end_step=1)) == 1
+
+    assert Archive.delete_run(Archive, RUN_ID[:8], metrics_path)
+    assert os.listdir(metrics_path) == [INDEX_FILE]
+
+
+def test_pytables_writer_waits_for_writer_that_has_run_open(tmp_path):
+    pytest.importorskip('tables')
+    base_path = str(tmp_path / 'run')
+
+    first = MetricTableWriter(base_path)
+    first.append([['loss', 0.5, 0, None]])
+
+    second = MetricTableWriter(base_path)
+    thread = threading.Thread(target=second.append, args=([['loss', 0.25, 1, None]],))
+    thread.start()
+    thread.join(0.2)
+
+    # The lock is held until the first writer closes the file.
+    assert thread.is_alive()
+
+    first.close()
+    thread.join()
+    second.close()
+
+    assert MetricTableReader(base_path).select()['value'].tolist() == [0.5, 0.25]
@@ -0,0 +1,49 @@
+import json
+import os
+
+from benchmarks import harness
+from click.testing import CliRunner
+
+
+def test_run_benchmarks_reports_every_combination(tmp_path):
+    results = harness.run_benchmarks(['observatory', 'json'], [1], [2], [3, 4], str(tmp_path))
+
+    assert set(results) == {'environment', 'results'}
+    assert set(results['environment']) == {'observatory', 'python', 'platform', 'date'}
+    assert [(result['backend'], result['points']) for result in results['results']] == \
+        [('observatory', 3), ('json', 3), ('observatory', 4), ('json', 4)]
+
+    for result in results['results']:
+        assert set(result) == {'backend', 'write', 'read', 'disk_bytes', 'runs', 'metrics', 'points'}
+        assert result['write']['values'] == result['read']['values'] == 2 * result['points']
+        assert result['disk_bytes'] > 0
+
+    # The benchmark data is removed afterwards, only the results are kept.
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_run_benchmarks_skips_backend_that_is_not_installed(tmp_path, monkeypatch):
+    def missing(directory):
+        raise ImportError('pip install missing')
+
+    monkeypatch.setitem(harness.BACKENDS, 'missing', missing)
+
+    results = harness.run_benchmarks(['missing'], [1], [1], [1], str(tmp_path))
+
+    assert results['results'] == [{'backend': 'missing', 'skipped': 'pip install missing',
+                                   'runs': 1, 'metrics': 1, 'points': 1}]
+
+
+def test_main_writes_results_as_json(tmp_path):
+    output = str(tmp_path / 'results.json')
+
+    result = CliRunner().invoke(harness.main, ['--backend', 'text', '--runs', '1', '--metrics', '1',
+                                               '--points', '2', '--output', output])
+
+    assert result.exit_code == 0, result.output
+
+    with open(output) as f:
+        results = json.load(f)
+
+    assert results['results'][0]['backend'] == 'text'
+    assert results['results'][0]['write']['operations'] == 2
@@ -1,13 +1,26 @@
+import hashlib
+import json
+import mmap
 import os
 import pickle
+from datetime import datetime
 from os.path import expanduser
 
+import numpy as np
 import pytest
 import requests
+from observatory.archive import Archive
+from observatory.encoding import (HEADER_SIZE, PACKED_CONTENT_TYPE, PACKED_MAGIC, available_compressions, compress,
+                                  decode_packed, decompress, encode_packed)
+from observatory.metricfile import MetricFileReader
+from observatory.outputstore import etag_matches, parse_range, read_file
 from observatory.serving import ServingClient
+from observatory.sink import Sink
 
 serving = ServingClient()
 
+RUN = 'a1b2c3d4-e5f6'
+
 def test_validate_model_empty():
     with pytest.raises(AssertionError):
             serving.validate_model('')
@@ -46,4 +59,324 @@ def test_validate_run_empty():
 
 def test_validate_run_uppercase ():
         with pytest.raises(AssertionError):
-                serving.validate_run('A134567')    
\ No newline at end of file
+                serving.validate_run('A134567')    
+
+RUN_ID = '12345678-017f-41ce-b4b7-735bf7123332'
+
+
+@pytest.fixture()
+def metrics_path(tmp_path):
+    """
+    This fixture records a run with the sink in a temporary directory.
+    """
+    sink = Sink(str(tmp_path))
+    sink.record_session_start('test', 1, 'test', RUN_ID)
+    sink.record_metrics('test', 1, 'test', RUN_ID, [['loss', 1.0], ['accuracy', 0.5], ['loss', 0.5]])
+    sink.record_session_end('test', 1, 'test', RUN_ID, 'COMPLETED')
+
+    yield os.path.join(str(tmp_path), 'metrics')
+
+
+def test_structure_run_from_reader(metrics_path):
+    records, reader = Archive.open_run(RUN_ID[:8], metrics_path)
+    run = serving.structure_run(records, reader)
+
+    assert run['status'] == 'COMPLETED'
+    assert list(run['metrics']) == ['loss', 'accuracy']
+    assert list(run['metrics']['loss']['values']) == [1.0, 0.5]
+    assert run['metrics']['loss']['mean'] == 0.75
+    assert run['metrics']['loss']['last'] == 0.5
+
+
+def test_structure_run_from_pickled_run():
+    records = [['test', 1, 'test', RUN_ID, datetime.now()], ['loss', 1.0], ['accuracy', '0.5'], ['loss', 0.5]]
+    run = serving.structure_run(records)
+
+    assert run['status'] == 'RUNNING'
+    assert list(run['metrics']) == ['loss', 'accuracy']
+    assert run['metrics']['accuracy']['values'].tolist() == [0.5]
+
+
+def test_group_metrics_keeps_first_seen_order():
+    ids = np.array([2, 0, 2, 1, 0])
+    values = np.array([5.0, 1.0, 3.0, 2.0, 4.0])
+    metrics = serving.group_metrics(['a', 'b', 'c'], ids, values)
+
+    assert list(metrics) == ['c', 'a', 'b']
+    assert metrics['c']['values'].tolist() == [5.0, 3.0]
+    assert (metrics['a']['count'], metrics['a']['min'], metrics['a']['max'], metrics['a']['last']) == (2, 1.0, 4.0, 4.0)
+    assert metrics['b']['mean'] == 2.0
+
+
+def test_metric_reader_maps_records(metrics_path):
+    reader = MetricFileReader(os.path.join(metrics_path, 'test_v1_test_' + RUN_ID))
+
+    assert len(reader) == 3
+    assert isinstance(reader.records.base.obj, mmap.mmap)
+    assert list(reader.series('loss')) == [1.0, 0.5]
+    assert len(reader.series('unknown')) == 0
+
+
+def test_summary_is_maintained_while_recording(metrics_path):
+    reader = MetricFileReader(os.path.join(metrics_path, 'test_v1_test_' + RUN_ID))
+    summary = reader.summary()
+
+    assert list(summary) == ['loss', 'accuracy']
+    assert summary['loss']['count'] == 2
+    assert summary['loss']['mean'] == 0.75
+    assert summary['loss']['std'] == 0.25
+    assert (summary['loss']['first'], summary['loss']['last']) == (1.0, 0.5)
+
+
+def test_summary_is_ignored_when_behind(metrics_path, tmp_path):
+    sink = Sink(str(tmp_path))
+    sink.record_metric('test', 1, 'test', RUN_ID, 'loss', 2.0)
+
+    records, reader = Archive.open_run(RUN_ID[:8], metrics_path)
+
+    assert reader.summary() is None
+    assert serving.structure_run(records, reader)['metrics']['loss']['max'] == 2.0
+
+
+def test_select_step_and_time_ranges(tmp_path):
+    sink = Sink(str(tmp_path))
+    sink.record_metrics('test', 1, 'test', RUN_ID,
+                        [['loss', float(step), step, 100.0 + step] for step in range(10)])
+    reader = MetricFileReader(os.path.join(str(tmp_path), 'metrics', 'test_v1_test_' + RUN_ID))
+
+    assert reader.select(start_step=2, end_step=5)['step'].tolist() == [2, 3, 4]
+    assert reader.select(start_time=107.0)['step'].tolist() == [7, 8, 9]
+    assert reader.select(start_step=2, end_time=104.0)['value'].tolist() == [2.0, 3.0]
+    assert len(reader.select()) == 10
+
+
+def test_select_time_range_of_unsorted_timestamps(tmp_path):
+    sink = Sink(str(tmp_path))
+    sink.record_metrics('test', 1, 'test', RUN_ID, [['loss', 1.0, 0, 100.0], ['loss', 2.0, 1, 50.0],
+                                                    ['loss', 3.0, 2, 200.0]])
+    reader = MetricFileReader(os.path.join(str(tmp_path), 'metrics', 'test_v1_test_' + RUN_ID))
+
+    assert reader.select(start_time=40, end_time=60)['value'].tolist() == [2.0]
+    assert reader.select(start_time=60)['value'].tolist() == [1.0, 3.0]
+
+
+def test_structure_run_in_step_range(metrics_path):
+    records, reader = Archive.open_run(RUN_ID[:8], metrics_path)
+    run = serving.structure_run(records, reader, start_step=0)
+
+    # The fixture records its metrics without a step, so none of them are in a step range.
+    assert len(run['metrics']) == 0
+    assert serving.structure_run(records, reader)['metrics']['loss']['steps'].tolist() == [-1, -1]
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None), ('bytes=0-99', (0, 99)), ('bytes=900-', (900, 999)), ('bytes=-100', (900, 999)),
+    ('bytes=500-5000', (500, 999)), ('bytes=0-1,5-6', None), ('items=0-1', None), ('bytes=-', None),
+    ('bytes=500-100', None), ('bytes=5000-100', None)])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=-0'])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(AssertionError):
+        parse_range(header, 1000)
+
+def test_etag_matches():
+    assert etag_matches('"abc"', 'abc')
+    assert etag_matches('"def", W/"abc"', 'abc')
+    assert etag_matches('*', 'abc')
+    assert not etag_matches('"def"', 'abc')
+    assert not etag_matches(None, 'abc')
+
+def test_read_file_streams_range(tmp_path):
+    file_path = str(tmp_path / 'output.bin')
+    with open(file_path, 'wb') as f:
+        f.write(bytes(range(100)))
+
+    chunks = list(read_file(file_path, 10, 59, chunk_size=16))
+
+    assert [len(chunk) for chunk in chunks] == [16, 16, 16, 2]
+    assert b''.join(chunks) == bytes(range(10, 60))
+
+def test_packed_batch_round_trip():
+    metrics = [['loss', 0.5, 1, 10.0], ['accuracy', 0.9, None, None], ['loss', 0.25, 2, 11.0]]
+
+    model, version, experiment, run, decoded = decode_packed(encode_packed('model', 1, 'default', RUN, metrics))
+
+    assert (model, version, experiment, run) == ('model', 1, 'default', RUN)
+    assert decoded == metrics
+
+def packed_header(**fields):
+    header = json.dumps(dict({'model': 'model', 'version': 1, 'experiment': 'default', 'run': RUN, 'names': []},
+                             **fields)).encode('utf-8')
+    return PACKED_MAGIC + HEADER_SIZE.pack(len(header)) + header
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'OBSPKD01',
+    encode_packed('model', 1, 'default', RUN, [['loss', 0.5]])[:-1],
+    PACKED_MAGIC + HEADER_SIZE.pack(len(b'{"names": []}') + 26) + b'{"names": []}',
+    packed_header(model='../../x'),
+    packed_header(experiment='a/b'),
+    packed_header(version='1.5'),
+    packed_header(run='../12345678'),
+    packed_header(names='loss'),
+    packed_header(names=[1]),
+])
+def test_decode_packed_refuses_invalid_batch(data):
+    with pytest.raises(AssertionError):
+        decode_packed(data)
+
+@pytest.mark.parametrize('coding', available_compressions())
+def test_decompress_refuses_oversized_body(coding):
+    data = compress(b'0' * 10000, coding)
+
+    assert decompress(data, coding) == b'0' * 10000
+
+    with pytest.raises(AssertionError):
+        decompress(data, coding, max_size=1000)
+
+
+@pytest.fixture()
+def flask_client(tmp_path, monkeypatch):
+    """
+    This fixture produces a test client of the flask tracking server that records to a temporary directory
+    """
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_restful')
+    from observatory import server
+    from observatory.spool import RecentKeys
+
+    (tmp_path / 'uploads').mkdir()
+    monkeypatch.setattr(server, 'sink', Sink(str(tmp_path)))
+    monkeypatch.setattr(server, 'serving', ServingClient(str(tmp_path)))
+    monkeypatch.setattr(server, 'recent_keys', RecentKeys())
+    monkeypatch.setitem(server.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+
+    client = server.app.test_client()
+    run = {'model': 'test-model', 'version': 1, 'experiment': 'default', 'run': RUN}
+    assert client.post('/api/start/', json=run).status_code == 201
+
+    yield client
+
+    assert client.post('/api/end/', json=dict(run, status='COMPLETED')).status_code == 201
+    server.sink.close()
+
+
+def test_flask_server_records_batch(flask_client, tmp_path):
+    run = {'model': 'test-model', 'version': 1, 'experiment': 'default', 'run': RUN}
+    metrics = [dict(run, name='loss', value=0.5, step=1), dict(run, name='loss', value=0.25, step=2)]
+
+    response = flask_client.post('/api/metrics/', json={'metrics': metrics})
+
+    assert response.status_code == 201
+    assert response.get_json()['recorded'] == 2
+    assert flask_client.post('/api/metrics/', json={'metrics': [{'name': 'loss'}]}).status_code == 400
+    assert ServingClient(str(tmp_path)).get_run(RUN[:8])['metrics']['loss']['values'].tolist() == [0.5, 0.25]
+
+
+def test_flask_server_records_compressed_packed_batch(flask_client, tmp_path):
+    body = compress(encode_packed('test-model', 1, 'default', RUN, [['loss', 0.5, 1, 100.0], ['loss', 0.25, 2, 101.0]]),
+                    'gzip')
+
+    response = flask_client.post('/api/metrics/', data=body, content_type=PACKED_CONTENT_TYPE,
+                                 headers={'Content-Encoding': 'gzip'})
+
+    assert response.status_code == 201
+    assert 'gzip' in response.headers['Accept-Encoding']
+    assert ServingClient(str(tmp_path)).get_run(RUN[:8])['metrics']['loss']['steps'].tolist() == [1, 2]
+
+
+def test_flask_server_refuses_invalid_packed_batch(flask_client):
+    response = flask_client.post('/api/metrics/', data=packed_header(model='../../x'),
+                                 content_type=PACKED_CONTENT_TYPE)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('fields', [{'model': '../../x'}, {'model': None}, {'version': 'v1'},
+                                    {'experiment': 'Default'}, {'run': '..'}, {'run': 'A1B2C3D4-E5F6'}])
+def test_flask_server_refuses_invalid_run(flask_client, tmp_path, fields):
+    run = dict({'model': 'test-model', 'version': 1, 'experiment': 'default', 'run': RUN}, **fields)
+    query = '&'.join(f'{name}={run[name]}' for name in ('model', 'version', 'experiment') if run[name] is not None)
+
+    assert flask_client.post('/api/start/', json=run).status_code == 400
+    assert flask_client.post('/api/end/', json=dict(run, status='COMPLETED')).status_code == 400
+    assert flask_client.post('/api/metrics/', json={'metrics': [dict(run, name='loss', value=0.5)]}).status_code == 400
+
+    if run['run'] != '..':
+        # The run of these routes is part of the url.
+        url = f'/api/metrics/{run["run"]}'
+        assert flask_client.post(url, json=dict(run, name='loss', value=0.5)).status_code == 400
+        assert flask_client.post(f'{url}/stream?{query}', data='').status_code == 400
+        assert flask_client.post(f'/api/settings/{run["run"]}', json=dict(run, settings='{}')).status_code == 400
+        assert flask_client.post(f'/api/output/{run["run"]}/uploads',
+                                 json=dict(run, filename='a.pkl')).status_code == 400
+
+    assert not (tmp_path.parent / 'x').exists()
+    assert ServingClient(str(tmp_path)).get_run(RUN[:8])['metrics'] == {}
+
+
+def test_flask_server_records_stream(flask_client, tmp_path):
+    lines = ''.join(json.dumps({'name': 'loss', 'value': value, 'step': step}) + '\n'
+                    for step, value in enumerate([0.5, 0.25, 0.125]))
+
+    response = flask_client.post(f'/api/metrics/{RUN}/stream?model=test-model&version=1&experiment=default',
+                                 data=lines + 'broken\n')
+
+    assert response.status_code == 400
+    assert ServingClient(str(tmp_path)).get_run(RUN[:8])['metrics']['loss']['steps'].tolist() == [0, 1, 2]
+    assert flask_client.post(f'/api/metrics/{RUN}/stream?model=test-model', data=lines).status_code == 400
+
+
+def test_flask_server_records_chunked_upload_and_serves_ranges(flask_client):
+    contents = b'0123456789'
+    form = {'model': 'test-model', 'version': 1, 'experiment': 'default', 'filename': 'model.pkl',
+            'size': len(contents)}
+
+    upload_id = flask_client.post(f'/api/output/{RUN}/uploads', json=form).get_json()['upload']
+
+    response = flask_client.put(f'/api/uploads/{upload_id}', data=contents[:4],
+                                headers={'Content-Range': 'bytes 0-3/10'})
+    assert response.get_json()['offset'] == 4
+
+    response = flask_client.put(f'/api/uploads/{upload_id}', data=contents[:4],
+                                headers={'Content-Range': 'bytes 0-3/10'})
+    assert response.status_code == 409
+
+    flask_client.put(f'/api/uploads/{upload_id}', data=contents[4:], headers={'Content-Range': 'bytes 4-9/10'})
+    response = flask_client.post(f'/api/uploads/{upload_id}', json={'checksum': hashlib.sha256(contents).hexdigest()})
+    assert response.status_code == 201
+
+    response = flask_client.get(f'/api/output/{RUN[:8]}?filename=model.pkl', headers={'Range': 'bytes=2-4'})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 2-4/10'
+    assert response.get_data() == b'234'
+
+    # A reversed range is ignored and the whole file is sent.
+    response = flask_client.get(f'/api/output/{RUN[:8]}?filename=model.pkl', headers={'Range': 'bytes=4-2'})
+
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+    assert response.get_data() == contents
+
+    response = flask_client.get(f'/api/output/{RUN[:8]}?filename=model.pkl',
+                                headers={'If-None-Match': response.headers['ETag']})
+
+    assert response.status_code == 304
+
+
+def test_flask_server_records_repeated_request_once(flask_client, tmp_path):
+    metric = {'model': 'test-model', 'version': 1, 'experiment': 'default', 'name': 'loss', 'value': 0.5}
+
+    for _ in range(2):
+        response = flask_client.post(f'/api/metrics/{RUN}', json=metric, headers={'Idempotency-Key': 'key'})
+        assert response.status_code == 201
+
+    # A request that failed is recorded when it is sent again.
+    assert flask_client.post('/api/metrics/', json={}, headers={'Idempotency-Key': 'other'}).status_code == 400
+    assert flask_client.post('/api/metrics/', json={'metrics': [dict(metric, run=RUN)]},
+                             headers={'Idempotency-Key': 'other'}).get_json() == {'status': 'success', 'recorded': 1}
+
+    assert ServingClient(str(tmp_path)).get_run(RUN[:8])['metrics']['loss']['values'].tolist() == [0.5, 0.5]
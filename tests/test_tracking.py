@@ -1,17 +1,29 @@
+import asyncio
+import hashlib
+import io
 import json
 import os
 import pickle
 from os.path import expanduser
 from tempfile import mkstemp
 
+import numpy as np
+import observatory.tracking
 import pytest
 import requests
 import requests.exceptions
 from hypothesis import assume, example, given, strategies
-from observatory.constants import LABEL_PATTERN
-from observatory.sink import Sink
+from observatory.archive import Archive
+from observatory.buffering import BackgroundWriter, StreamingWriter
+from observatory import settings
+from observatory.constants import LABEL_PATTERN, _matches, is_valid_label
+from observatory.metricfile import NO_STEP, MetricFileReader, read_metrics
+from observatory.outputstore import hash_file
+from observatory.serving import ServingClient
+from observatory.sink import Sink, SqliteSink
+from observatory.spool import IDEMPOTENCY_HEADER, RecentKeys, SharedRecentKeys
 from observatory.tracking import (LocalState, RemoteState, TrackingSession,
-                                  start_run)
+                                  download_output, start_run)
 
 INVALID_LABELS = ['test!', 'TEst', 'Test', 'Test 123', '', '  ', 'test!']
 
@@ -154,3 +166,854 @@ def test_record_settings():
 def test_record_settings_without_keys():
     with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
         session.record_settings()
+
+def read_records(file_path):
+    records = []
+    with open(file_path, 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+    return records
+
+@pytest.fixture()
+def local_sink(tmp_path, monkeypatch):
+    """
+    This fixture replaces the sink used by the LocalState with a sink
+    that writes to a temporary directory.
+    """
+    local_sink = Sink(str(tmp_path))
+    monkeypatch.setattr('observatory.tracking.sink', local_sink)
+
+    yield local_sink
+
+@pytest.fixture()
+def buffered(monkeypatch):
+    monkeypatch.setattr('observatory.settings.buffer_size', 3)
+    monkeypatch.setattr('observatory.settings.flush_interval', 60.0)
+
+def test_record_metrics_buffered_flushes_on_exit(local_sink, buffered, mocker):
+    record_metrics = mocker.spy(local_sink, 'record_metrics')
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        session.record_metric('loss', 0.5)
+        session.record_metric('accuracy', 0.9)
+
+        assert record_metrics.call_count == 0
+
+    assert record_metrics.call_count == 1
+    assert [metric[:3] for metric in record_metrics.call_args[0][4]] == [['loss', 0.5, None], ['accuracy', 0.9, None]]
+
+    metrics = read_metrics(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+    assert metrics == [['loss', 0.5], ['accuracy', 0.9]]
+
+def test_session_ends_when_buffered_metrics_can_not_be_written(buffered, mocker):
+    state = mocker.Mock(spec=LocalState)
+    state.record_metrics.side_effect = IOError('disk full')
+
+    with pytest.raises(IOError):
+        with TrackingSession('test', 1, 'test', 'test', state) as session:
+            session.record_metric('loss', 0.5)
+
+    state.record_session_end.assert_called_once_with('test', 1, 'test', 'test', 'FAILED')
+
+def test_session_keeps_error_of_run_when_ending_fails(buffered, mocker):
+    state = mocker.Mock(spec=LocalState)
+    state.record_metrics.side_effect = IOError('disk full')
+
+    with pytest.warns(RuntimeWarning), pytest.raises(ValueError):
+        with TrackingSession('test', 1, 'test', 'test', state) as session:
+            session.record_metric('loss', 0.5)
+            raise ValueError('diverged')
+
+    state.record_session_end.assert_called_once_with('test', 1, 'test', 'test', 'FAILED')
+
+def test_record_metrics_buffered_flushes_when_full(local_sink, buffered, mocker):
+    record_metrics = mocker.spy(local_sink, 'record_metrics')
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        for step in range(4):
+            session.record_metric('loss', step)
+
+        assert record_metrics.call_count == 1
+
+    assert record_metrics.call_count == 2
+
+def test_record_metrics_buffered_flushes_after_interval(local_sink, buffered, monkeypatch, mocker):
+    monkeypatch.setattr('observatory.settings.flush_interval', 0.0)
+    record_metrics = mocker.spy(local_sink, 'record_metrics')
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        session.record_metric('loss', 1.0)
+
+        assert record_metrics.call_count == 1
+
+def test_record_metrics_async_writes_all_metrics(local_sink, monkeypatch):
+    monkeypatch.setattr('observatory.settings.async_writes', True)
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        for step in range(100):
+            session.record_metric('loss', step)
+
+    metrics = read_metrics(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+    assert metrics == [['loss', step] for step in range(100)]
+
+    records = read_records(local_sink._run_file('metrics', 'test', 1, 'test', 'test'))
+    assert records[-1][0] == 'COMPLETED'
+
+@pytest.mark.parametrize('backpressure, expected', [
+    ('drop-newest', [0, 1]),
+    ('drop-oldest', [2, 3]),
+])
+def test_background_writer_drops_metrics_when_full(backpressure, expected):
+    written = []
+    writer = BackgroundWriter(written.extend, 2, backpressure)
+
+    # The writer thread isn't started yet, so the queue is full after two metrics.
+    for metric in range(4):
+        writer.put(metric)
+
+    writer.start()
+
+    with pytest.warns(RuntimeWarning):
+        writer.close()
+
+    assert written == expected
+    assert writer.dropped == 2
+
+def test_background_writer_raises_write_error_when_closed():
+    def write(batch):
+        raise IOError('disk full')
+
+    writer = BackgroundWriter(write, 2)
+    writer.put(0)
+
+    with pytest.warns(RuntimeWarning), pytest.raises(RuntimeError) as error:
+        writer.start()
+        writer.close()
+
+    assert isinstance(error.value.__cause__, IOError)
+    assert writer.failed == 1
+
+def test_background_writer_with_invalid_backpressure():
+    with pytest.raises(AssertionError):
+        BackgroundWriter(print, 2, 'invalid')
+
+def test_remote_state_reuses_http_session(mocker):
+    response = mocker.Mock(status_code=201, headers={'Content-Type': 'application/json'})
+    post = mocker.patch('requests.Session.post', return_value=response)
+
+    state = RemoteState()
+    state.record_session_start('test', 1, 'test', 'test')
+    state.record_metric('test', 1, 'test', 'test', 'loss', 0.5)
+    state.record_session_end('test', 1, 'test', 'test', 'COMPLETED')
+
+    assert post.call_count == 3
+    assert state._session is state._session
+    assert post.call_args[1]['timeout'] == (settings.connect_timeout, settings.read_timeout)
+
+def test_remote_state_records_buffered_metrics_in_bulk(buffered, mocker):
+    response = mocker.Mock(status_code=201, headers={'Content-Type': 'application/json'})
+    post = mocker.patch('requests.Session.post', return_value=response)
+
+    with TrackingSession('test', 1, 'test', 'test', RemoteState()) as session:
+        session.record_metric('loss', 0.5)
+        session.record_metric('accuracy', 0.9)
+
+    urls = [call[0][0] for call in post.call_args_list]
+    assert urls == [f'{settings.server_url}/start/', f'{settings.server_url}/metrics/', f'{settings.server_url}/end/']
+
+    payload = json.loads(post.call_args_list[1][1]['data'])
+    assert [(metric['run'], metric['name'], metric['value']) for metric in payload['metrics']] == \
+        [('test', 'loss', 0.5), ('test', 'accuracy', 0.9)]
+
+def test_remote_state_streams_metrics(monkeypatch, mocker):
+    monkeypatch.setattr('observatory.settings.streaming', True)
+    response = mocker.Mock(status_code=201, headers={'Content-Type': 'application/json'})
+    streamed = []
+
+    def post(url, data=None, **kwargs):
+        if url.endswith('/stream'):
+            streamed.extend(data)
+        return response
+
+    mocker.patch('requests.Session.post', side_effect=post)
+
+    with TrackingSession('test', 1, 'test', 'test', RemoteState()) as session:
+        session.record_metric('loss', 0.5)
+        session.record_metric('accuracy', 0.9)
+
+    lines = b''.join(streamed).decode('utf-8').splitlines()
+    assert [json.loads(line)['name'] for line in lines] == ['loss', 'accuracy']
+    assert [json.loads(line)['value'] for line in lines] == [0.5, 0.9]
+
+
+def test_streaming_writer_falls_back_to_batches_when_stream_fails():
+    import threading
+
+    written = []
+    failing = threading.Event()
+
+    def consume(batches):
+        # The first metric is received, the stream fails before the others are.
+        next(batches)
+        failing.wait()
+        raise ConnectionError('connection reset')
+
+    writer = StreamingWriter(consume, written.extend, 1)
+    writer.start()
+    writer.send(0)
+    writer.send(1)
+
+    # The queue is full, the caller waits until the consumer fails.
+    sender = threading.Thread(target=writer.send, args=(2,))
+    sender.start()
+    failing.set()
+    sender.join()
+    writer.send(3)
+
+    with pytest.warns(RuntimeWarning):
+        assert writer.close() is None
+
+    assert isinstance(writer.error, ConnectionError)
+    assert written == [1, 2, 3]
+
+
+def test_remote_state_sends_batches_when_stream_fails(tmp_path, async_server_url, monkeypatch, mocker):
+    monkeypatch.setattr(settings, 'server_url', async_server_url)
+    monkeypatch.setattr(settings, 'streaming', True)
+    post = requests.Session.post
+
+    def refuse_stream(session, url, **kwargs):
+        if url.endswith('/stream'):
+            raise requests.ConnectionError('connection refused')
+        return post(session, url, **kwargs)
+
+    mocker.patch('requests.Session.post', autospec=True, side_effect=refuse_stream)
+
+    with pytest.warns(RuntimeWarning):
+        with TrackingSession('test-model', 1, 'default', 'a1b2c3d4-run', RemoteState()) as session:
+            session.record_metric('loss', 0.5, step=1)
+            session.record_metric('loss', 0.25, step=2)
+            session.record_metric('loss', 0.125, step=3)
+
+    run = ServingClient(str(tmp_path)).get_run('a1b2c3d4')
+
+    assert run['status'] == 'COMPLETED'
+    assert run['metrics']['loss']['steps'].tolist() == [1, 2, 3]
+
+
+def test_record_metric_with_step(local_sink):
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        session.record_metric('loss', 1.0, step=1)
+        session.record_metric('loss', 0.5, step=2)
+        session.record_metric('accuracy', 0.9)
+
+    reader = MetricFileReader(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+
+    assert reader.records['step'].tolist() == [1, 2, NO_STEP]
+    assert np.all(np.diff(reader.records['timestamp']) >= 0)
+
+@pytest.mark.parametrize('step', [-1, 1.5, '1'])
+def test_record_metric_with_invalid_step(step):
+    with pytest.raises(AssertionError):
+        with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+            session.record_metric('loss', 1.0, step=step)
+
+def test_session_timestamps_never_go_backwards(local_sink, mocker):
+    mocker.patch('observatory.tracking.time', side_effect=[100.0, 90.0, 110.0])
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        for step in range(3):
+            session.record_metric('loss', 1.0, step=step)
+
+    reader = MetricFileReader(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+
+    assert reader.records['timestamp'].tolist() == [100.0, 100.0, 110.0]
+
+def test_record_metrics_writes_one_batch(local_sink, mocker):
+    record_metrics = mocker.spy(local_sink, 'record_metrics')
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        session.record_metrics({'loss': 0.5, 'accuracy': 0.9, 'epoch': 1}, step=3)
+
+    assert record_metrics.call_count == 1
+
+    reader = MetricFileReader(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+
+    assert reader.names == ['loss', 'accuracy', 'epoch']
+    assert reader.records['value'].tolist() == [0.5, 0.9, 1.0]
+    assert reader.records['step'].tolist() == [3, 3, 3]
+    assert len(set(reader.records['timestamp'].tolist())) == 1
+
+def test_record_array_names_values_by_label(local_sink):
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        session.record_array('precision', np.array([0.1, 0.2, 0.3], dtype=np.float32))
+        session.record_array('recall', [0.4, 0.5], labels=['cat', 'dog'])
+
+    metrics = read_metrics(local_sink._run_file('metrics', 'test', 1, 'test', 'test', extension=''))
+
+    assert [name for name, _ in metrics] == ['precision-0', 'precision-1', 'precision-2', 'recall-cat', 'recall-dog']
+    assert np.allclose([value for _, value in metrics], [0.1, 0.2, 0.3, 0.4, 0.5])
+
+@pytest.mark.parametrize('metrics', [{'loss': 0.5, 'Accuracy': 0.9}, {'loss': 0.5, 'accuracy': 'high'}, [0.5]])
+def test_record_metrics_with_invalid_metrics_records_nothing(local_sink, metrics, mocker):
+    record_metrics = mocker.spy(local_sink, 'record_metrics')
+
+    with pytest.raises(AssertionError):
+        with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+            session.record_metrics(metrics)
+
+    assert record_metrics.call_count == 0
+
+def test_remote_state_records_metrics_in_one_request(mocker):
+    response = mocker.Mock(status_code=201, headers={'Content-Type': 'application/json'})
+    post = mocker.patch('requests.Session.post', return_value=response)
+
+    with TrackingSession('test', 1, 'test', 'test', RemoteState()) as session:
+        session.record_array('loss', np.array([0.5, 0.25]), step=1)
+
+    assert post.call_count == 3
+
+    payload = json.loads(post.call_args_list[1][1]['data'])
+    assert [(metric['name'], metric['value'], metric['step']) for metric in payload['metrics']] == \
+        [('loss-0', 0.5, 1), ('loss-1', 0.25, 1)]
+
+@pytest.mark.parametrize('label, expected', [
+    ('loss', True), ('val-loss', True), ('-loss', False), ('loss-', False),
+    ('a' * 64, False), ('', False), (' ', False), (None, False), (1, False), (['loss'], False)])
+def test_is_valid_label(label, expected):
+    assert is_valid_label(label) == expected
+
+def test_record_metric_validates_each_name_once(local_sink):
+    _matches.cache_clear()
+
+    with TrackingSession('test', 1, 'test', 'test', LocalState()) as session:
+        for step in range(10):
+            session.record_metric('cached-loss', 1.0, step=step)
+
+    assert _matches.cache_info().misses == 1
+    assert _matches.cache_info().hits == 9
+
+
+class FakeUploadServer:
+    """
+    Answers the upload requests of RemoteState with a sink, like the server does.
+    The first chunk request fails once, to simulate an interrupted upload.
+    """
+
+    def __init__(self, sink, mocker):
+        self.sink = sink
+        self.chunks = 0
+        self.failed = False
+        self.mocker = mocker
+
+    def response(self, status_code, body):
+        return self.mocker.Mock(status_code=status_code, headers={'Content-Type': 'application/json'},
+                                json=lambda: body)
+
+    def post(self, url, data=None, **kwargs):
+        body = json.loads(data)
+
+        if url.endswith('/uploads'):
+            upload_id = self.sink.begin_output_upload(body['model'], body['version'], body['experiment'],
+                                                      url.split('/')[-2], body['filename'], body['size'])
+            return self.response(201, {'upload': upload_id})
+
+        return self.response(201, {'hash': self.sink.finish_output_upload(url.split('/')[-1], body['checksum'])})
+
+    def put(self, url, data=None, headers=None, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise requests.exceptions.ConnectionError('Connection reset')
+
+        self.chunks += 1
+        offset = int(headers['content-range'].split(' ')[1].split('-')[0])
+        return self.response(200, {'offset': self.sink.write_output_chunk(url.split('/')[-1], offset, io.BytesIO(data))})
+
+    def get(self, url, **kwargs):
+        return self.response(200, {'offset': self.sink.output_upload_offset(url.split('/')[-1])})
+
+
+def test_remote_state_uploads_outputs_in_chunks(tmp_path, monkeypatch, mocker):
+    monkeypatch.setattr('observatory.settings.upload_chunk_size', 1000)
+    sink = Sink(str(tmp_path))
+    sink.record_session_start('test', 1, 'test', 'test')
+    server = FakeUploadServer(sink, mocker)
+    mocker.patch('requests.Session.post', side_effect=server.post)
+    mocker.patch('requests.Session.put', side_effect=server.put)
+    mocker.patch('requests.Session.get', side_effect=server.get)
+
+    file_path = str(tmp_path / 'model.pkl')
+    with open(file_path, 'wb') as f:
+        f.write(os.urandom(4500))
+
+    RemoteState().record_output('test', 1, 'test', 'test', 'model.pkl', file_path)
+
+    outputs = Archive.get_output('test', os.path.join(str(tmp_path), 'metrics'))
+
+    assert server.chunks == 5
+    assert outputs['model.pkl']['size'] == 4500
+    assert outputs['model.pkl']['hash'] == hash_file(file_path)
+
+def test_finish_upload_with_wrong_checksum_discards_upload(tmp_path):
+    sink = Sink(str(tmp_path))
+    upload_id = sink.begin_output_upload('test', 1, 'test', 'test', 'model.pkl')
+    sink.write_output_chunk(upload_id, 0, io.BytesIO(b'model'))
+
+    with pytest.raises(AssertionError):
+        sink.write_output_chunk(upload_id, 0, io.BytesIO(b'model'))
+
+    with pytest.raises(RuntimeError):
+        sink.finish_output_upload(upload_id, '0' * 64)
+
+    with pytest.raises(AssertionError):
+        sink.output_upload_offset(upload_id)
+
+def download_response(mocker, status_code, contents=b'', digest=None):
+    return mocker.Mock(status_code=status_code, headers={'ETag': f'"{digest}"'},
+                       iter_content=lambda chunk_size: iter([contents]))
+
+def test_download_output_continues_partial_download(tmp_path, mocker):
+    contents = os.urandom(1000)
+    digest = hashlib.sha256(contents).hexdigest()
+    destination = str(tmp_path / 'model.pkl')
+
+    with open(destination + '.part', 'wb') as f:
+        f.write(contents[:400])
+
+    get = mocker.patch('requests.Session.get', return_value=download_response(mocker, 206, contents[400:], digest))
+
+    assert download_output('12345678', 'model.pkl', destination) == destination
+    assert get.call_args[1]['headers'] == {'Range': 'bytes=400-'}
+    assert not os.path.exists(destination + '.part')
+
+    with open(destination, 'rb') as f:
+        assert f.read() == contents
+
+    get.return_value = download_response(mocker, 304)
+    download_output('12345678', 'model.pkl', destination)
+
+    assert get.call_args[1]['headers'] == {'If-None-Match': f'"{digest}"'}
+
+def test_download_output_discards_corrupt_download(tmp_path, mocker):
+    destination = str(tmp_path / 'model.pkl')
+    mocker.patch('requests.Session.get', return_value=download_response(mocker, 200, b'model', '0' * 64))
+
+    with pytest.raises(RuntimeError):
+        download_output('12345678', 'model.pkl', destination)
+
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_async_session_records_run_on_async_server(tmp_path, run_output, monkeypatch):
+    pytest.importorskip('aiohttp')
+    from aiohttp.test_utils import TestServer
+    from observatory.asyncserver import create_app
+    from observatory.serving import ServingClient
+    from observatory.tracking import start_async_run
+
+    server_sink = Sink(str(tmp_path))
+    monkeypatch.setattr(settings, 'upload_chunk_size', 3)
+
+    async def record_run():
+        async with TestServer(create_app(server_sink, ServingClient(str(tmp_path)))) as server:
+            monkeypatch.setattr(settings, 'server_url', str(server.make_url('/api')))
+
+            async with start_async_run('test-model', 1) as run:
+                await run.record_metric('loss', 0.5, step=1)
+                await run.record_metrics({'loss': 0.25, 'accuracy': 0.9}, step=2)
+                await run.record_settings(alpha=0.1)
+                await run.record_output(run_output, 'output.txt')
+
+        return run.run_id
+
+    run_id = asyncio.run(record_run())
+
+    run = ServingClient(str(tmp_path)).get_run(run_id[:8])
+    outputs = Archive.get_output(run_id[:8], str(tmp_path / 'metrics'))
+
+    assert run['status'] == 'COMPLETED'
+    assert run['metrics']['loss']['values'].tolist() == [0.5, 0.25]
+    assert run['metrics']['loss']['steps'].tolist() == [1, 2]
+    assert outputs['output.txt']['hash'] == hash_file(run_output)
+
+
+def test_async_session_refuses_invalid_metrics():
+    pytest.importorskip('aiohttp')
+    from observatory.tracking import AsyncRemoteState, AsyncTrackingSession
+
+    session = AsyncTrackingSession('test-model', 1, 'default', 'test-run', AsyncRemoteState())
+
+    with pytest.raises(AssertionError):
+        asyncio.run(session.record_metric('Loss', 0.5))
+
+    with pytest.raises(AssertionError):
+        asyncio.run(session.record_metrics({'loss': 'high'}))
+
+
+def test_grpc_state_streams_run_to_grpc_server(tmp_path, monkeypatch):
+    pytest.importorskip('observatory.grpcserver')
+    from observatory.grpcserver import create_server
+    from observatory.serving import ServingClient
+
+    server, port = create_server(Sink(str(tmp_path)), port=0)
+    server.start()
+
+    monkeypatch.setattr(settings, 'grpc_target', f'127.0.0.1:{port}')
+    monkeypatch.setattr(settings, 'state', 'grpc')
+
+    try:
+        with start_run('test-model', 1) as run:
+            run.record_metric('loss', 0.5, step=1)
+            run.record_metrics({'loss': 0.25, 'accuracy': 0.9}, step=2)
+            run.record_settings(alpha=0.1)
+    finally:
+        server.stop(None)
+
+    recorded = ServingClient(str(tmp_path)).get_run(run.run_id[:8])
+
+    assert recorded['status'] == 'COMPLETED'
+    assert recorded['metrics']['loss']['values'].tolist() == [0.5, 0.25]
+    assert recorded['metrics']['loss']['steps'].tolist() == [1, 2]
+    assert recorded['metrics']['accuracy']['steps'].tolist() == [2]
+
+
+def test_grpc_state_ends_run_when_stream_fails(tmp_path, monkeypatch):
+    pytest.importorskip('observatory.grpcserver')
+    from observatory.grpcserver import create_server
+    from observatory.tracking import GrpcState
+
+    class FailingSink(Sink):
+        def record_metrics(self, model, version, experiment, run_id, metrics):
+            raise IOError('disk full')
+
+    server, port = create_server(FailingSink(str(tmp_path)), port=0)
+    server.start()
+    monkeypatch.setattr(settings, 'grpc_target', f'127.0.0.1:{port}')
+    state = GrpcState()
+
+    try:
+        state.record_session_start('test-model', 1, 'default', 'a1b2c3d4-run')
+        state.record_metrics('test-model', 1, 'default', 'a1b2c3d4-run', [['loss', 0.5, 1, None]])
+
+        with pytest.warns(RuntimeWarning):
+            state.record_session_end('test-model', 1, 'default', 'a1b2c3d4-run', 'COMPLETED')
+
+        assert state._channel is None
+
+        # Metrics sent in a call of their own report that they were not recorded.
+        with pytest.raises(RuntimeError):
+            state.record_metrics('test-model', 1, 'default', 'a1b2c3d4-run', [['loss', 0.5, 1, None]])
+    finally:
+        server.stop(None)
+
+    assert ServingClient(str(tmp_path)).get_run('a1b2c3d4')['status'] == 'COMPLETED'
+
+
+def test_grpc_server_refuses_invalid_run(tmp_path, monkeypatch):
+    pytest.importorskip('observatory.grpcserver')
+    from observatory.grpcserver import create_server
+    from observatory.tracking import GrpcState
+
+    server, port = create_server(Sink(str(tmp_path)), port=0)
+    server.start()
+    monkeypatch.setattr(settings, 'grpc_target', f'127.0.0.1:{port}')
+
+    try:
+        with pytest.raises(RuntimeError):
+            GrpcState().record_session_start('../../x', 1, 'default', 'a1b2c3d4-run')
+    finally:
+        server.stop(None)
+
+    assert not (tmp_path.parent / 'x').exists()
+    assert os.listdir(str(tmp_path / 'metrics')) == ['index.sqlite']
+
+
+def test_grpc_state_reports_unreachable_server(monkeypatch):
+    pytest.importorskip('grpc')
+    pytest.importorskip('observatory.proto')
+    from observatory.tracking import GrpcState
+
+    monkeypatch.setattr(settings, 'grpc_target', '127.0.0.1:1')
+    monkeypatch.setattr(settings, 'read_timeout', 0.5)
+
+    with pytest.raises(RuntimeError):
+        GrpcState().record_session_start('test-model', 1, 'default', 'test-run')
+
+
+@pytest.fixture()
+def spooling(tmp_path, monkeypatch):
+    """
+    This fixture enables spooling to a temporary directory and closes the spool after the test
+    """
+    monkeypatch.setattr(settings, 'spooling', True)
+    monkeypatch.setattr(settings, 'spool_path', str(tmp_path / 'spool'))
+    monkeypatch.setattr(settings, 'retry_interval', 0.01)
+    monkeypatch.setattr('observatory.tracking._spool', None)
+
+    yield str(tmp_path / 'spool')
+
+    from observatory import tracking
+
+    if tracking._spool is not None:
+        tracking._spool.close()
+
+def test_remote_state_spools_requests_while_server_is_down(spooling, mocker):
+    from observatory import tracking
+
+    response = mocker.Mock(status_code=201, headers={'Content-Type': 'application/json'})
+    outage = [requests.exceptions.ConnectionError('Connection refused')] * 3
+    sent = []
+
+    def post(url, data=None, headers=None, **kwargs):
+        sent.append((url, headers[IDEMPOTENCY_HEADER]))
+
+        if outage:
+            raise outage.pop()
+        return response
+
+    mocker.patch('requests.Session.post', side_effect=post)
+
+    with TrackingSession('test', 1, 'test', 'test', RemoteState()) as session:
+        session.record_metric('loss', 0.5)
+
+    assert tracking._spool.wait(timeout=5)
+
+    urls = [url for url, _ in sent]
+    assert urls[-3:] == [f'{settings.server_url}/start/', f'{settings.server_url}/metrics/test',
+                         f'{settings.server_url}/end/']
+    # The replayed start of the run is sent with the same key as the request that failed.
+    assert len({key for url, key in sent if url.endswith('/start/')}) == 1
+
+def test_spool_replays_spool_of_exited_process(tmp_path):
+    import subprocess
+    import sys
+    from observatory.spool import Spool
+
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+
+    with open(tmp_path / f'{process.pid}.spool', 'w') as f:
+        f.write(json.dumps({'key': 'a', 'path': '/end/', 'content_type': 'application/json', 'body': '{}'}) + '\n')
+
+    replayed = []
+    spool = Spool(str(tmp_path), lambda request: replayed.append(request) or True, 1024, 0.01, 0.01)
+
+    assert spool.wait(timeout=5)
+    spool.close()
+
+    assert [request['key'] for request in replayed] == ['a']
+    assert not (tmp_path / f'{process.pid}.spool').exists()
+
+def test_spool_checks_processes_without_signals_on_windows(monkeypatch, mocker):
+    from observatory import spool
+
+    monkeypatch.setattr(os, 'name', 'nt')
+    kill = mocker.patch('os.kill')
+    check = mocker.patch('observatory.spool._is_running_on_windows', return_value=False)
+
+    assert not spool._is_running(os.getpid() + 1)
+    check.assert_called_once_with(os.getpid() + 1)
+    kill.assert_not_called()
+
+
+def test_spool_skips_request_that_can_not_be_replayed(tmp_path):
+    from observatory.spool import Spool
+
+    replayed = []
+
+    def send(request):
+        replayed.append(request['key'])
+        return request['broken']
+
+    spool = Spool(str(tmp_path), send, 1024, 0.01, 0.01)
+
+    with pytest.warns(RuntimeWarning):
+        spool.append({'key': 'a', 'path': '/start/'})
+        spool.append({'key': 'b', 'path': '/end/', 'broken': True})
+        assert spool.wait(timeout=5)
+
+    spool.close()
+
+    assert replayed == ['a', 'b']
+
+def test_spool_drops_requests_when_full(tmp_path):
+    from observatory.spool import Spool
+
+    spool = Spool(str(tmp_path), lambda request: False, 200, 10, 10)
+
+    with pytest.warns(RuntimeWarning):
+        results = [spool.append({'key': str(i), 'path': '/end/', 'content_type': 'application/json', 'body': '{}'})
+                   for i in range(5)]
+
+    spool.close()
+
+    assert results[:2] == [True, True]
+    assert results[-1] is False
+    assert os.path.getsize(os.path.join(str(tmp_path), f'{os.getpid()}.spool')) <= 200
+    assert spool.dropped == results.count(False)
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_recent_keys_are_reserved_once(tmp_path, shared):
+    create = (lambda: SharedRecentKeys(str(tmp_path / 'keys.sqlite'), size=2)) if shared else (lambda: RecentKeys(2))
+    keys = create()
+    # Shared keys are seen by every worker that opens the same file.
+    other = create() if shared else keys
+
+    assert keys.reserve('a')
+    assert not other.reserve('a')
+
+    other.release('a')
+    assert keys.reserve('a')
+
+    keys.reserve('b')
+    keys.reserve('c')
+
+    assert 'a' not in other
+    assert 'b' in other and 'c' in other
+
+
+def test_async_server_records_repeated_request_once(tmp_path):
+    pytest.importorskip('aiohttp')
+    from aiohttp.test_utils import TestClient, TestServer
+    from observatory.asyncserver import create_app
+    from observatory.serving import ServingClient
+
+    metric = {'model': 'test-model', 'version': 1, 'experiment': 'default', 'name': 'loss', 'value': 0.5}
+
+    async def send_twice():
+        app = create_app(Sink(str(tmp_path)), ServingClient(str(tmp_path)))
+
+        async with TestClient(TestServer(app)) as client:
+            start = dict(metric, run='a1b2c3d4-run')
+            await client.post('/api/start/', json=start)
+
+            for _ in range(2):
+                response = await client.post('/api/metrics/a1b2c3d4-run', json=metric,
+                                             headers={IDEMPOTENCY_HEADER: 'key'})
+                assert response.status == 201
+
+    asyncio.run(send_twice())
+
+    run = ServingClient(str(tmp_path)).get_run('a1b2c3d4')
+    assert run['metrics']['loss']['values'].tolist() == [0.5]
+
+
+def test_async_server_refuses_invalid_run(tmp_path):
+    pytest.importorskip('aiohttp')
+    from aiohttp.test_utils import TestClient, TestServer
+    from observatory.asyncserver import create_app
+    from observatory.serving import ServingClient
+
+    run = {'model': '../../x', 'version': 1, 'experiment': 'default', 'run': 'a1b2c3d4-run'}
+
+    async def send():
+        async with TestClient(TestServer(create_app(Sink(str(tmp_path)), ServingClient(str(tmp_path))))) as client:
+            responses = [
+                await client.post('/api/start/', json=run),
+                await client.post('/api/start/', json=dict(run, model='test-model', version=None)),
+                await client.post('/api/end/', json=dict(run, status='COMPLETED')),
+                await client.post('/api/metrics/', json={'metrics': [dict(run, name='loss', value=0.5)]}),
+                await client.post('/api/metrics/A1B2C3D4', json=dict(run, model='test-model', name='loss', value=0.5)),
+                await client.post('/api/metrics/a1b2c3d4-run/stream?model=test-model&version=1', data=b''),
+                await client.post('/api/settings/a1b2c3d4-run', json=dict(run, settings={})),
+                await client.post('/api/output/a1b2c3d4-run/uploads', json=dict(run, filename='a.pkl')),
+            ]
+            return [response.status for response in responses]
+
+    assert asyncio.run(send()) == [400] * 8
+    assert not (tmp_path.parent / 'x').exists()
+    assert os.listdir(str(tmp_path / 'metrics')) == ['index.sqlite']
+
+
+def test_async_server_ignores_reversed_range(tmp_path, run_output):
+    pytest.importorskip('aiohttp')
+    from aiohttp.test_utils import TestClient, TestServer
+    from observatory.asyncserver import create_app
+    from observatory.serving import ServingClient
+
+    sink = Sink(str(tmp_path))
+    sink.record_session_start('test-model', 1, 'default', 'a1b2c3d4-run')
+    sink.record_output('test-model', 1, 'default', 'a1b2c3d4-run', 'output.txt', run_output)
+
+    async def get_output(byte_range):
+        async with TestClient(TestServer(create_app(sink, ServingClient(str(tmp_path))))) as client:
+            response = await client.get('/api/output/a1b2c3d4?filename=output.txt', headers={'Range': byte_range})
+            return response.status, response.headers.get('Content-Range'), await response.read()
+
+    with open(run_output, 'rb') as f:
+        contents = f.read()
+
+    assert asyncio.run(get_output('bytes=1-2')) == (206, f'bytes 1-2/{len(contents)}', contents[1:3])
+    assert asyncio.run(get_output('bytes=2-1')) == (200, None, contents)
+
+
+@pytest.fixture()
+def async_server_url(tmp_path):
+    """
+    This fixture runs the asyncio tracking server on a separate thread and produces its API url
+    """
+    pytest.importorskip('aiohttp')
+    import threading
+    from aiohttp import web
+    from observatory.asyncserver import create_app
+    from observatory.serving import ServingClient
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(Sink(str(tmp_path)), ServingClient(str(tmp_path))))
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{runner.addresses[0][1]}/api'
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+def test_remote_state_sends_compressed_packed_batches(tmp_path, async_server_url, monkeypatch, mocker):
+    from observatory.serving import ServingClient
+
+    monkeypatch.setattr(settings, 'server_url', async_server_url)
+    monkeypatch.setattr(settings, 'compression', 'gzip')
+    monkeypatch.setattr(settings, 'encoding', 'packed')
+    compress = mocker.spy(observatory.tracking, 'compress')
+
+    with TrackingSession('test-model', 1, 'default', 'a1b2c3d4-run', RemoteState()) as session:
+        session.record_array('loss', np.linspace(0, 1, 200), step=1)
+
+    run = ServingClient(str(tmp_path)).get_run('a1b2c3d4')
+
+    assert compress.call_count == 1
+    assert len(run['metrics']) == 200
+    assert run['metrics']['loss-199']['values'].tolist() == [1.0]
+    assert run['metrics']['loss-0']['steps'].tolist() == [1]
+
+
+def test_configure_backend_switches_local_sink(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr('observatory.settings.backend', settings.backend)
+    monkeypatch.setattr('observatory.tracking.sink', Sink(str(tmp_path / '.observatory')))
+    monkeypatch.setattr('observatory.tracking._sink_backend', settings.backend)
+
+    settings.configure(backend='sqlite')
+
+    with start_run('test', 1) as run:
+        run.record_metric('loss', 0.5)
+
+    assert isinstance(observatory.tracking.sink, SqliteSink)
+    observatory.tracking.sink.close()
+
+    recorded = ServingClient(str(tmp_path / '.observatory')).get_run(run.run_id[:8])
+    assert recorded['metrics']['loss']['values'].tolist() == [0.5]
+
+
+def test_configure_unknown_backend(monkeypatch):
+    monkeypatch.setattr('observatory.settings.backend', settings.backend)
+
+    with pytest.raises(AssertionError):
+        settings.configure(backend='unknown')